@@ -1,12 +1,241 @@
 import logging
-import json
-from langchain.chains import LLMChain
-from langchain_core.prompts import PromptTemplate
-from langchain.memory import ConversationBufferMemory
-from llm import get_llm
-from typing import Optional, Dict, List, Set
-from langchain_core.output_parsers import StrOutputParser
+import threading
+import asyncio
+import contextvars
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from llm import generate_samples, get_chat_model
+from answers import answers_equivalent
+from history import DebateHistory, count_tokens, record_prompt
+from tracing import span, tagged
+from typing import TYPE_CHECKING, NamedTuple, Optional, Dict, List, Sequence, Set, Tuple, Union
+import config
+
+# LangChain and pydantic are only imported once the first chain is built or evaluation parsed
+if TYPE_CHECKING:
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.runnables import Runnable
+    from evaluation import EvaluationResult
+
+class PromptSpec(NamedTuple):
+    """
+    A prompt as a static system message followed by a human message with the variables, turned into
+    a LangChain ChatPromptTemplate when its first chain is built. The system message is the same for
+    every call of a prompt kind, and the human message starts with the problem and ends with the
+    debate history, so consecutive calls share the longest possible prefix for the provider's or
+    vLLM's prefix cache.
+    """
+    input_variables: List[str]
+    system: str
+    template: str
+
+SOLVE_PROMPT = PromptSpec(
+    input_variables=["human_input", "chat_history", "capability"],
+    system="""You are a math assistant. Your task is to solve the given problem efficiently and clearly, at the proficiency level given with the problem.
 
+Instructions for response:
+1. Show only essential mathematical steps
+2. Skip explanatory text between steps
+3. Write each step in a single line
+4. End with a clear numerical answer prefixed with "Answer:"
+
+Focus on mathematical operations only. Do not include introductions, explanations, or conclusions.""",
+    template="""Current problem:
+{human_input}
+
+Proficiency level: {capability}/5
+
+Previous conversation:
+{chat_history}"""
+)
+
+MESSAGE_PROMPT = PromptSpec(
+    input_variables=["problem", "own_answer", "other_answer", "history", "capability"],
+    system="""You are a mathematical agent analyzing another solution, at the proficiency level given with the problem.
+
+Instructions for your response:
+1. Compare only the mathematical steps and results
+2. If solutions match, reply "Solutions mathematically equivalent" and stop
+3. If solutions differ:
+   - Point out the specific mathematical difference
+   - Show the correct calculation
+   - No explanations or justifications
+4. Use mathematical notation where possible
+
+Do not include:
+- Introductions or greetings
+- General feedback or suggestions
+- Explanatory text
+- Conclusions or sign-offs""",
+    template="""Problem: {problem}
+Proficiency level: {capability}/5
+Your solution: {own_answer}
+Their solution: {other_answer}
+Discussion history: {history}"""
+)
+
+REPLY_PROMPT = PromptSpec(
+    input_variables=["problem", "own_answer", "other_answer", "message", "history", "capability"],
+    system="""You are a mathematical agent reviewing another agent's solution, at the proficiency level given with the problem.
+
+Instructions for your response:
+1. Point out mathematical errors only if present
+2. If you agree, state "Agree" and stop
+3. If you disagree:
+   - State the specific mathematical error
+   - Provide the correct calculation in one line
+   - No explanatory text or justification
+4. Keep response under 50 words
+5. Focus only on mathematical accuracy, ignore all other aspects
+
+Do not use polite phrases, greetings, or conclusions.""",
+    template="""Problem: {problem}
+Proficiency level: {capability}/5
+Your solution: {own_answer}
+Their solution: {other_answer}
+Their message: {message}
+Discussion history: {history}"""
+)
+
+EVALUATION_PROMPT = PromptSpec(
+    input_variables=["problem", "current_answer", "history", "capability"],
+    system="""You are a mathematical agent reviewing solution updates, at the proficiency level given with the problem.
+
+Instructions:
+1. Compare mathematical equivalence only (e.g., 0.5 = 1/2 = 50% are equivalent)
+2. Assess if a new solution is mathematically different from current
+3. Return a JSON object with exactly these fields:
+   {{
+       "solution_changed": boolean,  // true only if mathematically different
+       "new_solution": "numerical answer only",
+       "confidence": integer 0-100,
+       "reasoning": "one-line mathematical explanation"
+   }}
+
+Requirements for the response:
+- No text outside the JSON object
+- Keep "reasoning" under 10 words
+- "new_solution" must be only numbers and mathematical operators
+- Do not include units or explanatory text in solutions""",
+    template="""Problem: {problem}
+Proficiency level: {capability}/5
+Current answer: {current_answer}
+Discussion history: {history}"""
+)
+
+EVALUATION_REPAIR_PROMPT = PromptSpec(
+    input_variables=["response"],
+    system="""You are repairing a malformed JSON evaluation.
+
+Instructions:
+1. Return the same evaluation as one JSON object with exactly these fields:
+   {{"solution_changed": boolean, "new_solution": "numerical answer only", "confidence": integer 0-100, "reasoning": "one-line explanation"}}
+2. No text outside the JSON object""",
+    template="""Malformed response:
+{response}"""
+)
+
+COMPARE_PROMPT = PromptSpec(
+    input_variables=["sol1", "sol2"],
+    system="""You are comparing two mathematical solutions for equivalence.
+
+Instructions:
+1. Check only mathematical equivalence (e.g., 0.5 = 1/2 = 50%)
+2. Ignore formatting and notation differences
+3. Answer only 'Yes' or 'No'
+4. No other text or explanation allowed""",
+    template="""Solutions to compare:
+1: {sol1}
+2: {sol2}"""
+)
+
+ASSESS_PROMPT = PromptSpec(
+    input_variables=["agent_answer", "correct_answer"],
+    system="""You are verifying mathematical equivalence between two answers.
+
+Instructions:
+1. Check only mathematical value equivalence
+2. Ignore differences in format/notation/units
+3. Answer only 'Yes' or 'No'
+4. No explanation or additional text allowed""",
+    template="""Answers to compare:
+Agent's answer: {agent_answer}
+Correct answer: {correct_answer}"""
+)
+
+PROMPTS = {
+    "solve": SOLVE_PROMPT,
+    "message": MESSAGE_PROMPT,
+    "reply": REPLY_PROMPT,
+    "evaluation": EVALUATION_PROMPT,
+    "evaluation_repair": EVALUATION_REPAIR_PROMPT,
+    "compare": COMPARE_PROMPT,
+    "assess": ASSESS_PROMPT,
+}
+
+# Prompts whose responses are JSON objects, sent in the API's JSON mode when EVALUATION_JSON_MODE is on
+JSON_PROMPTS = {"evaluation", "evaluation_repair"}
+
+# Chains are stateless, so one chain per (prompt, capability) is shared by every agent.
+_chain_lock = threading.Lock()
+_chains: Dict[Tuple[str, int], "Runnable"] = {}
+_prompt_templates: Dict[str, "ChatPromptTemplate"] = {}
+
+def get_prompt(kind: str) -> "ChatPromptTemplate":
+    """Returns the shared system + human ChatPromptTemplate of a prompt kind."""
+    prompt = _prompt_templates.get(kind)
+    if prompt is None:
+        from langchain_core.prompts import ChatPromptTemplate
+        prompt = ChatPromptTemplate.from_messages([("system", PROMPTS[kind].system), ("human", PROMPTS[kind].template)])
+        prompt = _prompt_templates.setdefault(kind, prompt)
+    return prompt
+
+def get_chain(kind: str, capability: int) -> "Runnable":
+    """Returns the shared `prompt | llm | parser` chain for a prompt kind and capability level."""
+    key = (kind, capability)
+    chain = _chains.get(key)
+    if chain is None:
+        with _chain_lock:
+            chain = _chains.get(key)
+            if chain is None:
+                from langchain_core.output_parsers import StrOutputParser
+                json_mode = config.EVALUATION_JSON_MODE and kind in JSON_PROMPTS
+                chain = get_prompt(kind) | get_chat_model(capability, json_mode=json_mode) | StrOutputParser()
+                _chains[key] = chain
+    return chain
+
+_template_tokens: Dict[str, int] = {}
+
+def _with_history(kind: str, inputs: Dict, history_key: str, history: Union[str, DebateHistory]) -> Dict:
+    """Renders a history into the inputs of a prompt and records the prompt's token count."""
+    if isinstance(history, DebateHistory):
+        inputs[history_key] = history.render()
+        history_tokens, unbounded_tokens = history.rendered_tokens, history.total_tokens
+    else:
+        inputs[history_key] = history
+        history_tokens = unbounded_tokens = count_tokens(history)
+    template_tokens = _template_tokens.get(kind)
+    if template_tokens is None:
+        template_tokens = _template_tokens[kind] = count_tokens(PROMPTS[kind].system) + count_tokens(PROMPTS[kind].template)
+    prompt_tokens = template_tokens + sum(count_tokens(str(value)) for key, value in inputs.items() if key != history_key)
+    record_prompt(kind, prompt_tokens + history_tokens, history_tokens, unbounded_tokens)
+    return inputs
+
+def new_debate_history() -> DebateHistory:
+    """An empty debate history with the policy and budget from config.py."""
+    return DebateHistory(policy=config.DEBATE_HISTORY_POLICY, max_turns=config.DEBATE_HISTORY_MAX_TURNS,
+                         token_budget=config.DEBATE_HISTORY_TOKEN_BUDGET)
+
+# Worker threads for evaluations that run alongside the calling thread within a debate round
+_evaluation_pool: Optional[ThreadPoolExecutor] = None
+
+def _get_evaluation_pool() -> ThreadPoolExecutor:
+    global _evaluation_pool
+    if _evaluation_pool is None:
+        with _chain_lock:
+            if _evaluation_pool is None:
+                _evaluation_pool = ThreadPoolExecutor(thread_name_prefix="evaluation")
+    return _evaluation_pool
 
 class Network:
     def __init__(self):
@@ -29,65 +258,289 @@ class Network:
     def get_neighbors(self, agent_id: str) -> Set[str]:
         return self.neighbors[agent_id]
 
-class Agent:
-    def __init__(self, agent_id: str, capability: int):
-        self.agent_id = agent_id
-        self.capability = capability
-        self.answer: Optional[str] = None
-        self.active = True
-        self.total_debate_rounds = 0
-        self.max_total_rounds = 10
-        self.confidence: float = 0.0
-        self.reasoning: str = ""
+class AgentStates:
+    """
+    State of a population of agents in parallel arrays, one slot per agent: answer id (into a table
+    of distinct answers), confidence, active flag, debate round counter and capability, plus the
+    reasoning and solve memory of each agent, which are only allocated once the agent talks.
+    Resetting the population is a handful of bulk array writes instead of a loop over agents.
+    """
+
+    __slots__ = ("capability", "answer_ids", "confidence", "active", "rounds", "reasoning", "memories",
+                 "_answers", "_answer_ids")
+
+    def __init__(self, capabilities: List[int]):
+        size = len(capabilities)
+        self.capability = array("b", capabilities)
+        self.answer_ids = array("l", [-1]) * size
+        self.confidence = array("d", [0.0]) * size
+        self.active = bytearray(b"\x01") * size
+        self.rounds = array("l", [0]) * size
+        self.reasoning: List[Optional[str]] = [None] * size
+        self.memories: List[Optional[DebateHistory]] = [None] * size
+        self._answers: List[str] = []
+        self._answer_ids: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.capability)
+
+    def get_answer(self, slot: int) -> Optional[str]:
+        answer_id = self.answer_ids[slot]
+        return self._answers[answer_id] if answer_id != -1 else None
+
+    def set_answer(self, slot: int, answer: Optional[str]) -> None:
+        if answer is None:
+            self.answer_ids[slot] = -1
+            return
+        answer_id = self._answer_ids.get(answer)
+        if answer_id is None:
+            answer_id = self._answer_ids[answer] = len(self._answers)
+            self._answers.append(answer)
+        self.answer_ids[slot] = answer_id
+
+    def clear_memories(self) -> None:
+        self.memories = [None] * len(self)
 
-        logging.info(f"Agent {self.agent_id} initialized with capability {self.capability}.")
+    def reset(self) -> None:
+        """Puts every agent back into its initial state."""
+        size = len(self)
+        self.answer_ids[:] = array("l", [-1]) * size
+        self.confidence[:] = array("d", [0.0]) * size
+        self.active[:] = b"\x01" * size
+        self.rounds[:] = array("l", [0]) * size
+        self.reasoning = [None] * size
+        self.clear_memories()
+        self._answers = []
+        self._answer_ids = {}
 
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            input_key="human_input",
-            output_key="ai_output",
-            return_messages=True
-        )
+class Agent:
+    """
+    The LLM-facing behavior of one agent. Its state lives in a slot of an AgentStates, shared with
+    the rest of the network's population; an agent created on its own gets a state of its own.
+    """
 
-        self.solve_prompt = PromptTemplate(
-            input_variables=["human_input", "chat_history", "capability"],
-            template="""You are a math assistant with proficiency level {capability}/5. Your task is to solve the given problem efficiently and clearly.
+    __slots__ = ("agent_id", "_states", "_slot", "_observer")
 
-Previous conversation:
-{chat_history}
+    max_total_rounds = 10
+    solve_prompt = SOLVE_PROMPT
 
-Current problem:
-{human_input}
-
-Instructions for response:
-1. Show only essential mathematical steps
-2. Skip explanatory text between steps
-3. Write each step in a single line
-4. End with a clear numerical answer prefixed with "Answer:"
-
-Focus on mathematical operations only. Do not include introductions, explanations, or conclusions."""
-        )
-
-        self.llm_chain = LLMChain(
-            llm=get_llm(self.capability),
-            prompt=self.solve_prompt,
-            memory=self.memory,
-            output_key="ai_output"
-        )
+    def __init__(self, agent_id: str, capability: int, states: Optional[AgentStates] = None, slot: int = 0):
+        self.agent_id = agent_id
+        if states is None:
+            states = AgentStates([capability])
+        self._states = states
+        self._slot = slot
+        self._observer = None  # Network notified of answer and activity changes
+
+        logging.debug(f"Agent {self.agent_id} initialized with capability {capability}.")
+
+    @property
+    def capability(self) -> int:
+        return self._states.capability[self._slot]
+
+    @property
+    def memory(self) -> DebateHistory:
+        memory = self._states.memories[self._slot]
+        if memory is None:
+            memory = self._states.memories[self._slot] = DebateHistory(
+                policy="window", max_turns=config.MEMORY_MAX_TURNS, token_budget=config.MEMORY_TOKEN_BUDGET)
+        return memory
+
+    def clear_memory(self) -> None:
+        """Forgets the agent's solve memory without allocating one."""
+        self._states.memories[self._slot] = None
+
+    @property
+    def answer(self) -> Optional[str]:
+        return self._states.get_answer(self._slot)
+
+    @answer.setter
+    def answer(self, value: Optional[str]) -> None:
+        old_value = self._states.get_answer(self._slot)
+        self._states.set_answer(self._slot, value)
+        if self._observer is not None and value != old_value:
+            self._observer.on_answer_change(self, old_value, value)
+
+    @property
+    def active(self) -> bool:
+        return bool(self._states.active[self._slot])
+
+    @active.setter
+    def active(self, value: bool) -> None:
+        old_value = bool(self._states.active[self._slot])
+        self._states.active[self._slot] = value
+        if self._observer is not None and value != old_value:
+            self._observer.on_active_change(self)
+
+    @property
+    def total_debate_rounds(self) -> int:
+        return self._states.rounds[self._slot]
+
+    @total_debate_rounds.setter
+    def total_debate_rounds(self, value: int) -> None:
+        self._states.rounds[self._slot] = value
+
+    @property
+    def confidence(self) -> float:
+        return self._states.confidence[self._slot]
+
+    @confidence.setter
+    def confidence(self, value: float) -> None:
+        self._states.confidence[self._slot] = value
+
+    @property
+    def reasoning(self) -> str:
+        return self._states.reasoning[self._slot] or ""
+
+    @reasoning.setter
+    def reasoning(self, value: str) -> None:
+        self._states.reasoning[self._slot] = value or None
 
     def solve(self, problem: str) -> str:
         """Solves the problem with proper input/output handling"""
-        result = self.llm_chain.invoke({
-            "human_input": problem,
-            "capability": self.capability
-        },verbose=False)
+        with span("solve", agent=self.agent_id, capability=self.capability):
+            inputs = _with_history("solve", {"human_input": problem, "capability": self.capability},
+                                   "chat_history", self.memory)
+            solution = get_chain("solve", self.capability).invoke(inputs, verbose=False)
+        return self.adopt_solution(problem, solution)
+
+    def solve_samples(self, problem: str, sample_indices: Sequence[int]) -> List[str]:
+        """
+        Samples solutions of the problem with the agent's current memory, as `solve` would under
+        `sampling(index)` for each index, but requested in one batch. The agent's answer and memory
+        are left unchanged.
+        """
+        with span("solve", agent=self.agent_id, capability=self.capability):
+            inputs = _with_history("solve", {"human_input": problem, "capability": self.capability},
+                                   "chat_history", self.memory)
+            solutions = generate_samples(self.capability, get_prompt("solve").invoke(inputs), sample_indices)
+        for index, solution in zip(sample_indices, solutions):
+            logging.info(f"Agent {self.agent_id} solution (sample {index}): {solution}")
+        return solutions
+
+    def adopt_solution(self, problem: str, solution: str) -> str:
+        """Takes a solution of the problem as the agent's own, as if `solve` had produced it."""
+        self.answer = solution
+        self.memory.add("Human", problem)
+        self.memory.add("AI", self.answer)
 
-        self.answer = result["ai_output"]
         logging.info(f"Agent {self.agent_id} solution: {self.answer}")
         return self.answer
 
-    def debate(self, other_agent: 'Agent', problem: str, max_rounds_per_pair: int, network: 'Network') -> bool:
-        """Debate with another agent. Returns True if consensus is reached, False otherwise."""
+    def debate(self, other_agent: 'Agent', problem: str, max_rounds_per_pair: int, network: 'Network',
+               parallel_evaluation: bool = False) -> bool:
+        """
+        Debate with another agent. Returns True if consensus is reached, False otherwise.
+        With parallel_evaluation, both agents' evaluations of a round are requested at the same time.
+        """
+        if not self._can_debate(other_agent):
+            return False
+
+        rounds = 0
+        conversation_history = new_debate_history()
+
+        while rounds < max_rounds_per_pair:
+            with tagged(pair=f"{self.agent_id}-{other_agent.agent_id}", round=rounds + 1), span("debate_round"):
+                logging.info(f"Debate round {rounds + 1} between Agent {self.agent_id} and Agent {other_agent.agent_id}.")
+
+                message_from_self = self.generate_message(
+                    problem=problem,
+                    other_agent_answer=other_agent.answer,
+                    conversation_history=conversation_history
+                )
+                logging.info(f"Agent {self.agent_id} to Agent {other_agent.agent_id}: {message_from_self}")
+                conversation_history.add(f"Agent {self.agent_id}", message_from_self)
+
+                message_from_other = other_agent.generate_reply(
+                    problem=problem,
+                    other_agent_answer=self.answer,
+                    message_from_other=message_from_self,
+                    conversation_history=conversation_history
+                )
+                logging.info(f"Agent {other_agent.agent_id} reply to Agent {self.agent_id}: {message_from_other}")
+                conversation_history.add(f"Agent {other_agent.agent_id}", message_from_other)
+
+                if parallel_evaluation:
+                    # Both evaluations only read the shared history, so they can run side by side;
+                    # results are applied in the sequential order
+                    context = contextvars.copy_context()
+                    other_future = _get_evaluation_pool().submit(
+                        context.run, other_agent.evaluate, problem, conversation_history)
+                    own_result = self.evaluate(problem, conversation_history)
+                    other_result = other_future.result()
+                    self._apply_evaluation(own_result, proposer=other_agent, network=network)
+                    other_agent._apply_evaluation(other_result, proposer=self, network=network)
+                else:
+                    self.update_solution(problem, conversation_history, proposer=other_agent, network=network)
+                    other_agent.update_solution(problem, conversation_history, proposer=self, network=network)
+
+                solutions_match = self._compare_solutions(self.answer, other_agent.answer)
+
+                if self._record_round(other_agent, solutions_match, rounds, network):
+                    return True
+
+                rounds += 1
+                if not self._advance_round(other_agent):
+                    break
+
+        self._resolve_without_consensus(other_agent)
+        return False
+
+    async def adebate(self, other_agent: 'Agent', problem: str, max_rounds_per_pair: int, network: 'Network',
+                      parallel_evaluation: bool = False) -> bool:
+        """Async version of `debate`, issuing every LLM call through `ainvoke`."""
+        if not self._can_debate(other_agent):
+            return False
+
+        rounds = 0
+        conversation_history = new_debate_history()
+
+        while rounds < max_rounds_per_pair:
+            with tagged(pair=f"{self.agent_id}-{other_agent.agent_id}", round=rounds + 1), span("debate_round"):
+                logging.info(f"Debate round {rounds + 1} between Agent {self.agent_id} and Agent {other_agent.agent_id}.")
+
+                message_from_self = await self.agenerate_message(
+                    problem=problem,
+                    other_agent_answer=other_agent.answer,
+                    conversation_history=conversation_history
+                )
+                logging.info(f"Agent {self.agent_id} to Agent {other_agent.agent_id}: {message_from_self}")
+                conversation_history.add(f"Agent {self.agent_id}", message_from_self)
+
+                message_from_other = await other_agent.agenerate_reply(
+                    problem=problem,
+                    other_agent_answer=self.answer,
+                    message_from_other=message_from_self,
+                    conversation_history=conversation_history
+                )
+                logging.info(f"Agent {other_agent.agent_id} reply to Agent {self.agent_id}: {message_from_other}")
+                conversation_history.add(f"Agent {other_agent.agent_id}", message_from_other)
+
+                if parallel_evaluation:
+                    own_result, other_result = await asyncio.gather(
+                        self.aevaluate(problem, conversation_history),
+                        other_agent.aevaluate(problem, conversation_history)
+                    )
+                    self._apply_evaluation(own_result, proposer=other_agent, network=network)
+                    other_agent._apply_evaluation(other_result, proposer=self, network=network)
+                else:
+                    await self.aupdate_solution(problem, conversation_history, proposer=other_agent, network=network)
+                    await other_agent.aupdate_solution(problem, conversation_history, proposer=self, network=network)
+
+                solutions_match = await self._acompare_solutions(self.answer, other_agent.answer)
+
+                if self._record_round(other_agent, solutions_match, rounds, network):
+                    return True
+
+                rounds += 1
+                if not self._advance_round(other_agent):
+                    break
+
+        self._resolve_without_consensus(other_agent)
+        return False
+
+    def _can_debate(self, other_agent: 'Agent') -> bool:
+        """Checks the preconditions shared by `debate` and `adebate`."""
         logging.info(f"Agent {self.agent_id} <===== debate =====> {other_agent.agent_id}.")
 
         if not self.active or not other_agent.active:
@@ -98,52 +551,33 @@ Focus on mathematical operations only. Do not include introductions, explanation
             logging.warning("One or both agents lack solutions. Debate cannot proceed.")
             return False
 
-        rounds = 0
-        conversation_history = ""
+        return True
 
-        while rounds < max_rounds_per_pair:
-            logging.info(f"Debate round {rounds + 1} between Agent {self.agent_id} and Agent {other_agent.agent_id}.")
-
-            message_from_self = self.generate_message(
-                problem=problem,
-                other_agent_answer=other_agent.answer,
-                conversation_history=conversation_history
-            )
-            logging.info(f"Agent {self.agent_id} to Agent {other_agent.agent_id}: {message_from_self}")
-            conversation_history += f"\nAgent {self.agent_id}: {message_from_self}"
-
-            message_from_other = other_agent.generate_reply(
-                problem=problem,
-                other_agent_answer=self.answer,
-                message_from_other=message_from_self,
-                conversation_history=conversation_history
-            )
-            logging.info(f"Agent {other_agent.agent_id} reply to Agent {self.agent_id}: {message_from_other}")
-            conversation_history += f"\nAgent {other_agent.agent_id}: {message_from_other}"
-
-            self.update_solution(problem, conversation_history, proposer=other_agent, network=network)
-            other_agent.update_solution(problem, conversation_history, proposer=self, network=network)
-
-            solutions_match = self._compare_solutions(self.answer, other_agent.answer)
-
-            if solutions_match:
-                logging.info(f"Agent {self.agent_id},{other_agent.agent_id} agree after {rounds + 1} rounds.")
-                network.update_agreement(self.agent_id, other_agent.agent_id, True)
-                return True
-            else:
-                network.update_agreement(self.agent_id, other_agent.agent_id, False)
-
-            rounds += 1
-            self.total_debate_rounds += 1
-            other_agent.total_debate_rounds += 1
-
-            self.check_active()
-            other_agent.check_active()
-
-            if not self.active or not other_agent.active:
-                logging.info("One or both agents became inactive during debate.")
-                break
+    def _record_round(self, other_agent: 'Agent', solutions_match: bool, rounds: int, network: 'Network') -> bool:
+        """Stores the outcome of a debate round. Returns True if the agents agree."""
+        if solutions_match:
+            logging.info(f"Agent {self.agent_id},{other_agent.agent_id} agree after {rounds + 1} rounds.")
+            network.update_agreement(self.agent_id, other_agent.agent_id, True)
+            return True
+
+        network.update_agreement(self.agent_id, other_agent.agent_id, False)
+        return False
+
+    def _advance_round(self, other_agent: 'Agent') -> bool:
+        """Counts a finished round for both agents. Returns False if either became inactive."""
+        self.total_debate_rounds += 1
+        other_agent.total_debate_rounds += 1
+
+        self.check_active()
+        other_agent.check_active()
 
+        if not self.active or not other_agent.active:
+            logging.info("One or both agents became inactive during debate.")
+            return False
+        return True
+
+    def _resolve_without_consensus(self, other_agent: 'Agent') -> None:
+        """Lets the more capable agent's solution prevail after a debate without consensus."""
         if self.capability > other_agent.capability:
             other_agent.answer = self.answer
             logging.info(f"No consensus reached. Agent {self.agent_id} solution prevails due to higher capability.")
@@ -153,135 +587,146 @@ Focus on mathematical operations only. Do not include introductions, explanation
         else:
             logging.info("No consensus reached. Equal capability agents maintain their solutions.")
 
-        return False
-
-    def generate_reply(self, problem: str, other_agent_answer: str, message_from_other: str,
-                       conversation_history: str) -> str:
-        """Generate a reply to another agent's message."""
-        reply_prompt = PromptTemplate(
-            input_variables=["problem", "own_answer", "other_answer", "message", "history", "capability"],
-            template="""You are a mathematical agent (Level {capability}/5) reviewing another agent's solution.
-
-Context:
-Problem: {problem}
-Your solution: {own_answer}
-Their solution: {other_answer}
-Their message: {message}
-Discussion history: {history}
-
-Instructions for your response:
-1. Point out mathematical errors only if present
-2. If you agree, state "Agree" and stop
-3. If you disagree:
-   - State the specific mathematical error
-   - Provide the correct calculation in one line
-   - No explanatory text or justification
-4. Keep response under 50 words
-5. Focus only on mathematical accuracy, ignore all other aspects
-
-Do not use polite phrases, greetings, or conclusions."""
-        )
-
-        reply_chain = reply_prompt | get_llm(self.capability) | StrOutputParser()
-        return reply_chain.invoke({
+    def _reply_inputs(self, problem: str, other_agent_answer: str, message_from_other: str,
+                      conversation_history: Union[str, DebateHistory]) -> Dict:
+        return _with_history("reply", {
             "problem": problem,
             "own_answer": self.answer,
             "other_answer": other_agent_answer,
             "message": message_from_other,
-            "history": conversation_history,
             "capability": self.capability
-        }, verbose=False)
-
-    def generate_message(self, problem: str, other_agent_answer: str, conversation_history: str) -> str:
-        """Generates a message to another agent."""
-        debate_prompt = PromptTemplate(
-            input_variables=["problem", "own_answer", "other_answer", "history", "capability"],
-            template="""You are a mathematical agent (Level {capability}/5) analyzing another solution.
-
-Context:
-Problem: {problem}
-Your solution: {own_answer}
-Their solution: {other_answer}
-Discussion history: {history}
-
-Instructions for your response:
-1. Compare only the mathematical steps and results
-2. If solutions match, reply "Solutions mathematically equivalent" and stop
-3. If solutions differ:
-   - Point out the specific mathematical difference
-   - Show the correct calculation
-   - No explanations or justifications
-4. Use mathematical notation where possible
-
-Do not include:
-- Introductions or greetings
-- General feedback or suggestions
-- Explanatory text
-- Conclusions or sign-offs"""
-        )
+        }, "history", conversation_history)
 
-        debate_chain = debate_prompt | get_llm(self.capability) | StrOutputParser()
-        return debate_chain.invoke({
+    def generate_reply(self, problem: str, other_agent_answer: str, message_from_other: str,
+                       conversation_history: Union[str, DebateHistory]) -> str:
+        """Generate a reply to another agent's message."""
+        reply_chain = get_chain("reply", self.capability)
+        with span("reply", agent=self.agent_id, capability=self.capability):
+            return reply_chain.invoke(
+                self._reply_inputs(problem, other_agent_answer, message_from_other, conversation_history),
+                verbose=False)
+
+    async def agenerate_reply(self, problem: str, other_agent_answer: str, message_from_other: str,
+                              conversation_history: Union[str, DebateHistory]) -> str:
+        """Async version of `generate_reply`."""
+        reply_chain = get_chain("reply", self.capability)
+        with span("reply", agent=self.agent_id, capability=self.capability):
+            return await reply_chain.ainvoke(
+                self._reply_inputs(problem, other_agent_answer, message_from_other, conversation_history))
+
+    def _message_inputs(self, problem: str, other_agent_answer: str,
+                        conversation_history: Union[str, DebateHistory]) -> Dict:
+        return _with_history("message", {
             "problem": problem,
             "own_answer": self.answer,
             "other_answer": other_agent_answer,
-            "history": conversation_history,
             "capability": self.capability
-        },verbose=False)
-
-    def update_solution(self, problem: str, conversation_history: str, proposer: 'Agent', network: 'Network') -> None:
-        """Updates the agent's solution based on the debate."""
-        evaluation_prompt = PromptTemplate(
-            input_variables=["problem", "current_answer", "history", "capability"],
-            template="""You are a mathematical agent (Level {capability}/5) reviewing solution updates.
-
-Context:
-Problem: {problem}
-Current answer: {current_answer}
-Discussion history: {history}
-
-Instructions:
-1. Compare mathematical equivalence only (e.g., 0.5 = 1/2 = 50% are equivalent)
-2. Assess if a new solution is mathematically different from current
-3. Return a JSON object with exactly these fields:
-   {{
-       "solution_changed": boolean,  // true only if mathematically different
-       "new_solution": "numerical answer only",
-       "confidence": integer 0-100,
-       "reasoning": "one-line mathematical explanation"
-   }}
+        }, "history", conversation_history)
 
-Requirements for the response:
-- No text outside the JSON object
-- Keep "reasoning" under 10 words
-- "new_solution" must be only numbers and mathematical operators
-- Do not include units or explanatory text in solutions"""
-        )
-
-        evaluation_chain = evaluation_prompt | get_llm(self.capability) | StrOutputParser()
-        evaluation_result = evaluation_chain.invoke({
+    def generate_message(self, problem: str, other_agent_answer: str,
+                         conversation_history: Union[str, DebateHistory]) -> str:
+        """Generates a message to another agent."""
+        debate_chain = get_chain("message", self.capability)
+        with span("message", agent=self.agent_id, capability=self.capability):
+            return debate_chain.invoke(
+                self._message_inputs(problem, other_agent_answer, conversation_history),
+                verbose=False)
+
+    async def agenerate_message(self, problem: str, other_agent_answer: str,
+                                conversation_history: Union[str, DebateHistory]) -> str:
+        """Async version of `generate_message`."""
+        debate_chain = get_chain("message", self.capability)
+        with span("message", agent=self.agent_id, capability=self.capability):
+            return await debate_chain.ainvoke(
+                self._message_inputs(problem, other_agent_answer, conversation_history))
+
+    def _evaluation_inputs(self, problem: str, conversation_history: Union[str, DebateHistory]) -> Dict:
+        return _with_history("evaluation", {
             "problem": problem,
             "current_answer": self.answer,
-            "history": conversation_history,
             "capability": self.capability
-        },verbose=False)
-
-        logging.info(f"Agent {self.agent_id} evaluation response: {evaluation_result}")
-
-        evaluation_data = json.loads(evaluation_result)
-        solution_changed = evaluation_data.get("solution_changed", False)
-        new_solution = evaluation_data.get("new_solution", self.answer)
+        }, "history", conversation_history)
+
+    def evaluate(self, problem: str, conversation_history: Union[str, DebateHistory]) -> Optional["EvaluationResult"]:
+        """
+        Asks the agent to evaluate its solution against the debate. Does not change any state.
+        A response that is not valid JSON even after local repair is sent back to the model once;
+        returns None if that fails too.
+        """
+        evaluation_chain = get_chain("evaluation", self.capability)
+        with span("evaluation", agent=self.agent_id, capability=self.capability):
+            response = evaluation_chain.invoke(
+                self._evaluation_inputs(problem, conversation_history),
+                verbose=False)
+            result = self._parse_evaluation(response)
+            if result is None:
+                retry = get_chain("evaluation_repair", self.capability).invoke({"response": response}, verbose=False)
+                result = self._parse_evaluation_retry(retry)
+        return result
+
+    async def aevaluate(self, problem: str,
+                        conversation_history: Union[str, DebateHistory]) -> Optional["EvaluationResult"]:
+        """Async version of `evaluate`."""
+        evaluation_chain = get_chain("evaluation", self.capability)
+        with span("evaluation", agent=self.agent_id, capability=self.capability):
+            response = await evaluation_chain.ainvoke(
+                self._evaluation_inputs(problem, conversation_history))
+            result = self._parse_evaluation(response)
+            if result is None:
+                retry = await get_chain("evaluation_repair", self.capability).ainvoke({"response": response})
+                result = self._parse_evaluation_retry(retry)
+        return result
+
+    def _parse_evaluation(self, response: str) -> Optional["EvaluationResult"]:
+        from evaluation import parse_evaluation, record_outcome
+        logging.info(f"Agent {self.agent_id} evaluation response: {response}")
+        result = parse_evaluation(response)
+        if result is None:
+            record_outcome("retried")
+            logging.info(f"Agent {self.agent_id} evaluation response is not valid JSON, asking for a repair.")
+        return result
+
+    def _parse_evaluation_retry(self, response: str) -> Optional["EvaluationResult"]:
+        from evaluation import parse_evaluation, record_outcome
+        result = parse_evaluation(response, count_outcome=False)
+        if result is None:
+            record_outcome("failed")
+            logging.warning(f"Agent {self.agent_id} evaluation is still invalid after a retry, "
+                            f"keeping its solution: {response}")
+        else:
+            record_outcome("recovered")
+        return result
 
-        if solution_changed:
-            self.answer = new_solution
-            self.confidence = float(evaluation_data.get("confidence", 0))
-            self.reasoning = evaluation_data.get("reasoning", "")
+    def update_solution(self, problem: str, conversation_history: Union[str, DebateHistory], proposer: 'Agent',
+                        network: 'Network') -> None:
+        """Updates the agent's solution based on the debate."""
+        evaluation_result = self.evaluate(problem, conversation_history)
+        self._apply_evaluation(evaluation_result, proposer, network)
+
+    async def aupdate_solution(self, problem: str, conversation_history: Union[str, DebateHistory],
+                               proposer: 'Agent', network: 'Network') -> None:
+        """Async version of `update_solution`."""
+        evaluation_result = await self.aevaluate(problem, conversation_history)
+        self._apply_evaluation(evaluation_result, proposer, network)
+
+    def _apply_evaluation(self, evaluation_result: Optional["EvaluationResult"], proposer: 'Agent',
+                          network: 'Network') -> None:
+        """Applies an evaluation to the agent's solution and the network's agreements."""
+        if evaluation_result is None:
+            logging.info(f"Solution not updated - Agent {self.agent_id} (invalid evaluation)")
+            return
+
+        if evaluation_result.solution_changed:
+            if evaluation_result.new_solution is not None:
+                self.answer = evaluation_result.new_solution
+            self.confidence = evaluation_result.confidence
+            self.reasoning = evaluation_result.reasoning
 
             logging.info(f"Solution updated - Agent {self.agent_id}: {self.answer}")
             logging.info(f"Update confidence: {self.confidence}")
             logging.info(f"Update reasoning: {self.reasoning}")
 
-            if evaluation_data.get("solution_changed", False):
+            if evaluation_result.solution_changed:
                 network.update_agreement(self.agent_id, proposer.agent_id, True)
                 neighbors = network.get_neighbors(self.agent_id)
                 for neighbor_id in neighbors:
@@ -289,7 +734,7 @@ Requirements for the response:
                         network.update_agreement(self.agent_id, neighbor_id, False)
         else:
             logging.info(f"Solution not updated - Agent {self.agent_id}")
-            self.reasoning = evaluation_data.get("reasoning", "")
+            self.reasoning = evaluation_result.reasoning
             logging.info(f"Reasoning: {self.reasoning}")
 
     def check_active(self) -> None:
@@ -300,63 +745,55 @@ Requirements for the response:
 
     def reset(self) -> None:
         """Resets the agent's memory and state to initial conditions."""
-        logging.info(f"Resetting Agent {self.agent_id}.")
-        self.memory.clear()
+        logging.debug(f"Resetting Agent {self.agent_id}.")
+        self.clear_memory()
         self.answer = None
         self.total_debate_rounds = 0
         self.active = True
         self.confidence = 0.0
         self.reasoning = ""
-        logging.info(f"Agent {self.agent_id} has been reset to initial state.")
 
     def _compare_solutions(self, solution1: str, solution2: str) -> bool:
-        """Compares solutions to check for equivalence."""
-        compare_prompt = PromptTemplate(
-            input_variables=["sol1", "sol2"],
-            template="""You are comparing two mathematical solutions for equivalence.
-
-Solutions to compare:
-1: {sol1}
-2: {sol2}
-
-Instructions:
-1. Check only mathematical equivalence (e.g., 0.5 = 1/2 = 50%)
-2. Ignore formatting and notation differences
-3. Answer only 'Yes' or 'No'
-4. No other text or explanation allowed"""
-        )
-
-        compare_chain = LLMChain(
-            llm=get_llm(self.capability),
-            prompt=compare_prompt
-        )
-
-        result = compare_chain.invoke({
-            "sol1": solution1,
-            "sol2": solution2
-        },verbose=False)
-        return "yes" in result["text"].lower()
+        """Compares solutions to check for equivalence, asking the LLM only if the local check is ambiguous."""
+        with span("compare", capability=self.capability) as compare_span:
+            local_result = answers_equivalent(solution1, solution2)
+            if local_result is not None:
+                compare_span.add("local_decisions")
+                return local_result
+
+            compare_chain = get_chain("compare", self.capability)
+            result = compare_chain.invoke({
+                "sol1": solution1,
+                "sol2": solution2
+            },verbose=False)
+            return _is_yes(result)
+
+    async def _acompare_solutions(self, solution1: str, solution2: str) -> bool:
+        """Async version of `_compare_solutions`."""
+        with span("compare", capability=self.capability) as compare_span:
+            local_result = answers_equivalent(solution1, solution2)
+            if local_result is not None:
+                compare_span.add("local_decisions")
+                return local_result
+
+            compare_chain = get_chain("compare", self.capability)
+            result = await compare_chain.ainvoke({
+                "sol1": solution1,
+                "sol2": solution2
+            })
+            return _is_yes(result)
+
+def _is_yes(response: str) -> bool:
+    """Parses a 'Yes'/'No' response, looking only at its first word."""
+    words = response.strip().strip("*\"'").split(None, 1)
+    return bool(words) and words[0].strip(".,:;!*\"'").lower() == "yes"
 
 def assess_correctness(agent: Agent, correct_answer: str) -> bool:
     """Assesses correctness of the agent's solution."""
-    assess_prompt = PromptTemplate(
-        input_variables=["agent_answer", "correct_answer"],
-        template="""You are verifying mathematical equivalence between two answers.
-
-Answers to compare:
-Agent's answer: {agent_answer}
-Correct answer: {correct_answer}
-
-Instructions:
-1. Check only mathematical value equivalence
-2. Ignore differences in format/notation/units
-3. Answer only 'Yes' or 'No'
-4. No explanation or additional text allowed"""
-    )
-
-    assess_chain = assess_prompt | get_llm(agent.capability) | StrOutputParser()
-    result = assess_chain.invoke({
-        "agent_answer": agent.answer,
-        "correct_answer": correct_answer
-    },verbose=False)
-    return "yes" in result.lower()
+    assess_chain = get_chain("assess", agent.capability)
+    with span("assess", agent=agent.agent_id, capability=agent.capability):
+        result = assess_chain.invoke({
+            "agent_answer": agent.answer,
+            "correct_answer": correct_answer
+        },verbose=False)
+    return _is_yes(result)
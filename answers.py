@@ -0,0 +1,321 @@
+# answers.py
+
+import ast
+import json
+import re
+import threading
+from collections import Counter
+from fractions import Fraction
+from typing import Dict, FrozenSet, Hashable, Optional, Sequence, Tuple
+
+_ANSWER_LINE = re.compile(r"answer\s*[:：]\s*(.+)", re.IGNORECASE)
+_NEW_SOLUTION = re.compile(r'"new_solution"\s*:\s*"?([^"\n}]*)"?', re.IGNORECASE)
+_GSM8K_ANSWER = re.compile(r"####\s*(.+)")
+_THOUSANDS = re.compile(r"(?<![\d.])(\d{1,3}(?:,\d{3})+)(?![\d])")
+_NUMBER = r"[-+]?(?:\d+(?:\.\d*)?|\.\d+)"
+_NUMERIC_WITH_UNIT = re.compile(
+    rf"^\s*[-+]?\$?\s*(?P<num>{_NUMBER})(?:\s*/\s*(?P<den>{_NUMBER}))?\s*(?P<pct>%|percent)?"
+    r"(?P<unit>\s+[a-zA-Z][a-zA-Z\s.]*|\s*[a-zA-Z]{2,}[a-zA-Z\s.]*)?\s*$",
+    re.IGNORECASE
+)
+# Words that make "2 pi" or "3 i" an expression rather than a number with a unit like "12 eggs"
+_MATH_WORDS = frozenset(("pi", "i", "e", "sqrt", "log", "ln", "sin", "cos", "tan"))
+# Powers in model output are only evaluated up to this result size, so "((10**64)**64)**64" cannot stall a run
+_MAX_RESULT_BITS = 4096
+_MATH_FUNCTION = re.compile(r"\b(?:sqrt|log|ln|sin|cos|tan)\s*\(", re.IGNORECASE)
+_LATEX_FRAC = re.compile(r"\\[dt]?frac\s*\{([^{}]*)\}\s*\{([^{}]*)\}")
+_LATEX_TEXT = re.compile(r"\\(?:text|mbox|mathrm)\s*\{[^{}]*\}")
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+# sympy takes about a second to import, so it is only loaded by the first symbolic comparison
+_sympy_lock = threading.Lock()
+_sympy = None
+_sympy_loaded = False
+
+def extract_boxed(text: str) -> Optional[str]:
+    """Returns the content of the last \\boxed{...} in the text, with nested braces preserved."""
+    start = max(text.rfind("\\boxed{"), text.rfind("\\fbox{"))
+    if start < 0:
+        return None
+    i = text.index("{", start) + 1
+    depth = 1
+    for j in range(i, len(text)):
+        if text[j] == "{":
+            depth += 1
+        elif text[j] == "}":
+            depth -= 1
+            if depth == 0:
+                return text[i:j].strip()
+    return None
+
+def extract_final_answer(text: Optional[str]) -> Optional[str]:
+    """
+    Extracts the final answer from a solution, evaluation response or dataset rationale.
+
+    Looks, in order, for a JSON `new_solution`, a \\boxed{} answer, a GSM8K `#### N` line and
+    the last `Answer:` line. Short texts without any of these are taken as the answer itself.
+
+    Args:
+        text (str): The solution text
+
+    Returns:
+        Optional[str]: The final answer, or None if there is none
+    """
+    if text is None:
+        return None
+    text = str(text).strip()
+    if not text:
+        return None
+
+    if '"new_solution"' in text:
+        try:
+            data = json.loads(text[text.index("{"):text.rindex("}") + 1])
+            return str(data["new_solution"]).strip()
+        except (ValueError, KeyError, TypeError):
+            match = _NEW_SOLUTION.search(text)
+            if match:
+                return match.group(1).strip()
+
+    boxed = extract_boxed(text)
+    if boxed is not None:
+        return boxed
+
+    match = _GSM8K_ANSWER.search(text)
+    if match:
+        return match.group(1).strip()
+
+    matches = _ANSWER_LINE.findall(text)
+    if matches:
+        return matches[-1].strip()
+
+    lines = [line for line in text.splitlines() if line.strip()]
+    return lines[-1].strip() if len(lines) == 1 else None
+
+def _strip_markup(answer: str) -> str:
+    """Removes LaTeX wrappers, currency signs, trailing punctuation and thousands separators."""
+    answer = answer.strip().strip("$").rstrip(".")
+    answer = _LATEX_TEXT.sub("", answer)
+    answer = _LATEX_FRAC.sub(r"(\1)/(\2)", answer)
+    for token in ("\\left", "\\right", "\\!", "\\,", "\\;", "\\$", "^\\circ", "^{\\circ}", "\\circ"):
+        answer = answer.replace(token, "")
+    answer = answer.replace("\\%", "%").replace("{,}", "").replace("\\cdot", "*").replace("\\times", "*")
+    answer = answer.replace("×", "*").replace("÷", "/").replace("−", "-")
+    answer = _THOUSANDS.sub(lambda m: m.group(1).replace(",", ""), answer)
+    # Keep only the right-hand side of "x = 5" style answers
+    if "=" in answer:
+        answer = answer.rsplit("=", 1)[1]
+    return answer.strip()
+
+def _eval_arithmetic(node: ast.AST) -> Fraction:
+    """Evaluates a parsed arithmetic expression exactly. Raises ValueError on anything else."""
+    if isinstance(node, ast.Expression):
+        return _eval_arithmetic(node.body)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return Fraction(str(node.value))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        value = _eval_arithmetic(node.operand)
+        return -value if isinstance(node.op, ast.USub) else value
+    if isinstance(node, ast.BinOp):
+        left, right = _eval_arithmetic(node.left), _eval_arithmetic(node.right)
+        if isinstance(node.op, ast.Add):
+            return left + right
+        if isinstance(node.op, ast.Sub):
+            return left - right
+        if isinstance(node.op, ast.Mult):
+            return left * right
+        if isinstance(node.op, ast.Div) and right != 0:
+            return left / right
+        if isinstance(node.op, ast.Pow) and right.denominator == 1 and abs(right) <= 64:
+            if _fraction_bits(left) * abs(int(right)) > _MAX_RESULT_BITS:
+                raise OverflowError("power too large to evaluate")
+            return left ** int(right)
+    raise ValueError("not a plain arithmetic expression")
+
+def _fraction_bits(value: Fraction) -> int:
+    return max(value.numerator.bit_length(), value.denominator.bit_length())
+
+def _is_math_unit(unit: str) -> bool:
+    """Whether the text after a number is part of an expression: a math word or a function call."""
+    tokens = unit.replace(".", " ").lower().split()
+    return any(token in _MATH_WORDS for token in tokens) or bool(_MATH_FUNCTION.search(unit))
+
+def _numeric_value(answer: Optional[str]) -> Optional[Tuple[Fraction, bool]]:
+    """Returns the exact value of a numeric answer as written and whether it is a percentage, or None."""
+    if answer is None:
+        return None
+    cleaned = _strip_markup(answer)
+
+    match = _NUMERIC_WITH_UNIT.match(cleaned)
+    if match and match.group("unit") and _is_math_unit(match.group("unit")):
+        match = None
+    if match:
+        value = Fraction(match.group("num"))
+        if match.group("den") is not None:
+            denominator = Fraction(match.group("den"))
+            if denominator == 0:
+                return None
+            value /= denominator
+        if cleaned.lstrip().startswith("-") and value > 0:
+            value = -value
+        return value, bool(match.group("pct"))
+
+    expression = cleaned.replace("^", "**").replace("{", "(").replace("}", ")")
+    percent = expression.endswith("%")
+    expression = expression.rstrip("%").strip()
+    if not expression or len(expression) > 200:
+        return None
+    try:
+        value = _eval_arithmetic(ast.parse(expression, mode="eval"))
+    except (SyntaxError, ValueError, ZeroDivisionError, OverflowError, RecursionError):
+        return None
+    return value, percent
+
+def numeric_values(answer: Optional[str]) -> Optional[FrozenSet[Fraction]]:
+    """
+    Returns the exact values an answer may denote, or None if it is not numeric.
+
+    Percentages denote both readings, so "50%" matches both "0.5" and "50".
+
+    Args:
+        answer (str): An extracted final answer
+
+    Returns:
+        Optional[FrozenSet[Fraction]]: The candidate values
+    """
+    parsed = _numeric_value(answer)
+    if parsed is None:
+        return None
+    value, percent = parsed
+    return frozenset((value, value / 100)) if percent else frozenset((value,))
+
+def _get_sympy():
+    """The sympy module, imported on first use, or None if it is not installed."""
+    global _sympy, _sympy_loaded
+    if not _sympy_loaded:
+        with _sympy_lock:
+            if not _sympy_loaded:
+                try:
+                    import sympy
+                    import sympy.parsing.sympy_parser
+                    _sympy = sympy
+                except ImportError:  # sympy is optional; without it non-numeric answers fall back to string comparison
+                    _sympy = None
+                _sympy_loaded = True
+    return _sympy
+
+def _expression_bits(sympy, expression) -> float:
+    """Upper estimate of the bits of the numbers an unevaluated sympy expression evaluates to."""
+    if expression.is_Rational:
+        return max(abs(expression.p).bit_length(), expression.q.bit_length())
+    if expression.is_Pow:
+        base, exponent = expression.args
+        if exponent.free_symbols:
+            return _expression_bits(sympy, base)
+        if _expression_bits(sympy, exponent) > 32:
+            return float("inf")
+        return _expression_bits(sympy, base) * max(1, abs(int(sympy.ceiling(abs(exponent)))))
+    return sum(_expression_bits(sympy, arg) for arg in expression.args) + 1
+
+def symbolic_equal(answer1: str, answer2: str) -> Optional[bool]:
+    """
+    Compares two expressions with sympy. Returns None if sympy is missing, cannot parse them, or
+    they contain powers too large to evaluate.
+    """
+    sympy = _get_sympy()
+    if sympy is None:
+        return None
+    parser = sympy.parsing.sympy_parser
+    transformations = parser.standard_transformations + (parser.implicit_multiplication_application,)
+    try:
+        expressions = []
+        for answer in (answer1, answer2):
+            cleaned = _strip_markup(answer).replace("\\sqrt", "sqrt").replace("\\pi", "pi")
+            cleaned = cleaned.replace("^", "**").replace("{", "(").replace("}", ")")
+            unevaluated = parser.parse_expr(cleaned, transformations=transformations, evaluate=False)
+            if _expression_bits(sympy, unevaluated) > _MAX_RESULT_BITS:
+                return None
+            expressions.append(parser.parse_expr(cleaned, transformations=transformations, evaluate=True))
+        return bool(sympy.simplify(expressions[0] - expressions[1]) == 0)
+    except Exception:
+        return None
+
+def normalize_answer(answer: str) -> str:
+    """Returns the answer without markup, whitespace or case, for exact text comparison."""
+    return re.sub(r"\s+", "", _strip_markup(answer)).lower()
+
+def answers_equivalent(solution1: Optional[str], solution2: Optional[str]) -> Optional[bool]:
+    """
+    Decides locally whether two solutions have the same final answer.
+
+    Args:
+        solution1 (str): First solution or answer
+        solution2 (str): Second solution or answer
+
+    Returns:
+        Optional[bool]: True or False when decided, None when the result is ambiguous
+    """
+    answer1, answer2 = extract_final_answer(solution1), extract_final_answer(solution2)
+    result = None
+    if answer1 is not None and answer2 is not None:
+        values1, values2 = numeric_values(answer1), numeric_values(answer2)
+        if values1 is not None and values2 is not None:
+            # Equal exactly when answer_key is; "50%" against "0.5" is left to the LLM
+            if _numeric_value(answer1)[0] == _numeric_value(answer2)[0]:
+                result = True
+            elif not values1 & values2:
+                result = False
+        elif normalize_answer(answer1) == normalize_answer(answer2):
+            result = True
+        else:
+            result = symbolic_equal(answer1, answer2)
+
+    with _stats_lock:
+        _stats["hits" if result is not None else "misses"] += 1
+    return result
+
+def answer_key(solution: Optional[str]) -> Optional[Hashable]:
+    """
+    Returns a hashable canonical form of a solution's final answer, or None if it has none.
+    Numeric answers map to their exact value as written ("50%" to 50), other answers to their
+    normalized text. Two answers have the same key exactly when answers_equivalent decides
+    them equal without sympy.
+    """
+    answer = extract_final_answer(solution)
+    if answer is None:
+        return None
+    parsed = _numeric_value(answer)
+    if parsed is not None:
+        return parsed[0]
+    return normalize_answer(answer)
+
+def majority_answer(solutions: Sequence[str]) -> str:
+    """
+    Self-consistency vote over sampled solutions of one problem.
+
+    Args:
+        solutions (Sequence[str]): The sampled solutions, at least one
+
+    Returns:
+        str: The first solution whose final answer is the most common one; ties go to the answer
+        sampled first, and solutions without a final answer do not vote
+    """
+    keys = [answer_key(solution) for solution in solutions]
+    votes = Counter(key for key in keys if key is not None)
+    if not votes:
+        return solutions[0]
+    winner = max(votes, key=lambda key: (votes[key], -keys.index(key)))
+    return solutions[keys.index(winner)]
+
+def get_equivalence_stats() -> Dict[str, float]:
+    """
+    Returns how often the local check decided equivalence (hits) or deferred to the LLM (misses).
+
+    Returns:
+        Dict[str, float]: 'hits', 'misses' and 'hit_ratio'
+    """
+    with _stats_lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_ratio": hits / total if total else 0.0}
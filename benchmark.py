@@ -0,0 +1,168 @@
+# benchmark.py
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import resource
+import sys
+import time
+from typing import Dict, List, Optional
+from debate import DEBATE_SCHEDULERS, agree_on_matching_answers, run_debates, run_debates_async, run_debates_prioritized
+from llm import set_llm_backend, tracking_calls
+from mock_llm import get_mock_stats, register_answer, reset_mock_stats
+from history import HISTORY_POLICIES, get_prompt_token_stats, reset_prompt_token_stats
+from evaluation import get_evaluation_stats, reset_evaluation_stats
+from network import Network
+from sweep import InitialSolvePlan
+from topology import GRAPH_GENERATORS, generate_graph
+from tracing import configure_tracing, get_tracer, report
+import config
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_benchmark(num_agents: int, degree: int, num_problems: int, seed: int,
+                  async_debates: bool = False, max_concurrency: int = None,
+                  cluster_answers: bool = config.PRE_DEBATE_CLUSTERING,
+                  topology: str = "watts_strogatz", compact: bool = False,
+                  batched_solves: bool = config.BATCHED_SOLVES, vote_samples: int = config.SOLVE_VOTE_SAMPLES,
+                  scheduler: str = config.DEBATE_SCHEDULER, max_passes: Optional[int] = config.MAX_DEBATE_PASSES) -> Dict:
+    """Runs initial solves and debates on a generated graph with the mock backend and reports their cost."""
+    graph_config = generate_graph(topology, num_agents, seed=seed, degree=degree)
+    # Every agent solves independently, as in a sweep over one graph with INDEPENDENT_SAMPLES_PER_TOPOLOGY
+    solve_plan = InitialSolvePlan({"benchmark": graph_config}, independent_samples=True,
+                                  batched=batched_solves, vote_samples=vote_samples)
+
+    start = time.perf_counter()
+    network = Network(graph_config, compact=compact)
+    build_time = time.perf_counter() - start
+
+    reset_mock_stats()
+    reset_prompt_token_stats()
+    reset_evaluation_stats()
+    solve_time = debate_time = 0.0
+    passes = rounds = disagreeing_edges = debate_requests = 0
+    settled = settled_debate_requests = 0
+    loop = asyncio.new_event_loop() if async_debates else None
+    with tracking_calls() as call_stats:
+        for problem_index in range(num_problems):
+            problem = f"Synthetic problem {seed}-{problem_index}: how many clips were sold?"
+            register_answer(problem, str(random.Random(f"{seed}-{problem_index}").randint(10, 999)))
+            network.reset()
+
+            start = time.perf_counter()
+            solve_plan.assign(network, "benchmark", {'id': problem_index, 'problem': problem})
+            network.states.clear_memories()
+            solve_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            requests_before = call_stats.calls
+            if cluster_answers:
+                agree_on_matching_answers(network)
+            if scheduler == "priority":
+                passes += run_debates_prioritized(network, problem, config.MAX_DEBATE_ROUNDS_PER_PAIR,
+                                                  max_passes=max_passes, cluster_answers=cluster_answers)
+            elif async_debates:
+                passes += loop.run_until_complete(run_debates_async(
+                    network, problem, config.MAX_DEBATE_ROUNDS_PER_PAIR, max_concurrency=max_concurrency,
+                    max_passes=max_passes))
+            else:
+                passes += run_debates(network, problem, config.MAX_DEBATE_ROUNDS_PER_PAIR, max_passes=max_passes)
+            debate_time += time.perf_counter() - start
+            debate_requests += call_stats.calls - requests_before
+
+            rounds += sum(agent.total_debate_rounds for agent in network.agents.values()) // 2
+            disagreeing_edges += network.disagreeing_edge_count()
+            # Only problems whose debates settled are comparable in cost across schedulers
+            if network.disagreeing_edge_count() == 0:
+                settled += 1
+                settled_debate_requests += call_stats.calls - requests_before
+    if loop is not None:
+        loop.close()
+
+    prompt_stats = get_prompt_token_stats()["total"]
+    evaluation_stats = get_evaluation_stats()
+    return {
+        "scheduler": scheduler,
+        "agents": num_agents,
+        "edges": len(graph_config['edges']),
+        "problems": num_problems,
+        "build_s": round(build_time, 3),
+        "solve_s": round(solve_time, 3),
+        "debate_s": round(debate_time, 3),
+        "llm_calls": get_mock_stats()["total"],
+        "llm_requests": call_stats.calls,
+        "debate_requests": debate_requests,
+        "prompt_tokens": prompt_stats["prompt_tokens"],
+        "history_tokens_saved": prompt_stats["saved_tokens"],
+        "evaluations_repaired": evaluation_stats["repaired"] + evaluation_stats["recovered"],
+        "evaluations_failed": evaluation_stats["failed"],
+        "settled": settled,
+        "unsettled": num_problems - settled,
+        "settled_debate_requests": settled_debate_requests,
+        "passes": passes,
+        "debate_rounds": rounds,
+        "disagreeing_edges": disagreeing_edges,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Synthetic-scale benchmark of the debate simulation on the mock LLM backend.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 50, 500], help="Numbers of agents, e.g. 5 50 500 2000 10000")
+    parser.add_argument("--topology", choices=GRAPH_GENERATORS, default="watts_strogatz")
+    parser.add_argument("--degree", type=int, default=4, help="Average number of neighbors per agent")
+    parser.add_argument("--compact", action="store_true", help="Array-backed adjacency and agreement store")
+    parser.add_argument("--problems", type=int, default=1, help="Problems per graph")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per LLM call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform jitter on the simulated latency")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of mock evaluations returned as malformed JSON")
+    parser.add_argument("--stochastic", action="store_true", help="Draw responses from a seeded stream instead of hashing prompts")
+    parser.add_argument("--schedulers", choices=DEBATE_SCHEDULERS, nargs="+", default=[config.DEBATE_SCHEDULER],
+                        help="Debate orders to compare on the same graphs and problems")
+    parser.add_argument("--max-passes", type=int, default=config.MAX_DEBATE_PASSES, help="Hard cap on debate passes per problem")
+    parser.add_argument("--async-debates", action="store_true", help="Use the concurrent debate scheduler")
+    parser.add_argument("--max-concurrency", type=int, default=config.MAX_CONCURRENT_DEBATES)
+    parser.add_argument("--unbatched-solves", action="store_true", help="Request every initial solve on its own")
+    parser.add_argument("--vote-samples", type=int, default=config.SOLVE_VOTE_SAMPLES,
+                        help="Samples per initial solve, reduced to their majority answer")
+    parser.add_argument("--no-clustering", action="store_true", help="Debate every edge, even between agents with matching answers")
+    parser.add_argument("--history-policy", choices=HISTORY_POLICIES, default=config.DEBATE_HISTORY_POLICY)
+    parser.add_argument("--history-turns", type=int, default=config.DEBATE_HISTORY_MAX_TURNS)
+    parser.add_argument("--history-budget", type=int, default=config.DEBATE_HISTORY_TOKEN_BUDGET,
+                        help="Token budget of the debate history in prompts (default: unbounded)")
+    parser.add_argument("--trace", action="store_true", help="Trace phases and LLM calls and print p50/p95 per graph size")
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per graph size")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s [%(levelname)s] %(message)s')
+    config.DEBATE_HISTORY_POLICY = args.history_policy
+    config.DEBATE_HISTORY_MAX_TURNS = args.history_turns
+    config.DEBATE_HISTORY_TOKEN_BUDGET = args.history_budget
+    configure_tracing(args.trace, max_spans=1_000_000)  # Opt-in, and large graphs need every span for their percentiles
+    set_llm_backend("mock", latency=args.latency, latency_jitter=args.jitter,
+                    stochastic=args.stochastic, seed=args.seed, malformed_rate=args.malformed_rate)
+
+    # Peak RSS only grows, so sizes run from small to large
+    for num_agents in sorted(args.sizes):
+        for scheduler in args.schedulers:
+            result = run_benchmark(num_agents, args.degree, args.problems, args.seed,
+                                   async_debates=args.async_debates, max_concurrency=args.max_concurrency,
+                                   cluster_answers=not args.no_clustering,
+                                   topology=args.topology, compact=args.compact,
+                                   batched_solves=not args.unbatched_solves, vote_samples=args.vote_samples,
+                                   scheduler=scheduler, max_passes=args.max_passes)
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print(" ".join(f"{key}={value}" for key, value in result.items()))
+            if args.trace:
+                print(report())
+                get_tracer().clear()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# cache.py
+
+import contextlib
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterator, Optional
+
+CACHE_MODES = ("off", "record", "replay-only")
+
+# Index of the sample a call belongs to, so that independent samples of one prompt get separate entries
+_sample_index: contextvars.ContextVar[int] = contextvars.ContextVar("sample_index", default=0)
+
+class CacheMissError(RuntimeError):
+    """Raised in replay-only mode when a response is not in the cache."""
+
+@contextlib.contextmanager
+def sampling(index: int) -> Iterator[None]:
+    """Tags the LLM calls made inside the block with a sample index."""
+    token = _sample_index.set(index)
+    try:
+        yield
+    finally:
+        _sample_index.reset(token)
+
+def current_sample_index() -> int:
+    return _sample_index.get()
+
+class ResponseCache:
+    """
+    Disk-backed, content-addressed cache of LLM responses with size-bounded LRU eviction.
+
+    Responses are keyed by a hash of (model, temperature, rendered prompt, sample index).
+    In 'record' mode hits are served from disk and misses are stored after the live call;
+    in 'replay-only' mode a miss raises CacheMissError instead of calling the API.
+    """
+
+    def __init__(self, path: str, mode: str = "record", max_bytes: int = 512 * 1024 * 1024):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Cache mode must be one of {CACHE_MODES}, got '{mode}'")
+        self.path = path
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.commit()
+        row = self._conn.execute("SELECT COALESCE(SUM(size), 0), COALESCE(MAX(last_used), 0) FROM responses").fetchone()
+        self._total_bytes, self._clock = row
+
+    @staticmethod
+    def make_key(model: str, temperature: float, prompt: str, sample_index: int = 0) -> str:
+        payload = json.dumps([model, temperature, prompt, sample_index], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Returns the cached response, or None on a miss. Raises CacheMissError on a miss in replay-only mode."""
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._clock += 1
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (self._clock, key))
+                self._conn.commit()
+        if row is None and self.mode == "replay-only":
+            raise CacheMissError(f"No cached response for key {key} in replay-only cache {self.path}")
+        return row[0] if row is not None else None
+
+    def store(self, key: str, response: str) -> None:
+        """Stores a response and evicts least recently used entries beyond the size bound."""
+        if self.mode != "record":
+            return
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._clock += 1
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, size, self._clock)
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_used LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._total_bytes -= size
+                self.evictions += 1
+                if self._total_bytes <= self.max_bytes:
+                    break
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": entries, "bytes": self._total_bytes}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+_response_cache: Optional[ResponseCache] = None
+
+def configure_response_cache(mode: str, path: str, max_bytes: int) -> Optional[ResponseCache]:
+    """
+    Sets up the process-wide response cache used by every LLM call.
+
+    Args:
+        mode (str): 'off', 'record' or 'replay-only'
+        path (str): Path of the SQLite cache file
+        max_bytes (int): Size bound for cached responses
+
+    Returns:
+        Optional[ResponseCache]: The cache, or None if caching is off
+    """
+    global _response_cache
+    if _response_cache is not None:
+        _response_cache.close()
+        _response_cache = None
+    if mode not in CACHE_MODES:
+        raise ValueError(f"Cache mode must be one of {CACHE_MODES}, got '{mode}'")
+    if mode != "off":
+        _response_cache = ResponseCache(path, mode=mode, max_bytes=max_bytes)
+        logging.info(f"Response cache '{path}' opened in {mode} mode.")
+    return _response_cache
+
+def get_response_cache() -> Optional[ResponseCache]:
+    return _response_cache
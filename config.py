@@ -81,4 +81,109 @@ GRAPH_CONFIGS = {
     },
 }
 
-MAX_DEBATE_ROUNDS_PER_PAIR = 3 
+# Generated graphs, run after GRAPH_CONFIGS: name -> topology.generate_graph arguments, e.g.
+# {'SmallWorld-1000': {'kind': 'watts_strogatz', 'num_agents': 1000, 'degree': 4, 'rewire': 0.1, 'seed': 0}}
+# Kinds: 'erdos_renyi', 'watts_strogatz', 'barabasi_albert', 'lattice', 'k_regular'
+GENERATED_GRAPHS = {}
+# Store each network's adjacency and agreements in arrays instead of networkx and dicts (large graphs)
+COMPACT_NETWORK = False
+
+MAX_DEBATE_ROUNDS_PER_PAIR = 3
+
+# Order of the debates in a pass: 'sequential' (agent order) or 'priority' (largest answer-cluster gap,
+# capability gap and confidence first, re-prioritized as answers change; always runs debates one at a time)
+DEBATE_SCHEDULER = 'sequential'
+# Hard cap on debate passes per problem
+MAX_DEBATE_PASSES = 20
+
+# Debate scheduling: run debates that share no agent concurrently through async LLM calls
+ASYNC_DEBATES = False
+MAX_CONCURRENT_DEBATES = 8
+
+# Request both agents' evaluations of a debate round at the same time
+PARALLEL_EVALUATIONS = True
+
+# Opt-in: grade answers the local scorer cannot decide with the LLM, as the original grading did for
+# every answer. Off, they are counted as incorrect and a warning gives their number
+LLM_GRADING_FALLBACK = False
+
+# Persistent LLM response cache: 'off', 'record' (serve hits, store misses) or 'replay-only' (fail on misses)
+RESPONSE_CACHE_MODE = 'off'
+RESPONSE_CACHE_PATH = 'cache/responses.sqlite'
+RESPONSE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Initial solves are shared by all graphs per (problem, capability, sample); set True to sample each graph independently
+INDEPENDENT_SAMPLES_PER_TOPOLOGY = False
+# Request the initial solves of a capability level together, as several samples (the API's n) of one call
+BATCHED_SOLVES = True
+# Self-consistency: each initial solution is the majority answer of this many samples (1 = no vote)
+SOLVE_VOTE_SAMPLES = 1
+
+# Mark edges whose agents' initial answers already match as agreed, so only disagreeing clusters debate
+PRE_DEBATE_CLUSTERING = True
+
+# Problems run in parallel per graph, each worker on its own Network: 'thread' for API-bound runs,
+# 'process' for the mock backend or CPU-heavy analysis
+PROBLEM_WORKERS = 1
+WORKER_POOL = 'thread'
+
+# Shared limiter per (endpoint, model): budgets (None = unlimited), AIMD in-flight window and retries
+RATE_LIMIT_REQUESTS_PER_MINUTE = None
+RATE_LIMIT_TOKENS_PER_MINUTE = None
+LLM_COMPLETION_TOKENS_ESTIMATE = 512  # Reserved per call on top of the prompt, settled with the actual usage
+INITIAL_IN_FLIGHT_REQUESTS = 8
+MAX_IN_FLIGHT_REQUESTS = 64
+LLM_LATENCY_TARGET = None  # Seconds; slower responses shrink the window
+LLM_REQUEST_TIMEOUT = 120
+LLM_MAX_RETRIES = 5
+LLM_BACKOFF_BASE = 1.0
+LLM_BACKOFF_MAX = 60.0
+
+# Endpoints per capability level, e.g. {3: ['http://gpu1:8000/v1', 'http://gpu2:8000/v1']}; levels not
+# listed use the comma-separated OPENAI_API_BASES, or OPENAI_API_BASE
+LLM_ENDPOINTS = {}
+LOAD_BALANCING = 'least_outstanding'  # or 'latency_weighted'
+ENDPOINT_EJECT_AFTER_FAILURES = 3
+ENDPOINT_EJECT_SECONDS = 10.0  # First wait before probing an ejected endpoint; doubles while it stays down
+ENDPOINT_PROBE_TIMEOUT = 5.0
+
+# Debate history sent to the message, reply and evaluation prompts: 'full', 'window' (last N turns) or
+# 'summary' (last N turns plus the final answers of earlier ones), under a token budget (None = unbounded).
+# 'full' without a budget sends the whole history, as the original prompts did; e.g. 2048 bounds it
+DEBATE_HISTORY_POLICY = 'full'
+DEBATE_HISTORY_MAX_TURNS = 4
+DEBATE_HISTORY_TOKEN_BUDGET = None
+# Agent memory shown to the solve prompt: last N turns under a token budget
+MEMORY_MAX_TURNS = 6
+MEMORY_TOKEN_BUDGET = 1024
+
+# Opt-in: request evaluations in the API's JSON mode (response_format json_object), for endpoints that
+# support it, such as OpenAI and vLLM. Invalid responses are repaired locally, then retried once, either way
+EVALUATION_JSON_MODE = False
+
+# Outcome of every (graph, problem), appended as each finishes; main.py --resume skips recorded pairs
+RESULTS_PATH = 'results/results.jsonl'
+
+# Work queue of distributed.py: workers lease (graph, problem, seed) units, renew the lease with heartbeats
+# while running them, and units whose lease expires are leased again, up to QUEUE_MAX_ATTEMPTS times
+QUEUE_PATH = 'queue/work.sqlite'
+QUEUE_LEASE_SECONDS = 300.0
+QUEUE_HEARTBEAT_SECONDS = 30.0
+QUEUE_MAX_ATTEMPTS = 3
+QUEUE_POLL_SECONDS = 2.0
+
+# Problems of a run: 'gsm8k' (a JSONL file) or 'math' (the dataset root). They are read through a packed
+# copy with an offset index, built next to the source on first use. With a seed, a reproducible sample
+# of NUM_PROBLEMS is drawn instead of taking the first ones
+DATASET_KIND = 'gsm8k'
+DATASET_PATH = 'dataset/gsm8k/train.jsonl'
+NUM_PROBLEMS = 1
+DATASET_SEED = None
+
+# Tracing: spans of every phase (solve, debate round, message, reply, evaluation, compare, assess) and LLM call
+TRACING = True
+# Spans kept in memory (a few MB). Once full, further spans are only counted as dropped, so p50/p95 cover
+# the start of the run; raise it for long sweeps
+TRACE_MAX_SPANS = 10_000
+TRACE_JSONL_PATH = None  # e.g. 'results/trace.jsonl', one span per line
+TRACE_PROMETHEUS_PATH = None  # e.g. 'results/metrics.prom', p50/p95 and counters in Prometheus text format
@@ -1,7 +1,62 @@
 # dataset_loader.py
 
+import itertools
 import json
-import os 
+import logging
+import mmap
+import os
+import random
+import struct
+import tempfile
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from answers import extract_boxed
+
+def gsm8k_final_answer(rationale: str) -> str:
+    """Returns the final answer after the '####' marker of a GSM8K rationale."""
+    return rationale.rsplit('####', 1)[-1].strip().replace(',', '')
+
+def math_final_answer(solution: str) -> str:
+    """Returns the last \\boxed{} answer of a MATH solution, or the whole solution if there is none."""
+    boxed = extract_boxed(solution)
+    return boxed if boxed is not None else solution.strip()
+
+def _in_shard(index: int, shard_index: int, num_shards: int) -> bool:
+    return index % num_shards == shard_index
+
+def _check_shard(shard_index: int, num_shards: int) -> None:
+    if num_shards < 1 or not 0 <= shard_index < num_shards:
+        raise ValueError(f"Shard must satisfy 0 <= shard_index < num_shards, got {shard_index} of {num_shards}")
+
+def _gsm8k_problem(problem_id: int, data: Dict) -> Dict:
+    return {
+        'id': problem_id,
+        'problem': data['question'],
+        'answer': data['answer'],
+        'final_answer': gsm8k_final_answer(data['answer']),
+    }
+
+def iter_gsm8k_dataset(file_path: str, shard_index: int = 0, num_shards: int = 1,
+                       start_offset: int = 0, start_id: int = 1) -> Iterator[Dict]:
+    """
+    Streams GSM8K problems from a JSONL file without loading the whole file.
+
+    Args:
+        file_path (str): Path to the dataset file (e.g., 'train.jsonl')
+        shard_index (int): Shard to yield, counted from 0
+        num_shards (int): Number of shards; problem i belongs to shard i % num_shards
+        start_offset (int): Byte offset of the line to start reading from
+        start_id (int): Id of the problem at `start_offset` (ids are 1-based line numbers)
+
+    Returns:
+        Iterator[Dict]: Problems with 'id', 'problem', 'answer' (full rationale) and 'final_answer' keys
+    """
+    _check_shard(shard_index, num_shards)
+    with open(file_path, 'rb') as f:
+        f.seek(start_offset)
+        for index, line in enumerate(f):
+            if _in_shard(index, shard_index, num_shards) and line.strip():
+                yield _gsm8k_problem(start_id + index, json.loads(line))
 
 def load_gsm8k_dataset(file_path, num_problems=None):
     """
@@ -12,20 +67,63 @@ def load_gsm8k_dataset(file_path, num_problems=None):
         num_problems (int, optional): Number of problems to load. If None, loads all.
 
     Returns:
-        List[Dict]: A list of problems with 'question' and 'answer' keys.
-    """
-    problems = []
-    with open(file_path, 'r', encoding='utf-8') as f:
-        for idx, line in enumerate(f):
-            if num_problems is not None and idx >= num_problems:
-                break
-            data = json.loads(line)
-            problems.append({
-                'id': idx + 1,
-                'problem': data['question'],
-                'answer': data['answer'],
-            })
-    return problems
+        List[Dict]: A list of problems with 'problem', 'answer' (full rationale) and 'final_answer' keys.
+    """
+    return list(itertools.islice(iter_gsm8k_dataset(file_path), num_problems))
+
+def _math_problem_files(dataset_path: str, category: Optional[str]) -> List[Tuple[str, str]]:
+    """(category, file path) of every problem, sorted by category and numeric problem id."""
+    if category:
+        categories = [category]
+    else:
+        categories = sorted(entry.name for entry in os.scandir(dataset_path) if entry.is_dir())
+    problem_files = []
+    for cat in categories:
+        category_path = os.path.join(dataset_path, cat)
+        if not os.path.isdir(category_path):
+            continue
+        names = [entry.name for entry in os.scandir(category_path) if entry.name.endswith('.json')]
+        names.sort(key=lambda name: (len(name), name))  # Numeric order of the '<id>.json' names
+        problem_files.extend((cat, os.path.join(category_path, name)) for name in names)
+    return problem_files
+
+def iter_math_dataset(path: str, train: bool = True, category: str = None,
+                      shard_index: int = 0, num_shards: int = 1) -> Iterator[Dict]:
+    """
+    Streams MATH problems in a fixed order: categories alphabetically, then problems by id.
+
+    Args:
+        path (str): Root path to the MATH dataset
+        train (bool): If True, reads the train set, else the test set
+        category (str, optional): Specific category to read (e.g., 'algebra'). If None, reads all categories
+        shard_index (int): Shard to yield, counted from 0
+        num_shards (int): Number of shards; problem i belongs to shard i % num_shards
+
+    Returns:
+        Iterator[Dict]: Problems with 'id', 'category', 'problem', 'answer' and 'final_answer' keys
+    """
+    _check_shard(shard_index, num_shards)
+    dataset_path = os.path.join(path, 'train' if train else 'test')
+    for index, (cat, file_path) in enumerate(_math_problem_files(dataset_path, category)):
+        if not _in_shard(index, shard_index, num_shards):
+            continue
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except json.JSONDecodeError as e:
+            logging.warning(f"Error loading problem file {file_path}: {e}")
+            continue
+        if 'problem' not in data or 'solution' not in data:
+            logging.warning(f"Error loading problem file {file_path}: missing 'problem' or 'solution'")
+            continue
+        yield {
+            # File names restart at 1 in every category, so the id carries the category
+            'id': f"{cat}/{os.path.splitext(os.path.basename(file_path))[0]}",
+            'category': cat,
+            'problem': data['problem'],
+            'answer': data['solution'],  # Using 'solution' as 'answer' to match GSM8K format
+            'final_answer': math_final_answer(data['solution'])
+        }
 
 def load_math_dataset(path: str, train: bool = True, category: str = None, num_problems: int = None):
     """
@@ -36,46 +134,183 @@ def load_math_dataset(path: str, train: bool = True, category: str = None, num_p
         category (str, optional): Specific category to load (e.g., 'algebra'). If None, loads all categories
         num_problems (int, optional): Number of problems to load. If None, loads all
     Returns:
-        List[Dict]: A list of problems with 'problem' and 'answer' keys (matching GSM8K format)
+        List[Dict]: A list of problems with 'problem', 'answer' and 'final_answer' keys (matching GSM8K format)
     """
-    problems = []
-    split = 'train' if train else 'test'
-    dataset_path = os.path.join(path, split)
+    return list(itertools.islice(iter_math_dataset(path, train, category), num_problems))
 
-    # Get categories to process
-    if category:
-        categories = [category]
+def _reservoir(items: Iterable, num_items: int, seed: int) -> List[Tuple[int, object]]:
+    """A seeded uniform sample of (index, item) in one pass (reservoir sampling), in stream order."""
+    rng = random.Random(seed)
+    reservoir: List[Tuple[int, object]] = []
+    for index, item in enumerate(items):
+        if index < num_items:
+            reservoir.append((index, item))
+        else:
+            slot = rng.randint(0, index)
+            if slot < num_items:
+                reservoir[slot] = (index, item)
+    reservoir.sort(key=lambda entry: entry[0])
+    return reservoir
+
+def sample_problems(problems: Iterable[Dict], num_problems: int, seed: int) -> List[Dict]:
+    """
+    Draws a seeded uniform sample from a stream of problems in one pass, so the same seed always
+    picks the same subset, whether the problems are streamed or packed. The sample keeps the order
+    of the stream.
+    """
+    return [problem for _, problem in _reservoir(problems, num_problems, seed)]
+
+_OFFSET = struct.Struct('<Q')
+
+class PackedDataset:
+    """
+    Problems packed into one JSONL file plus a table of line offsets ('<path>.idx', little-endian
+    uint64, one per problem and a final end offset). Both files are memory-mapped, so problem N is
+    read in O(1) without scanning, and worker processes share the pages through the OS cache.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as data_file, open(path + '.idx', 'rb') as index_file:
+            self._data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b''
+            self._index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._length = len(self._index) // _OFFSET.size - 1
+
+    def __len__(self) -> int:
+        return self._length
+
+    def offset(self, position: int) -> int:
+        """Byte offset of the problem at `position` in the packed file."""
+        return _OFFSET.unpack_from(self._index, position * _OFFSET.size)[0]
+
+    def __getitem__(self, position: int) -> Dict:
+        if position < 0:
+            position += self._length
+        if not 0 <= position < self._length:
+            raise IndexError(f"Problem {position} out of range for {self._length} problems")
+        return json.loads(self._data[self.offset(position):self.offset(position + 1)])
+
+    def __iter__(self) -> Iterator[Dict]:
+        for position in range(self._length):
+            yield self[position]
+
+    def shard(self, shard_index: int, num_shards: int) -> Iterator[Dict]:
+        """Problems of shard `shard_index` of `num_shards` (every num_shards-th problem)."""
+        _check_shard(shard_index, num_shards)
+        for position in range(shard_index, self._length, num_shards):
+            yield self[position]
+
+    def sample(self, num_problems: int, seed: int) -> List[Dict]:
+        """A seeded uniform sample of problems, in packed order: the sample_problems of the same stream."""
+        return [self[position] for position, _ in _reservoir(range(self._length), num_problems, seed)]
+
+    def close(self) -> None:
+        for mapped in (self._data, self._index):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+
+def pack_dataset(problems: Iterable[Dict], path: str) -> int:
+    """
+    Writes problems to a packed JSONL file and its offset table, replacing them atomically.
+
+    Returns:
+        int: Number of problems packed
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Unique temporary files, so processes packing the same dataset at once never write into each other's
+    data_fd, data_tmp = tempfile.mkstemp(dir=directory or '.', prefix=os.path.basename(path) + '.', suffix='.tmp')
+    index_fd, index_tmp = tempfile.mkstemp(dir=directory or '.', prefix=os.path.basename(path) + '.idx.', suffix='.tmp')
+    count = 0
+    try:
+        with open(data_fd, 'wb') as data_file, open(index_fd, 'wb') as index_file:
+            offset = 0
+            for problem in problems:
+                line = json.dumps(problem, ensure_ascii=False).encode('utf-8') + b'\n'
+                index_file.write(_OFFSET.pack(offset))
+                data_file.write(line)
+                offset += len(line)
+                count += 1
+            index_file.write(_OFFSET.pack(offset))
+        # The index is replaced last, so a packed file is never paired with a stale index
+        os.replace(data_tmp, path)
+        os.replace(index_tmp, path + '.idx')
+    except BaseException:
+        for tmp in (data_tmp, index_tmp):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        raise
+    return count
+
+def _source_mtime(source: str) -> float:
+    """Modification time of a file, or the latest of a directory tree's directories (files added or removed)."""
+    if os.path.isfile(source):
+        return os.path.getmtime(source)
+    mtime = os.path.getmtime(source)
+    for root, dirs, _ in os.walk(source):
+        for name in dirs:
+            mtime = max(mtime, os.path.getmtime(os.path.join(root, name)))
+    return mtime
+
+def open_packed_dataset(source: str, problems: Callable[[], Iterable[Dict]], packed_path: str = None) -> PackedDataset:
+    """
+    Opens the packed cache of a dataset, building it first if it is missing or older than the source.
+
+    Args:
+        source (str): Dataset file or directory the cache is built from
+        problems (Callable[[], Iterable[Dict]]): Streams the source's problems, e.g.
+            lambda: iter_math_dataset(path)
+        packed_path (str, optional): Path of the packed file; defaults to '<source>.packed.jsonl'
+
+    Returns:
+        PackedDataset: The packed dataset
+    """
+    packed_path = packed_path or source.rstrip(os.sep) + '.packed.jsonl'
+    index_path = packed_path + '.idx'
+    if not os.path.exists(index_path) or os.path.getmtime(index_path) < _source_mtime(source):
+        start = time.perf_counter()
+        count = pack_dataset(problems(), packed_path)
+        logging.info(f"Packed {count} problems from {source} into {packed_path} in {time.perf_counter() - start:.1f}s")
+    return PackedDataset(packed_path)
+
+def load_problems(source: str, kind: str = 'gsm8k', num_problems: Optional[int] = None, seed: Optional[int] = None,
+                  shard_index: int = 0, num_shards: int = 1, packed: bool = True, **options) -> List[Dict]:
+    """
+    Loads the problems of a run from a GSM8K file or the MATH root, through the packed cache by default.
+
+    Args:
+        source (str): GSM8K JSONL file, or root of the MATH dataset
+        kind (str): 'gsm8k' or 'math'
+        num_problems (int, optional): Number of problems over all shards; the first ones, or a seeded
+            sample if `seed` is set
+        seed (int, optional): Seed of the sample
+        shard_index (int): Shard of the problems to load, counted from 0
+        num_shards (int): Number of shards the selected problems are split into, round-robin
+        packed (bool): Whether to read through the packed cache
+        **options: Passed to the MATH loader (train, category)
+
+    Returns:
+        List[Dict]: The problems
+    """
+    if kind == 'gsm8k':
+        stream = lambda: iter_gsm8k_dataset(source)
+    elif kind == 'math':
+        stream = lambda: iter_math_dataset(source, **options)
     else:
-        categories = [d for d in os.listdir(dataset_path) 
-                     if os.path.isdir(os.path.join(dataset_path, d))]
+        raise ValueError(f"Dataset kind must be 'gsm8k' or 'math', got '{kind}'")
+    _check_shard(shard_index, num_shards)
 
-    # Process each category
-    for cat in categories:
-        category_path = os.path.join(dataset_path, cat)
-        if not os.path.isdir(category_path):
-            continue
+    if packed:
+        suffix = '' if kind == 'gsm8k' else f".{'train' if options.get('train', True) else 'test'}.{options.get('category') or 'all'}"
+        dataset = open_packed_dataset(source, stream, source.rstrip(os.sep) + suffix + '.packed.jsonl')
+        if seed is not None and num_problems is not None:
+            return dataset.sample(num_problems, seed)[shard_index::num_shards]
+        limit = len(dataset) if num_problems is None else min(num_problems, len(dataset))
+        return [dataset[position] for position in range(shard_index, limit, num_shards)]
 
-        # Process each problem file in the category
-        problem_files = [f for f in os.listdir(category_path) if f.endswith('.json')]
-        for problem_file in problem_files:
-            if num_problems is not None and len(problems) >= num_problems:
-                return problems
-
-            file_path = os.path.join(category_path, problem_file)
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
-                    # Extract problem ID from filename (remove .json extension)
-                    problem_id = os.path.splitext(problem_file)[0]
-                    
-                    problems.append({
-                        'id': int(problem_id),
-                        'problem': data['problem'],
-                        'answer': data['solution']  # Using 'solution' as 'answer' to match GSM8K format
-                    })
-            except (json.JSONDecodeError, KeyError) as e:
-                print(f"Error loading problem file {file_path}: {e}")
-                continue
-
-    return problems
\ No newline at end of file
+    if seed is not None and num_problems is not None:
+        problems = sample_problems(stream(), num_problems, seed)
+    else:
+        problems = list(itertools.islice(stream(), num_problems))
+    return problems[shard_index::num_shards]
@@ -1,18 +1,227 @@
+import asyncio
+import heapq
+import itertools
+import logging
 from network import Network
 from agent import Agent
+from typing import Dict, Hashable, List, Optional, Tuple
+
+DEBATE_SCHEDULERS = ("sequential", "priority")
+
+def agree_on_matching_answers(network: Network) -> int:
+    """
+    Marks every edge whose agents already have the same canonical final answer as agreed, so that
+    only edges between different answer clusters are debated.
+
+    Returns:
+        int: Number of edges marked as agreed
+    """
+    agreed = 0
+    for agent_id1, agent_id2 in list(network.agreement_status):
+        key = network.get_answer_key(agent_id1)
+        if key is not None and key == network.get_answer_key(agent_id2):
+            network.update_agreement(agent_id1, agent_id2, True)
+            agreed += 1
+    logging.info(f"{len(network.answer_clusters)} answer cluster(s); {agreed}/{len(network.agreement_status)} "
+                 f"edges agree before debating.")
+    return agreed
+
+def run_debates(network: Network, problem, max_rounds_per_pair, parallel_evaluation: bool = False,
+                max_passes: Optional[int] = None) -> int:
+    """
+    Runs debate passes over the network until a pass ends with every debate agreeing, or for at
+    most max_passes passes. Returns the number of passes.
+    """
+    settled = False
+    passes = 0
+    while not settled and (max_passes is None or passes < max_passes):
+        # Agents debate with their neighbors, visiting active, disagreeing pairs in order
+        settled = True
+        passes += 1
+        position = network.next_debate_pair()
+        while position is not None:
+            agent_id, neighbor_id = network.debate_pairs[position]
+            agent = network.get_agent(agent_id)
+            neighbor = network.get_agent(neighbor_id)
+            agree = agent.debate(neighbor, problem, max_rounds_per_pair, network,
+                                 parallel_evaluation=parallel_evaluation)
+            settled = settled and agree
+            # An agent that went inactive still owes its remaining disagreeing neighbors a debate
+            # attempt in this pass, and those attempts fail, so the pass is not settled
+            if not agent.active and network.has_disagreeing_neighbor_after(agent_id, position):
+                settled = False
+            position = network.next_debate_pair(position)
+    return passes
+
+def _pass_pairs(network: Network) -> List[Tuple]:
+    """(agent, neighbor) pairs in the order a sequential pass of `run_debates` visits them."""
+    return list(network.debate_pairs)
+
+def _next_wave(network: Network, pending: List[Tuple], turn_active: Dict) -> Tuple[List[Tuple], List[Tuple]]:
+    """
+    Picks the debates to run concurrently from the pending pairs of a pass.
+
+    A pair is scheduled only once every earlier pending pair that shares one of its agents has
+    finished, so each agent sees the same sequence of debates as in `run_debates`. Debates on
+    disjoint agents only ever mark each other's edges as disagreeing, so they commute and the
+    final agreement states match the sequential path. Pairs that `run_debates` would skip are
+    dropped here, once their agents are free.
+
+    Returns:
+        Tuple[List[Tuple], List[Tuple]]: The pairs to debate now and the pairs still pending
+    """
+    wave, remaining, busy = [], [], set()
+    for agent_id, neighbor_id in pending:
+        if agent_id in busy or neighbor_id in busy:
+            busy.update((agent_id, neighbor_id))
+            remaining.append((agent_id, neighbor_id))
+            continue
+
+        # run_debates checks `agent.active` once, before walking that agent's neighbors
+        if agent_id not in turn_active:
+            turn_active[agent_id] = network.get_agent(agent_id).active
+        neighbor = network.get_agent(neighbor_id)
+        if turn_active[agent_id] and neighbor.active and network.agents_disagree(agent_id, neighbor_id):
+            busy.update((agent_id, neighbor_id))
+            wave.append((agent_id, neighbor_id))
+    return wave, remaining
+
+async def run_debates_async(network: Network, problem, max_rounds_per_pair, max_concurrency: Optional[int] = None,
+                            parallel_evaluation: bool = False, max_passes: Optional[int] = None) -> int:
+    """
+    Runs the same debate passes as `run_debates`, but debates that share no agent run concurrently.
+    Returns the number of passes.
+
+    Args:
+        network (Network): The network whose agents debate
+        problem (str): The problem under debate
+        max_rounds_per_pair (int): Maximum rounds per debate
+        max_concurrency (int, optional): Maximum number of debates in flight. If None, no limit
+        parallel_evaluation (bool): Request both evaluations of a debate round at the same time
+        max_passes (int, optional): Maximum number of passes. If None, no limit
+    """
+    semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+    async def debate_pair(agent_id, neighbor_id) -> bool:
+        agent = network.get_agent(agent_id)
+        neighbor = network.get_agent(neighbor_id)
+        if semaphore is None:
+            return await agent.adebate(neighbor, problem, max_rounds_per_pair, network,
+                                       parallel_evaluation=parallel_evaluation)
+        async with semaphore:
+            return await agent.adebate(neighbor, problem, max_rounds_per_pair, network,
+                                       parallel_evaluation=parallel_evaluation)
 
-def run_debates(network: Network, problem, max_rounds_per_pair):
     settled = False
-    while not settled:
-        # Agents debate with their neighbors
+    passes = 0
+    while not settled and (max_passes is None or passes < max_passes):
         settled = True
-        for agent_id, agent in network.agents.items():
-            if agent.active:
-                neighbors = network.get_neighbors(agent_id)
-                for neighbor_id in neighbors:
-                    neighbor = network.get_agent(neighbor_id)
-                    # Proceed if neighbor is active and they disagree
-                    if neighbor.active and network.agents_disagree(agent_id, neighbor_id):
-                        agree = agent.debate(neighbor, problem, max_rounds_per_pair, network)
-                        settled = settled and agree
-                agent.check_active()
+        passes += 1
+        pending = _pass_pairs(network)
+        turn_active = {}
+        while pending:
+            wave, pending = _next_wave(network, pending, turn_active)
+            results = await asyncio.gather(*(debate_pair(agent_id, neighbor_id) for agent_id, neighbor_id in wave))
+            settled = settled and all(results)
+        for agent in network.agents.values():
+            agent.check_active()
+    return passes
+
+def _standing(network: Network, agent_id: Hashable) -> Tuple[int, int, float]:
+    """How strongly an agent's answer is held: the size of its answer cluster, its capability and its confidence."""
+    agent = network.get_agent(agent_id)
+    return network.answer_clusters.get(network.get_answer_key(agent_id), 0), agent.capability, agent.confidence
+
+def debate_priority(network: Network, agent_id1: Hashable, agent_id2: Hashable) -> Tuple[float, ...]:
+    """
+    Priority of debating an edge; larger debates first. Debates where a large answer cluster meets a
+    small one come first, since the losing side tends to adopt the majority answer and the cluster
+    grows; then those with the largest capability gap, then those with the most confident agent.
+    Edges whose agents already hold the same answer come last.
+    """
+    key1, key2 = network.get_answer_key(agent_id1), network.get_answer_key(agent_id2)
+    if key1 is not None and key1 == key2:
+        return (-1.0,)
+    standing1, standing2 = _standing(network, agent_id1), _standing(network, agent_id2)
+    return (max(standing1[0], standing2[0]) - min(standing1[0], standing2[0]),
+            abs(standing1[1] - standing2[1]),
+            max(standing1[2], standing2[2]))
+
+def _agreeing_neighbors(network: Network, agent_id) -> List:
+    """Active neighbors of an agent that agree with it."""
+    return [neighbor_id for neighbor_id in network.get_neighbors(agent_id)
+            if network.get_agent(neighbor_id).active and not network.agents_disagree(agent_id, neighbor_id)]
+
+def run_debates_prioritized(network: Network, problem, max_rounds_per_pair, parallel_evaluation: bool = False,
+                            max_passes: Optional[int] = None, cluster_answers: bool = False) -> int:
+    """
+    Runs debate passes over the network, debating the active, disagreeing edges of each pass in
+    order of `debate_priority` instead of agent order. When a debate changes an answer, the edges of
+    that agent are re-queued with fresh priorities, and a queued edge whose priority has dropped
+    below the next one in the queue is moved back. Each edge is debated at most once per pass, and an
+    answer change that breaks one of the agent's agreements counts as a debate round towards
+    `Agent.check_active`, so edges cannot reopen each other forever. Passes repeat while disagreeing edges remain, for at most max_passes passes.
+
+    Args:
+        network (Network): The network whose agents debate
+        problem (str): The problem under debate
+        max_rounds_per_pair (int): Maximum rounds per debate
+        parallel_evaluation (bool): Request both evaluations of a debate round at the same time
+        max_passes (int, optional): Maximum number of passes. If None, no limit
+        cluster_answers (bool): Mark an edge as agreed instead of debating it once both of its agents
+            hold the same answer, as `agree_on_matching_answers` does before the debates
+
+    Returns:
+        int: The number of passes
+    """
+    passes = 0
+    sequence = itertools.count()
+    while network.next_debate_pair() is not None and (max_passes is None or passes < max_passes):
+        passes += 1
+        queue: List[Tuple] = []
+        debated = set()
+
+        def enqueue(agent_id1, agent_id2):
+            priority = tuple(-value for value in debate_priority(network, agent_id1, agent_id2))
+            heapq.heappush(queue, (priority, next(sequence), agent_id1, agent_id2))
+
+        for agent_id1, agent_id2 in network.candidate_edges():
+            enqueue(agent_id1, agent_id2)
+        while queue:
+            queued_priority, _, agent_id1, agent_id2 = heapq.heappop(queue)
+            edge = frozenset((agent_id1, agent_id2))
+            if (edge in debated or not network.agents_disagree(agent_id1, agent_id2)
+                    or not (network.get_agent(agent_id1).active and network.get_agent(agent_id2).active)):
+                continue
+            key1 = network.get_answer_key(agent_id1)
+            if cluster_answers and key1 is not None and key1 == network.get_answer_key(agent_id2):
+                network.update_agreement(agent_id1, agent_id2, True)
+                continue
+            priority = tuple(-value for value in debate_priority(network, agent_id1, agent_id2))
+            if priority > queued_priority and queue and priority > queue[0][0]:
+                heapq.heappush(queue, (priority, next(sequence), agent_id1, agent_id2))
+                continue
+
+            # The agent holding its answer more strongly opens the debate
+            if _standing(network, agent_id2) > _standing(network, agent_id1):
+                agent_id1, agent_id2 = agent_id2, agent_id1
+            debated.add(edge)
+            keys_before = (network.get_answer_key(agent_id1), network.get_answer_key(agent_id2))
+            agreeing_before = (_agreeing_neighbors(network, agent_id1), _agreeing_neighbors(network, agent_id2))
+            network.get_agent(agent_id1).debate(network.get_agent(agent_id2), problem, max_rounds_per_pair, network,
+                                                parallel_evaluation=parallel_evaluation)
+            for agent_id, key_before, agreeing in zip((agent_id1, agent_id2), keys_before, agreeing_before):
+                if network.get_answer_key(agent_id) != key_before:
+                    # An answer change that breaks an earlier agreement counts as a debate round, so an
+                    # agent pulled back and forth between two neighbors eventually becomes inactive
+                    if any(network.agents_disagree(agent_id, neighbor_id) for neighbor_id in agreeing):
+                        agent = network.get_agent(agent_id)
+                        agent.total_debate_rounds += 1
+                        agent.check_active()
+                    for neighbor_id in network.disagreeing_neighbors(agent_id):
+                        if frozenset((agent_id, neighbor_id)) not in debated:
+                            enqueue(agent_id, neighbor_id)
+        logging.info(f"Debate pass {passes}: {len(debated)} debate(s), "
+                     f"{network.disagreeing_edge_count()} disagreeing edge(s) left.")
+    return passes
+
@@ -0,0 +1,384 @@
+# distributed.py
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+from cache import configure_response_cache
+from dataset_loader import load_problems
+from results_store import open_results_store
+from runner import ProblemRunner
+from sweep import InitialSolvePlan
+from topology import build_graph_configs
+from tracing import configure_tracing
+import config
+
+UNIT_STATUSES = ("pending", "leased", "done", "failed")
+
+class WorkUnit(NamedTuple):
+    """One (graph, problem, seed) run, as leased by a worker."""
+    unit_id: int
+    graph: str
+    problem: Dict
+    seed: int
+    attempts: int
+
+class WorkQueue:
+    """
+    Durable queue of (graph, problem, seed) units in SQLite, shared by a coordinator and any number
+    of worker processes on hosts that can open the file: one machine, or a network filesystem with
+    working POSIX locks (e.g. NFS with lockd; not SMB or most FUSE mounts). The queue uses SQLite's
+    rollback journal, because WAL mode needs shared memory and only works on a single host. The graph
+    configurations travel with the queue, so workers do not depend on their own config.py for them.
+
+    A worker leases a unit for lease_seconds and renews the lease with heartbeats while it runs it.
+    Units whose lease expired, because their worker died or hung, are leased to the next worker
+    that asks. A unit is given up as failed once it has been leased max_attempts times without
+    completing. Lease expiry compares wall clocks, so hosts need synchronized clocks.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = config.QUEUE_LEASE_SECONDS,
+                 max_attempts: int = config.QUEUE_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit mode, so leases can take the write lock up front with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=DELETE")  # Not WAL: its shared-memory index does not span hosts
+        self._conn.execute("CREATE TABLE IF NOT EXISTS graphs (name TEXT PRIMARY KEY, config TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS units ("
+            "id INTEGER PRIMARY KEY, graph TEXT NOT NULL, problem_id TEXT NOT NULL, seed INTEGER NOT NULL, "
+            "problem TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+            "worker TEXT, lease_expires REAL, error TEXT, result TEXT, UNIQUE (graph, problem_id, seed))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS units_status ON units (status, lease_expires)")
+
+    def enqueue(self, graph_configs: Dict[str, Dict], problems: Sequence[Dict], seeds: Iterable[int] = (0,)) -> int:
+        """
+        Adds a unit for every (graph, problem, seed). Units already in the queue are kept as they are,
+        so a coordinator can be restarted on the same queue.
+
+        Returns:
+            int: Number of units added
+        """
+        seeds = list(seeds)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for graph_name, graph_config in graph_configs.items():
+                    self._conn.execute("INSERT OR REPLACE INTO graphs (name, config) VALUES (?, ?)",
+                                       (graph_name, json.dumps(graph_config)))
+                before = self._conn.total_changes
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO units (graph, problem_id, seed, problem) VALUES (?, ?, ?, ?)",
+                    ((graph_name, json.dumps(problem_data['id']), seed, json.dumps(problem_data, ensure_ascii=False))
+                     for seed in seeds for graph_name in graph_configs for problem_data in problems)
+                )
+                added = self._conn.total_changes - before
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return added
+
+    def graph_configs(self) -> Dict[str, Dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT name, config FROM graphs").fetchall()
+        return {name: json.loads(graph_config) for name, graph_config in rows}
+
+    def lease(self, worker_id: str) -> Optional[WorkUnit]:
+        """Leases the oldest pending unit, or one whose lease expired, to a worker; None if there is none."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                self._conn.execute(
+                    "UPDATE units SET status = 'failed', error = COALESCE(error, 'Lease expired'), lease_expires = NULL "
+                    "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?", (now, self.max_attempts))
+                row = self._conn.execute(
+                    "SELECT id, graph, problem, seed, attempts, status, worker FROM units "
+                    "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) ORDER BY id LIMIT 1",
+                    (now,)).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE units SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                        "WHERE id = ?", (worker_id, now + self.lease_seconds, row[0]))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        unit_id, graph_name, problem, seed, attempts, status, previous_worker = row
+        if status == "leased":
+            logging.warning(f"Lease of unit {unit_id} held by {previous_worker} expired; re-leasing it to {worker_id}")
+        return WorkUnit(unit_id, graph_name, json.loads(problem), seed, attempts + 1)
+
+    def heartbeat(self, unit_id: int, worker_id: str) -> bool:
+        """Renews a worker's lease on a unit. Returns False if the worker no longer holds it."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE units SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (time.time() + self.lease_seconds, unit_id, worker_id))
+        return cursor.rowcount == 1
+
+    def complete(self, unit_id: int, worker_id: str, record: Dict) -> bool:
+        """
+        Stores the outcome record of a unit. The first result wins: a worker whose lease expired
+        may still complete the unit, unless the worker it was re-leased to finished first.
+
+        Returns:
+            bool: Whether the record was stored
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE units SET status = 'done', worker = ?, lease_expires = NULL, result = ? "
+                "WHERE id = ? AND status != 'done'", (worker_id, json.dumps(record, ensure_ascii=False), unit_id))
+        return cursor.rowcount == 1
+
+    def fail(self, unit_id: int, worker_id: str, error: str) -> None:
+        """Returns a unit the worker failed to run to the queue, or gives it up after max_attempts leases."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE units SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "lease_expires = NULL, error = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (self.max_attempts, error, unit_id, worker_id))
+
+    def counts(self) -> Dict[str, int]:
+        """Number of units per status."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM units GROUP BY status").fetchall()
+        counts = dict.fromkeys(UNIT_STATUSES, 0)
+        counts.update(rows)
+        return counts
+
+    def finished(self) -> bool:
+        """Whether no unit is pending or leased."""
+        counts = self.counts()
+        return counts["pending"] == 0 and counts["leased"] == 0
+
+    def results(self) -> Iterator[Dict]:
+        """Outcome records of the completed units, in queue order."""
+        with self._lock:
+            rows = self._conn.execute("SELECT result FROM units WHERE status = 'done' ORDER BY id").fetchall()
+        for (result,) in rows:
+            yield json.loads(result)
+
+    def failures(self) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT graph, problem_id, seed, attempts, error FROM units "
+                                      "WHERE status = 'failed' ORDER BY id").fetchall()
+        return [{"graph": graph_name, "problem_id": json.loads(problem_id), "seed": seed, "attempts": attempts,
+                 "error": error} for graph_name, problem_id, seed, attempts, error in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class _Heartbeat(threading.Thread):
+    """Renews a worker's lease on a unit in the background while the unit runs."""
+
+    def __init__(self, queue: WorkQueue, unit_id: int, worker_id: str, interval: float):
+        super().__init__(name=f"heartbeat-{unit_id}", daemon=True)
+        self.queue = queue
+        self.unit_id = unit_id
+        self.worker_id = worker_id
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            if not self.queue.heartbeat(self.unit_id, self.worker_id):
+                logging.warning(f"Worker {self.worker_id} lost its lease on unit {self.unit_id}")
+                return
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def run_worker(queue_path: str, worker_id: Optional[str] = None, max_units: Optional[int] = None,
+               poll_seconds: float = config.QUEUE_POLL_SECONDS,
+               heartbeat_seconds: float = config.QUEUE_HEARTBEAT_SECONDS) -> int:
+    """
+    Leases units from the queue and runs them until the queue is finished.
+
+    Each graph gets one ProblemRunner, and one solve plan is shared by all graphs, as in main.py,
+    so initial solves are shared between the units of a problem that this worker runs.
+
+    Args:
+        queue_path (str): Path of the queue's SQLite file
+        worker_id (Optional[str]): Name of the worker in leases; host and process id by default
+        max_units (Optional[int]): Stop after this many units
+        poll_seconds (float): Wait before asking again while every remaining unit is leased
+        heartbeat_seconds (float): Interval of lease renewals
+
+    Returns:
+        int: Number of units completed
+    """
+    worker_id = worker_id or default_worker_id()
+    configure_tracing(config.TRACING, config.TRACE_MAX_SPANS)
+    configure_response_cache(config.RESPONSE_CACHE_MODE, config.RESPONSE_CACHE_PATH, config.RESPONSE_CACHE_MAX_BYTES)
+    queue = WorkQueue(queue_path)
+    graph_configs: Dict[str, Dict] = {}
+    solve_plan: Optional[InitialSolvePlan] = None
+    runners: Dict[str, ProblemRunner] = {}
+    completed = 0
+    try:
+        while max_units is None or completed < max_units:
+            unit = queue.lease(worker_id)
+            if unit is None:
+                if queue.finished():
+                    break
+                time.sleep(poll_seconds)
+                continue
+
+            if unit.graph not in graph_configs:
+                # Graphs were added since this worker started; plan the solves again
+                for runner in runners.values():
+                    runner.close()
+                runners.clear()
+                graph_configs = queue.graph_configs()
+                solve_plan = InitialSolvePlan(graph_configs, independent_samples=config.INDEPENDENT_SAMPLES_PER_TOPOLOGY,
+                                              batched=config.BATCHED_SOLVES, vote_samples=config.SOLVE_VOTE_SAMPLES)
+            runner = runners.get(unit.graph)
+            if runner is None:
+                runner = runners[unit.graph] = ProblemRunner(unit.graph, graph_configs[unit.graph], solve_plan,
+                                                             config.ASYNC_DEBATES)
+
+            logging.info(f"Worker {worker_id} running unit {unit.unit_id}: graph '{unit.graph}', "
+                         f"problem {unit.problem['id']}, seed {unit.seed} (attempt {unit.attempts})")
+            heartbeat = _Heartbeat(queue, unit.unit_id, worker_id, heartbeat_seconds)
+            heartbeat.start()
+            try:
+                record = runner.run(unit.problem, unit.seed)
+            except Exception as error:
+                logging.exception(f"Worker {worker_id} failed on unit {unit.unit_id}")
+                queue.fail(unit.unit_id, worker_id, f"{type(error).__name__}: {error}")
+                continue
+            finally:
+                heartbeat.stop()
+            record["seed"] = unit.seed
+            if queue.complete(unit.unit_id, worker_id, record):
+                completed += 1
+    finally:
+        for runner in runners.values():
+            runner.close()
+        queue.close()
+    logging.info(f"Worker {worker_id} finished after {completed} unit(s).")
+    return completed
+
+def _worker_process(queue_path: str, worker_id: str, max_units: Optional[int]) -> None:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    run_worker(queue_path, worker_id, max_units)
+
+def run_workers(queue_path: str, processes: int, max_units: Optional[int] = None) -> None:
+    """Runs several workers on this host, one per process, and waits for them."""
+    workers = [multiprocessing.Process(target=_worker_process, args=(queue_path, f"{default_worker_id()}-{index}", max_units),
+                                       name=f"worker-{index}")
+               for index in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+def coordinate(queue_path: str, seeds: Sequence[int], results_path: Optional[str],
+               shard_index: int = 0, num_shards: int = 1, wait: bool = True,
+               poll_seconds: float = config.QUEUE_POLL_SECONDS) -> Dict[str, int]:
+    """
+    Enqueues every (graph, problem, seed) of the configured sweep, then optionally waits for the
+    workers to finish and writes the outcome records to a results file.
+
+    Args:
+        queue_path (str): Path of the queue's SQLite file
+        seeds (Sequence[int]): Replicate seeds (see ProblemRunner.run)
+        results_path (Optional[str]): JSONL file the records are written to once the queue is finished
+        shard_index (int): Shard of the problems to enqueue
+        num_shards (int): Number of shards
+        wait (bool): Wait for the queue to finish
+        poll_seconds (float): Interval of progress reports while waiting
+
+    Returns:
+        Dict[str, int]: Number of units per status
+    """
+    graph_configs = {**config.GRAPH_CONFIGS, **build_graph_configs(config.GENERATED_GRAPHS)}
+    problems = load_problems(config.DATASET_PATH, config.DATASET_KIND, num_problems=config.NUM_PROBLEMS,
+                             seed=config.DATASET_SEED, shard_index=shard_index, num_shards=num_shards)
+    queue = WorkQueue(queue_path)
+    try:
+        added = queue.enqueue(graph_configs, problems, seeds)
+        logging.info(f"Enqueued {added} unit(s): {len(graph_configs)} graph(s) x {len(problems)} problem(s) "
+                     f"x {len(seeds)} seed(s) in {queue_path}")
+        if not wait:
+            return queue.counts()
+
+        while not queue.finished():
+            logging.info(f"Queue progress: {queue.counts()}")
+            time.sleep(poll_seconds)
+        counts = queue.counts()
+        logging.info(f"Queue finished: {counts}")
+        for failure in queue.failures():
+            logging.warning(f"Unit failed: {failure}")
+
+        if results_path:
+            results_store = open_results_store(results_path, resume=False)
+            for record in queue.results():
+                results_store.append(record)
+            for graph_name, summary in results_store.summarize().items():
+                logging.info(f"Graph '{graph_name}' overall correctness: {summary['correct']}/{summary['answers']} "
+                             f"({summary['percentage']:.2f}%) over {summary['problems']} run(s)")
+            results_store.close()
+        return counts
+    finally:
+        queue.close()
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Runs a sweep over several processes or hosts through a shared SQLite work queue.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    coordinator = subparsers.add_parser("coordinator", help="Enqueue the configured sweep and collect its results")
+    coordinator.add_argument("--queue", default=config.QUEUE_PATH)
+    coordinator.add_argument("--seeds", type=int, nargs="+", default=[0], help="Replicate seeds of every (graph, problem)")
+    coordinator.add_argument("--shard", default="0/1", help="Enqueue only shard I of K of the problems, as I/K")
+    coordinator.add_argument("--results", default=config.RESULTS_PATH, help="JSONL file the records are written to")
+    coordinator.add_argument("--no-wait", action="store_true", help="Only enqueue; do not wait for the workers")
+
+    worker = subparsers.add_parser("worker", help="Run units from the queue until it is finished")
+    worker.add_argument("--queue", default=config.QUEUE_PATH)
+    worker.add_argument("--processes", type=int, default=1, help="Worker processes on this host")
+    worker.add_argument("--max-units", type=int, default=None, help="Stop each worker after this many units")
+
+    status = subparsers.add_parser("status", help="Print the number of units per status")
+    status.add_argument("--queue", default=config.QUEUE_PATH)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    if args.command == "coordinator":
+        shard_index, num_shards = (int(part) for part in args.shard.split("/"))
+        coordinate(args.queue, args.seeds, args.results, shard_index, num_shards, wait=not args.no_wait)
+    elif args.command == "worker":
+        if args.processes > 1:
+            run_workers(args.queue, args.processes, args.max_units)
+        else:
+            run_worker(args.queue, max_units=args.max_units)
+    else:
+        queue = WorkQueue(args.queue)
+        print(json.dumps(queue.counts()))
+        queue.close()
+
+if __name__ == "__main__":
+    main()
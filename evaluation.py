@@ -0,0 +1,111 @@
+# evaluation.py
+
+import json
+import logging
+import re
+import threading
+from typing import Any, Dict, Optional
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+class EvaluationResult(BaseModel):
+    solution_changed: bool = Field(False, description="Whether the agent adopts a mathematically different solution")
+    new_solution: Optional[str] = Field(None, description="The adopted solution, numerical answer only")
+    confidence: float = Field(0.0, ge=0.0, le=100.0, description="Confidence in the evaluation, 0-100")
+    reasoning: str = Field("", description="One-line mathematical explanation")
+
+    @field_validator("new_solution", "reasoning", mode="before")
+    @classmethod
+    def _numbers_as_text(cls, value: Any) -> Any:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        return value
+
+    @field_validator("confidence", mode="before")
+    @classmethod
+    def _clamp_confidence(cls, value: Any) -> Any:
+        try:
+            return min(100.0, max(0.0, float(value)))
+        except (TypeError, ValueError):
+            return 0.0
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+_LINE_COMMENT = re.compile(r"(\"(?:\\.|[^\"\\])*\")|//[^\n]*")
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_PYTHON_LITERALS = re.compile(r"(\"(?:\\.|[^\"\\])*\")|\b(True|False|None)\b")
+
+_stats_lock = threading.Lock()
+_stats = {
+    "parsed": 0,     # Valid as returned
+    "repaired": 0,   # Valid after local repair
+    "retried": 0,    # Sent back to the model once
+    "recovered": 0,  # Valid after the retry
+    "failed": 0,     # Still invalid; the agent keeps its solution
+}
+
+def record_outcome(outcome: str) -> None:
+    with _stats_lock:
+        _stats[outcome] += 1
+
+def get_evaluation_stats() -> Dict[str, int]:
+    """Returns how many evaluation responses were valid, repaired, retried, recovered or failed."""
+    with _stats_lock:
+        return dict(_stats)
+
+def reset_evaluation_stats() -> None:
+    with _stats_lock:
+        for outcome in _stats:
+            _stats[outcome] = 0
+
+def _validate(text: str) -> Optional[EvaluationResult]:
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    try:
+        return EvaluationResult.model_validate(data)
+    except ValidationError:
+        return None
+
+def _outermost_object(text: str) -> Optional[str]:
+    start = text.find("{")
+    end = text.rfind("}")
+    return text[start:end + 1] if start != -1 and end > start else None
+
+def repair_json(text: str) -> str:
+    """
+    Cheap local fixes for JSON objects wrapped in model output: strips code fences and surrounding
+    prose, // comments (the prompt's template has them), trailing commas and Python literals.
+    """
+    fenced = _FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    text = _outermost_object(text) or text
+    text = _LINE_COMMENT.sub(lambda match: match.group(1) or "", text)
+    text = _TRAILING_COMMA.sub(r"\1", text)
+    literals = {"True": "true", "False": "false", "None": "null"}
+    return _PYTHON_LITERALS.sub(lambda match: match.group(1) or literals[match.group(2)], text)
+
+def parse_evaluation(text: str, count_outcome: bool = True) -> Optional[EvaluationResult]:
+    """
+    Parses an evaluation response, repairing it locally if needed.
+
+    Args:
+        text (str): Raw model output
+        count_outcome (bool): Whether to count a success as 'parsed' or 'repaired'
+
+    Returns:
+        Optional[EvaluationResult]: The validated result, or None if the response cannot be repaired
+    """
+    result = _validate(text)
+    if result is not None:
+        if count_outcome:
+            record_outcome("parsed")
+        return result
+    result = _validate(repair_json(text))
+    if result is not None:
+        if count_outcome:
+            record_outcome("repaired")
+        logging.info("Evaluation response repaired locally.")
+    return result
@@ -0,0 +1,173 @@
+# history.py
+
+import threading
+from typing import Dict, List, NamedTuple, Optional
+from answers import extract_final_answer
+
+HISTORY_POLICIES = ("full", "window", "summary")
+
+_encoder_lock = threading.Lock()
+_encoder = None
+_encoder_loaded = False
+
+def _get_encoder():
+    """tiktoken's cl100k_base encoding if tiktoken is installed, else None."""
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        with _encoder_lock:
+            if not _encoder_loaded:
+                try:
+                    import tiktoken
+                    _encoder = tiktoken.get_encoding("cl100k_base")
+                except Exception:
+                    _encoder = None
+                _encoder_loaded = True
+    return _encoder
+
+def count_tokens(text: str) -> int:
+    """Counts the tokens of a text with tiktoken, or estimates them at four characters per token."""
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+class Turn(NamedTuple):
+    speaker: str
+    text: str
+    tokens: int
+
+class DebateHistory:
+    """
+    A conversation stored as a list of turns, rendered into prompts under a token budget.
+
+    Policies:
+        'full': every turn
+        'window': only the last `max_turns` turns
+        'summary': the last `max_turns` turns, preceded by one line per earlier turn that keeps
+            only its final answer
+
+    With a `token_budget`, the oldest kept turns are then dropped (or, with 'summary', folded into
+    the summary) until the rendered history fits; the latest turn is always kept. With 'full' and
+    no budget, the rendering is the plain concatenation of all turns.
+    """
+
+    def __init__(self, policy: str = "full", max_turns: Optional[int] = None, token_budget: Optional[int] = None):
+        if policy not in HISTORY_POLICIES:
+            raise ValueError(f"History policy must be one of {HISTORY_POLICIES}, got '{policy}'")
+        self.policy = policy
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.turns: List[Turn] = []
+        self.total_tokens = 0
+        self._rendered: Optional[str] = None
+        self.rendered_tokens = 0
+
+    def add(self, speaker: str, text: str) -> None:
+        """Appends a turn."""
+        line = self._line(speaker, text)
+        turn = Turn(speaker, text, count_tokens(line))
+        self.turns.append(turn)
+        self.total_tokens += turn.tokens
+        self._rendered = None
+
+    def clear(self) -> None:
+        self.turns.clear()
+        self.total_tokens = 0
+        self._rendered = None
+        self.rendered_tokens = 0
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def __str__(self) -> str:
+        return self.render()
+
+    @staticmethod
+    def _line(speaker: str, text: str) -> str:
+        return f"\n{speaker}: {text}"
+
+    @staticmethod
+    def _summary_line(turn: Turn) -> str:
+        answer = extract_final_answer(turn.text)
+        if answer is None:
+            answer = turn.text.strip().split("\n", 1)[0][:80]
+        return f"\n{turn.speaker} (earlier): Answer: {answer}"
+
+    def render(self) -> str:
+        """Renders the history for a prompt according to the policy and the token budget."""
+        if self._rendered is not None:
+            return self._rendered
+
+        turns = self.turns
+        earlier: List[Turn] = []
+        if self.policy != "full" and self.max_turns is not None and len(turns) > self.max_turns:
+            split = len(turns) - self.max_turns
+            earlier, turns = turns[:split], turns[split:]
+        if self.policy != "summary":
+            earlier = []
+
+        summary = self._summarize(earlier)
+        if self.token_budget is not None:
+            kept_tokens = sum(turn.tokens for turn in turns)
+            while len(turns) > 1 and count_tokens(summary) + kept_tokens > self.token_budget:
+                kept_tokens -= turns[0].tokens
+                if self.policy == "summary":
+                    earlier = earlier + [turns[0]]
+                    summary = self._summarize(earlier)
+                turns = turns[1:]
+            # If the summary alone is over budget, keep only the summaries of the latest turns
+            while earlier and count_tokens(summary) + kept_tokens > self.token_budget:
+                earlier = earlier[1:]
+                summary = self._summarize(earlier)
+
+        self._rendered = summary + "".join(self._line(turn.speaker, turn.text) for turn in turns)
+        self.rendered_tokens = count_tokens(summary) + sum(turn.tokens for turn in turns)
+        return self._rendered
+
+    def _summarize(self, turns: List[Turn]) -> str:
+        lines = []
+        for turn in turns:
+            line = self._summary_line(turn)
+            if not lines or lines[-1] != line:
+                lines.append(line)
+        return "".join(lines)
+
+# Prompt-token accounting per prompt kind: tokens sent, and history tokens sent vs. the unbounded history
+_stats_lock = threading.Lock()
+_prompt_stats: Dict[str, Dict[str, int]] = {}
+
+def record_prompt(kind: str, prompt_tokens: int, history_tokens: int = 0, unbounded_history_tokens: int = 0) -> None:
+    """Records the token counts of one LLM call."""
+    with _stats_lock:
+        stats = _prompt_stats.setdefault(kind, {"calls": 0, "prompt_tokens": 0, "history_tokens": 0,
+                                                "unbounded_history_tokens": 0})
+        stats["calls"] += 1
+        stats["prompt_tokens"] += prompt_tokens
+        stats["history_tokens"] += history_tokens
+        stats["unbounded_history_tokens"] += unbounded_history_tokens
+
+def get_prompt_token_stats() -> Dict[str, Dict[str, float]]:
+    """
+    Returns prompt-token stats per prompt kind, plus their 'total'.
+
+    Returns:
+        Dict[str, Dict[str, float]]: Calls, prompt tokens, mean prompt tokens per call, history tokens
+        sent, and history tokens saved compared with sending the unbounded history
+    """
+    with _stats_lock:
+        per_kind = {kind: dict(stats) for kind, stats in _prompt_stats.items()}
+    total = {"calls": 0, "prompt_tokens": 0, "history_tokens": 0, "unbounded_history_tokens": 0}
+    for stats in per_kind.values():
+        for key in total:
+            total[key] += stats[key]
+    per_kind["total"] = total
+    for stats in per_kind.values():
+        stats["mean_prompt_tokens"] = round(stats["prompt_tokens"] / stats["calls"], 1) if stats["calls"] else 0.0
+        stats["saved_tokens"] = stats["unbounded_history_tokens"] - stats["history_tokens"]
+    return per_kind
+
+def reset_prompt_token_stats() -> None:
+    with _stats_lock:
+        _prompt_stats.clear()
@@ -1,8 +1,27 @@
-from langchain_openai import ChatOpenAI
-from typing import Optional
-from pydantic import BaseModel, Field
+from typing import TYPE_CHECKING, Callable, Optional, Dict, Iterator, List, Sequence, Tuple
+import contextlib
+import contextvars
+import dataclasses
 import os
+import threading
+import time
 from enum import IntEnum
+from cache import get_response_cache, current_sample_index, sampling
+from ratelimit import EndpointLimiter, get_limiter
+from loadbalancer import EndpointPool, get_pool, split_urls
+from history import count_tokens
+from tracing import get_tracer, span
+import config as run_config
+
+# LangChain, the OpenAI client and httpx take a noticeable time to import, so they are only
+# imported once the first LLM client or chat model is built
+if TYPE_CHECKING:
+    import httpx
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import BaseMessage
+    from langchain_core.outputs import LLMResult
+    from langchain_core.prompt_values import PromptValue
+    from langchain_core.runnables import Runnable
 
 class CapabilityLevel(IntEnum):
     BASIC = 0
@@ -12,11 +31,133 @@ class CapabilityLevel(IntEnum):
     HIGH = 4
     ADVANCED = 5
 
-class LLMConfig(BaseModel):
-    api_base: str = Field(..., description="Base URL for the API endpoint")
-    api_key: str = Field(..., description="API key for authentication")
-    model_name: str = Field(..., description="Name of the model to use")
-    temperature: float = Field(0.7, ge=0.0, le=1.0, description="Temperature for response generation")
+@dataclasses.dataclass
+class LLMConfig:
+    api_base: str  # Base URL for the API endpoint
+    api_key: str  # API key for authentication
+    model_name: str  # Name of the model to use
+    temperature: float = 0.7  # Temperature for response generation, 0-1
+    api_bases: List[str] = dataclasses.field(default_factory=list)  # All endpoints serving the model; api_base is the first
+
+    def __post_init__(self):
+        if not 0.0 <= self.temperature <= 1.0:
+            raise ValueError(f"Temperature must be between 0 and 1, got {self.temperature}")
+
+# Per-process registry of LLM clients, keyed by (capability level, model, temperature, endpoint).
+# Clients on the same endpoint share one pooled pair of HTTP clients, so connections
+# (and their TLS sessions) are reused across agents and debate rounds.
+_registry_lock = threading.Lock()
+_llm_registry: Dict[Tuple[int, str, float, str], "BaseChatModel"] = {}
+_llm_configs: Dict[int, LLMConfig] = {}
+_chat_models: Dict[Tuple[int, bool], "Runnable"] = {}
+_http_clients: Dict[str, Tuple["httpx.Client", "httpx.AsyncClient"]] = {}
+_client_stats = {
+    "llm_clients": 0,
+    "http_clients": 0,
+    "connections": 0,
+}
+
+class CallStats:
+    """LLM calls made for one unit of work, accumulated across the threads and tasks it spawns."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.cache_hits = 0
+        self.llm_seconds = 0.0
+
+    def record(self, cached: bool, seconds: float = 0.0) -> None:
+        with self._lock:
+            self.calls += 1
+            self.cache_hits += int(cached)
+            self.llm_seconds += seconds
+
+    def as_dict(self) -> Dict[str, float]:
+        with self._lock:
+            return {"llm_calls": self.calls, "cache_hits": self.cache_hits,
+                    "llm_seconds": round(self.llm_seconds, 3)}
+
+_call_stats: contextvars.ContextVar[Optional[CallStats]] = contextvars.ContextVar("call_stats", default=None)
+
+@contextlib.contextmanager
+def tracking_calls() -> Iterator[CallStats]:
+    """Counts the LLM calls made inside the block, including those of tasks and copied contexts it starts."""
+    stats = CallStats()
+    token = _call_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _call_stats.reset(token)
+
+def _record_call(cached: bool, seconds: float = 0.0) -> None:
+    stats = _call_stats.get()
+    if stats is not None:
+        stats.record(cached, seconds)
+
+# Backend behind get_llm: 'openai' for the configured endpoint, 'mock' for mock_llm.MockChatModel
+LLM_BACKENDS = ("openai", "mock")
+_backend = {
+    "name": os.environ.get("MAFEA_LLM_BACKEND", "openai"),
+    "options": {},
+}
+
+def set_llm_backend(name: str, **options) -> None:
+    """
+    Selects the backend used by every subsequent LLM call.
+
+    Args:
+        name (str): 'openai' or 'mock'
+        **options: Keyword arguments for mock_llm.MockChatModel (latency, accuracy, seed, ...)
+    """
+    if name not in LLM_BACKENDS:
+        raise ValueError(f"LLM backend must be one of {LLM_BACKENDS}, got '{name}'")
+    with _registry_lock:
+        _backend["name"] = name
+        _backend["options"] = dict(options)
+        _llm_registry.clear()
+
+def get_llm_backend() -> str:
+    return _backend["name"]
+
+def get_llm_backend_options() -> Dict:
+    return dict(_backend["options"])
+
+def _record_connection(event_name: str, info: dict) -> None:
+    if event_name == "connection.connect_tcp.complete":
+        with _registry_lock:
+            _client_stats["connections"] += 1
+
+async def _arecord_connection(event_name: str, info: dict) -> None:
+    _record_connection(event_name, info)
+
+def _trace_connections(request: "httpx.Request") -> None:
+    request.extensions["trace"] = _record_connection
+
+async def _atrace_connections(request: "httpx.Request") -> None:
+    request.extensions["trace"] = _arecord_connection
+
+def _get_http_clients(api_base: str) -> Tuple["httpx.Client", "httpx.AsyncClient"]:
+    """Returns the pooled (sync, async) HTTP clients for an endpoint, creating them once. Callers hold _registry_lock."""
+    clients = _http_clients.get(api_base)
+    if clients is None:
+        import httpx
+        clients = (
+            httpx.Client(event_hooks={"request": [_trace_connections]}),
+            httpx.AsyncClient(event_hooks={"request": [_atrace_connections]}),
+        )
+        _http_clients[api_base] = clients
+        _client_stats["http_clients"] += 2
+    return clients
+
+def get_client_stats() -> Dict[str, int]:
+    """
+    Returns how many LLM clients, HTTP clients and TCP connections were created in this process.
+
+    Returns:
+        Dict[str, int]: Counters keyed by 'llm_clients', 'http_clients' and 'connections'
+    """
+    with _registry_lock:
+        return dict(_client_stats)
 
 def get_llm_config(capability_level: CapabilityLevel) -> LLMConfig:
     """
@@ -51,23 +192,45 @@ def get_llm_config(capability_level: CapabilityLevel) -> LLMConfig:
         CapabilityLevel.BASIC: ("gpt-3.5-turbo", 0.7)
     }
 
+    # Replicas serving the level: LLM_ENDPOINTS in config.py, else a comma-separated OPENAI_API_BASES
+    api_bases = (run_config.LLM_ENDPOINTS.get(int(capability_level))
+                 or split_urls(os.environ.get("OPENAI_API_BASES", ""))
+                 or [base_config["api_base"]])
+
     model_name, temperature = model_configs[capability_level]
     return LLMConfig(
-        api_base=base_config["api_base"],
+        api_base=api_bases[0],
+        api_bases=api_bases,
         api_key=base_config["api_key"],
         model_name=model_name,
         temperature=temperature
     )
 
-def get_llm(capability_level: int) -> ChatOpenAI:
+def _get_config(level: CapabilityLevel) -> LLMConfig:
+    config = _llm_configs.get(int(level))
+    if config is None:
+        config = get_llm_config(level)
+        _llm_configs[int(level)] = config
+    return config
+
+def _model_id(level: CapabilityLevel) -> str:
+    """Model name used in cache keys, so responses of different backends never mix."""
+    if _backend["name"] == "mock":
+        return f"mock:{int(level)}"
+    return _get_config(level).model_name
+
+def get_llm(capability_level: int, api_base: Optional[str] = None) -> "BaseChatModel":
     """
-    Returns an LLM instance configured to use a custom OpenAI-style endpoint.
+    Returns the shared LLM instance configured to use a custom OpenAI-style endpoint, or the
+    mock model when the 'mock' backend is selected.
+    Instances are created once per (capability level, model, temperature, endpoint).
 
     Args:
         capability_level (int): Integer representing the desired capability level (0-5)
+        api_base (Optional[str]): Endpoint of the level's pool to use; defaults to the first one
 
     Returns:
-        ChatOpenAI: Configured LLM instance
+        BaseChatModel: Configured LLM instance
 
     Raises:
         ValueError: If capability_level is not in range 0-5
@@ -77,11 +240,257 @@ def get_llm(capability_level: int) -> ChatOpenAI:
     except ValueError:
         raise ValueError(f"Capability level must be between {CapabilityLevel.BASIC} and {CapabilityLevel.ADVANCED}")
 
-    config = get_llm_config(level)
+    config = _get_config(level)
+    backend = _backend["name"]
+    api_base = api_base or config.api_base
+    if backend == "mock":
+        key = (int(level), _model_id(level), config.temperature, "mock")
+    else:
+        key = (int(level), config.model_name, config.temperature, api_base)
 
-    return ChatOpenAI(
-        openai_api_base=config.api_base,
-        openai_api_key=config.api_key,
-        model_name=config.model_name,
-        temperature=config.temperature
-    )
+    llm = _llm_registry.get(key)
+    if llm is not None:
+        return llm
+    with _registry_lock:
+        llm = _llm_registry.get(key)
+        if llm is None:
+            if backend == "mock":
+                from mock_llm import MockChatModel
+                llm = MockChatModel(capability=int(level), **_backend["options"])
+            else:
+                from langchain_openai import ChatOpenAI
+                http_client, http_async_client = _get_http_clients(api_base)
+                llm = ChatOpenAI(
+                    openai_api_base=api_base,
+                    openai_api_key=config.api_key,
+                    model_name=config.model_name,
+                    temperature=config.temperature,
+                    request_timeout=run_config.LLM_REQUEST_TIMEOUT,
+                    max_retries=0,  # Retries and backoff are handled by the shared EndpointLimiter
+                    http_client=http_client,
+                    http_async_client=http_async_client
+                )
+            _llm_registry[key] = llm
+            _client_stats["llm_clients"] += 1
+    return llm
+
+def _probe(api_base: str) -> bool:
+    """Health check of an OpenAI-compatible endpoint: its model list must be served."""
+    with _registry_lock:
+        http_client, _ = _get_http_clients(api_base)
+    api_key = os.environ.get("OPENAI_API_KEY", "")
+    response = http_client.get(f"{api_base.rstrip('/')}/models", timeout=run_config.ENDPOINT_PROBE_TIMEOUT,
+                               headers={"Authorization": f"Bearer {api_key}"} if api_key else None)
+    return response.status_code == 200
+
+def _get_pool(level: CapabilityLevel) -> EndpointPool:
+    """The endpoint pool of a capability level; the mock backend has a single pseudo-endpoint."""
+    api_bases = ["mock"] if _backend["name"] == "mock" else _get_config(level).api_bases
+    return get_pool(api_bases, lambda: EndpointPool(
+        api_bases,
+        strategy=run_config.LOAD_BALANCING,
+        probe=None if _backend["name"] == "mock" else _probe,
+        eject_after=run_config.ENDPOINT_EJECT_AFTER_FAILURES,
+        eject_seconds=run_config.ENDPOINT_EJECT_SECONDS,
+    ))
+
+def _get_limiter(level: CapabilityLevel) -> Callable[[str], EndpointLimiter]:
+    """
+    The rate limiter of each endpoint URL for a capability level's model. Every replica has its own,
+    shared by the capability levels that use the same model on it.
+    """
+    model_id = _model_id(level)
+    return lambda api_base: get_limiter(api_base, model_id)
+
+def check_endpoint_health() -> Dict[str, bool]:
+    """
+    Probes every endpoint of every capability level once, ejecting failing replicas from their pools.
+    Levels without a configured base URL, which use the client's default endpoint, are not probed.
+
+    Returns:
+        Dict[str, bool]: Endpoint URL -> whether it passed the health check
+    """
+    results = {}
+    for level in CapabilityLevel:
+        if _backend["name"] != "mock" and not any(_get_config(level).api_bases):
+            continue
+        results.update(_get_pool(level).check_health())
+    return results
+
+def _estimate_tokens(prompt: str) -> int:
+    # About four characters per token, plus a budget for the completion
+    return len(prompt) // 4 + run_config.LLM_COMPLETION_TOKENS_ESTIMATE
+
+def _used_tokens(message: "BaseMessage") -> Optional[int]:
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("total_tokens")
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    return token_usage.get("total_tokens")
+
+def _cached_tokens(token_usage: Dict) -> int:
+    """Prompt tokens served from the endpoint's prefix cache, from OpenAI-style usage (vLLM reports it too)."""
+    return (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+
+def _record_tokens(call_span, prompt: str, message: "BaseMessage") -> None:
+    """
+    Adds a call's prompt and completion tokens to its trace span: the API's usage if reported, else
+    estimates. Prompt tokens the endpoint served from its prefix cache are added as cached_prompt_tokens.
+    """
+    if not get_tracer().enabled:
+        return
+    usage = getattr(message, "usage_metadata", None) or {}
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    prompt_tokens, completion_tokens = usage.get("input_tokens"), usage.get("output_tokens")
+    cached_tokens = (usage.get("input_token_details") or {}).get("cache_read") or _cached_tokens(token_usage)
+    if prompt_tokens is None:
+        prompt_tokens, completion_tokens = token_usage.get("prompt_tokens"), token_usage.get("completion_tokens")
+    if prompt_tokens is None:
+        prompt_tokens, completion_tokens = count_tokens(prompt), count_tokens(str(message.content))
+    call_span.add("prompt_tokens", prompt_tokens)
+    call_span.add("completion_tokens", completion_tokens or 0)
+    call_span.add("cached_prompt_tokens", cached_tokens)
+
+def _with_response_cache(level: CapabilityLevel, json_mode: bool = False) -> "Runnable":
+    """
+    Returns a runnable that sends prompts to the current LLM of a capability level, through the
+    process-wide response cache when one is configured, through the endpoints' rate limiter and
+    routed over the level's endpoint pool.
+    The LLM is looked up on every call, so chains built on this runnable follow backend changes.
+    In JSON mode, calls request a JSON object response and are cached separately.
+    """
+    from langchain_core.messages import AIMessage, BaseMessage
+    from langchain_core.runnables import RunnableLambda
+
+    call_options = {"response_format": {"type": "json_object"}} if json_mode else {}
+
+    def cache_key(prompt: str):
+        cache = get_response_cache()
+        if cache is None:
+            return None, None
+        model_id = f"{_model_id(level)}+json" if json_mode else _model_id(level)
+        key = cache.make_key(model_id, _get_config(level).temperature, prompt, current_sample_index())
+        return cache, key
+
+    def invoke(prompt_value) -> BaseMessage:
+        with span("llm", capability=int(level)) as call_span:
+            prompt = prompt_value.to_string()
+            cache, key = cache_key(prompt)
+            if cache is not None:
+                cached = cache.lookup(key)
+                if cached is not None:
+                    _record_call(cached=True)
+                    call_span.add("cache_hits")
+                    return AIMessage(content=cached)
+            start = time.perf_counter()
+            message = _get_pool(level).call(lambda api_base: get_llm(level, api_base).invoke(prompt_value, **call_options),
+                                            _get_limiter(level), _estimate_tokens(prompt), _used_tokens)
+            _record_call(cached=False, seconds=time.perf_counter() - start)
+            _record_tokens(call_span, prompt, message)
+            if cache is not None:
+                cache.store(key, message.content)
+            return message
+
+    async def ainvoke(prompt_value) -> BaseMessage:
+        with span("llm", capability=int(level)) as call_span:
+            prompt = prompt_value.to_string()
+            cache, key = cache_key(prompt)
+            if cache is not None:
+                cached = cache.lookup(key)
+                if cached is not None:
+                    _record_call(cached=True)
+                    call_span.add("cache_hits")
+                    return AIMessage(content=cached)
+            start = time.perf_counter()
+            message = await _get_pool(level).acall(lambda api_base: get_llm(level, api_base).ainvoke(prompt_value, **call_options),
+                                                   _get_limiter(level), _estimate_tokens(prompt), _used_tokens)
+            _record_call(cached=False, seconds=time.perf_counter() - start)
+            _record_tokens(call_span, prompt, message)
+            if cache is not None:
+                cache.store(key, message.content)
+            return message
+
+    return RunnableLambda(invoke, afunc=ainvoke)
+
+def _batch_usage(result: "LLMResult") -> Dict[str, int]:
+    return ((result.llm_output or {}).get("token_usage") or {})
+
+def generate_samples(capability_level: int, prompt_value: "PromptValue", sample_indices: Sequence[int]) -> List[str]:
+    """
+    Samples several responses to one prompt. Each sample is the response a call under
+    `sampling(index)` would get and is cached under its own sample index, but the uncached ones are
+    requested together, through the API's `n` parameter, in one request per run of consecutive
+    indices. Endpoints that return fewer choices than requested get further requests for the rest.
+
+    Args:
+        capability_level (int): Integer representing the desired capability level (0-5)
+        prompt_value (PromptValue): The rendered prompt
+        sample_indices (Sequence[int]): Sample index of each response
+
+    Returns:
+        List[str]: The response content per sample index, in order
+    """
+    level = CapabilityLevel(capability_level)
+    prompt = prompt_value.to_string()
+    cache = get_response_cache()
+    keys: Dict[int, str] = {}
+    responses: Dict[int, str] = {}
+    if cache is not None:
+        model_id, temperature = _model_id(level), _get_config(level).temperature
+        for index in sample_indices:
+            keys[index] = cache.make_key(model_id, temperature, prompt, index)
+            cached = cache.lookup(keys[index])
+            if cached is not None:
+                with span("llm", capability=int(level)) as call_span:
+                    _record_call(cached=True)
+                    call_span.add("cache_hits")
+                responses[index] = cached
+
+    missing = [index for index in sample_indices if index not in responses]
+    while missing:
+        # The longest run of consecutive indices at the front goes into one request
+        run = 1
+        while run < len(missing) and missing[run] == missing[0] + run:
+            run += 1
+        with span("llm", capability=int(level)) as call_span, sampling(missing[0]):
+            call_span.add("samples", run)
+            start = time.perf_counter()
+            result = _get_pool(level).call(
+                lambda api_base: get_llm(level, api_base).generate([prompt_value.to_messages()], n=run), _get_limiter(level),
+                _estimate_tokens(prompt) + (run - 1) * run_config.LLM_COMPLETION_TOKENS_ESTIMATE,
+                lambda result: _batch_usage(result).get("total_tokens"))
+            _record_call(cached=False, seconds=time.perf_counter() - start)
+            contents = [str(generation.message.content) for generation in result.generations[0][:run]]
+            if not contents:
+                raise ValueError(f"Endpoint returned no choices for a batch of {run} samples")
+            if get_tracer().enabled:
+                usage = _batch_usage(result)
+                call_span.add("prompt_tokens", usage.get("prompt_tokens", count_tokens(prompt)))
+                call_span.add("completion_tokens", usage.get("completion_tokens", sum(count_tokens(content) for content in contents)))
+                call_span.add("cached_prompt_tokens", _cached_tokens(usage))
+        for index, content in zip(missing, contents):
+            responses[index] = content
+            if cache is not None:
+                cache.store(keys[index], content)
+        missing = missing[len(contents):]
+    return [responses[index] for index in sample_indices]
+
+def get_chat_model(capability_level: int, json_mode: bool = False) -> "Runnable":
+    """
+    Returns the runnable that chains should use for a capability level: the shared LLM
+    instance from `get_llm`, behind the response cache.
+
+    Args:
+        capability_level (int): Integer representing the desired capability level (0-5)
+        json_mode (bool): Request responses in the API's JSON mode (response_format json_object)
+
+    Returns:
+        Runnable: Prompt value in, chat message out
+    """
+    key = (capability_level, json_mode)
+    chat_model = _chat_models.get(key)
+    if chat_model is None:
+        level = CapabilityLevel(capability_level)
+        with _registry_lock:
+            chat_model = _chat_models.setdefault(key, _with_response_cache(level, json_mode))
+    return chat_model
@@ -0,0 +1,264 @@
+# loadbalancer.py
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from ratelimit import EndpointLimiter, classify_error
+
+LOAD_BALANCING_STRATEGIES = ("least_outstanding", "latency_weighted")
+
+class Replica:
+    """One OpenAI-compatible endpoint of a pool, with its routing state and metrics."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected = False
+        self.latency: Optional[float] = None  # Exponentially weighted moving average, in seconds
+        self.probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections,
+            "healthy": not self.ejected,
+            "latency_s": round(self.latency, 3) if self.latency is not None else None,
+        }
+
+class EndpointPool:
+    """
+    Routes LLM calls over a pool of equivalent endpoints, such as replicas of one vLLM deployment.
+
+    'least_outstanding' sends each call to the replica with the fewest calls in flight;
+    'latency_weighted' weighs that count by the replica's average latency. A replica that fails
+    `eject_after` calls in a row is ejected from routing. An ejected replica is probed after
+    `eject_seconds` (with `probe` if given, otherwise by readmitting it), and the wait doubles
+    after each failed probe, up to `max_eject_seconds`. If every replica is ejected, calls still
+    go to the least loaded one rather than failing outright.
+    """
+
+    def __init__(self, urls: Sequence[str], strategy: str = "least_outstanding",
+                 probe: Optional[Callable[[str], bool]] = None,
+                 eject_after: int = 3, eject_seconds: float = 10.0, max_eject_seconds: float = 300.0):
+        if not urls:
+            raise ValueError("An endpoint pool needs at least one URL")
+        if strategy not in LOAD_BALANCING_STRATEGIES:
+            raise ValueError(f"Load balancing strategy must be one of {LOAD_BALANCING_STRATEGIES}, got '{strategy}'")
+        self.replicas = [Replica(url) for url in dict.fromkeys(urls)]
+        self.strategy = strategy
+        self.probe = probe
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.max_eject_seconds = max_eject_seconds
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return "|".join(replica.url for replica in self.replicas)
+
+    def _cost(self, replica: Replica) -> float:
+        if self.strategy == "latency_weighted":
+            known = [r.latency for r in self.replicas if r.latency is not None]
+            latency = replica.latency if replica.latency is not None else (min(known) if known else 1.0)
+            return (replica.outstanding + 1) * latency
+        return replica.outstanding
+
+    def acquire(self, exclude: Sequence[Replica] = ()) -> Replica:
+        """Picks the replica for the next call and counts the call as outstanding on it."""
+        with self._lock:
+            healthy = [replica for replica in self.replicas if not replica.ejected]
+            candidates = [replica for replica in healthy if replica not in exclude] or healthy or self.replicas
+            replica = min(candidates, key=lambda r: (self._cost(r), r.requests))
+            replica.outstanding += 1
+            replica.requests += 1
+            return replica
+
+    def release(self, replica: Replica, latency: Optional[float] = None, error: Optional[Exception] = None) -> None:
+        """
+        Records the outcome of a call: a success with its latency, or an error. Errors that point at
+        the replica count towards ejecting it. A call released with neither had no outcome (it was cancelled).
+        """
+        eject = False
+        with self._lock:
+            replica.outstanding -= 1
+            if error is None:
+                if latency is not None:
+                    replica.consecutive_failures = 0
+                    replica.latency = latency if replica.latency is None else 0.8 * replica.latency + 0.2 * latency
+            elif classify_error(error) in ("timeout", "transient"):
+                # 429s mean the replica is busy, not broken; the rate limiter handles those
+                replica.failures += 1
+                replica.consecutive_failures += 1
+                if not replica.ejected and replica.consecutive_failures >= self.eject_after:
+                    eject = self._eject_locked(replica)
+        if eject:
+            logging.warning(f"Endpoint {replica.url} ejected after {replica.consecutive_failures} consecutive failures")
+            self._start_probe(replica)
+
+    def call(self, fn: Callable[[str], Any], limiter: Optional[Callable[[str], EndpointLimiter]] = None,
+             estimated_tokens: int = 0, used_tokens: Callable[[Any], Optional[int]] = lambda result: None) -> Any:
+        """
+        Runs `fn(url)` on the chosen replica, through that replica's rate limiter, recording its outcome.
+        Retryable errors are retried after the failing limiter's backoff, on another replica when
+        one is available, so a throttled or slow replica only narrows its own in-flight window.
+
+        Args:
+            fn (Callable[[str], Any]): The call, given the replica's URL
+            limiter (Optional[Callable[[str], EndpointLimiter]]): The limiter of a replica URL; without
+                one the call is made once, unlimited
+            estimated_tokens (int): Tokens reserved from the limiter's tokens/min budget
+            used_tokens (Callable[[Any], Optional[int]]): Actual tokens of a result, if known
+
+        Returns:
+            Any: The result of `fn`
+        """
+        failed: List[Replica] = []
+        attempt = 0
+        while True:
+            replica = self.acquire(exclude=failed)
+            started = []
+
+            def run():
+                started.append(time.monotonic())  # After the limiter's wait, so latency is the call's own
+                return fn(replica.url)
+
+            try:
+                result = limiter(replica.url).attempt(run, estimated_tokens, used_tokens) if limiter else run()
+            except Exception as error:
+                self.release(replica, error=error)
+                if limiter is None:
+                    raise
+                failed.append(replica)
+                delay = limiter(replica.url).retry_delay(attempt, error)
+            except BaseException:
+                self.release(replica)
+                raise
+            else:
+                self.release(replica, latency=time.monotonic() - started[0])
+                return result
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, fn: Callable[[str], Awaitable[Any]], limiter: Optional[Callable[[str], EndpointLimiter]] = None,
+                    estimated_tokens: int = 0, used_tokens: Callable[[Any], Optional[int]] = lambda result: None) -> Any:
+        """Async version of `call`, for `fn` returning an awaitable."""
+        failed: List[Replica] = []
+        attempt = 0
+        while True:
+            replica = self.acquire(exclude=failed)
+            started = []
+
+            async def run():
+                started.append(time.monotonic())
+                return await fn(replica.url)
+
+            try:
+                result = await (limiter(replica.url).aattempt(run, estimated_tokens, used_tokens) if limiter else run())
+            except Exception as error:
+                self.release(replica, error=error)
+                if limiter is None:
+                    raise
+                failed.append(replica)
+                delay = limiter(replica.url).retry_delay(attempt, error)
+            except BaseException:
+                self.release(replica)
+                raise
+            else:
+                self.release(replica, latency=time.monotonic() - started[0])
+                return result
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _eject_locked(self, replica: Replica) -> bool:
+        """Takes a replica out of routing. Returns whether a probe must be started for it."""
+        if len(self.replicas) == 1:
+            return False  # A lone endpoint has no alternative; the rate limiter's retries cover it
+        replica.ejected = True
+        replica.ejections += 1
+        start_probe = not replica.probing
+        replica.probing = True
+        return start_probe
+
+    def _start_probe(self, replica: Replica) -> None:
+        threading.Thread(target=self._probe_until_healthy, args=(replica,), daemon=True,
+                         name=f"probe-{replica.url}").start()
+
+    def _probe_until_healthy(self, replica: Replica) -> None:
+        wait = self.eject_seconds
+        while True:
+            time.sleep(wait)
+            try:
+                healthy = self.probe(replica.url) if self.probe is not None else True
+            except Exception:
+                healthy = False
+            if healthy:
+                with self._lock:
+                    replica.ejected = False
+                    replica.probing = False
+                    replica.consecutive_failures = 0
+                logging.info(f"Endpoint {replica.url} readmitted")
+                return
+            wait = min(self.max_eject_seconds, wait * 2)
+
+    def check_health(self) -> Dict[str, bool]:
+        """Probes every replica once and ejects those that fail. Without a probe function every replica passes."""
+        results = {}
+        for replica in self.replicas:
+            try:
+                results[replica.url] = bool(self.probe(replica.url)) if self.probe is not None else True
+            except Exception:
+                results[replica.url] = False
+            if not results[replica.url]:
+                with self._lock:
+                    eject = not replica.ejected and self._eject_locked(replica)
+                if eject:
+                    logging.warning(f"Endpoint {replica.url} ejected after failing its health check")
+                    self._start_probe(replica)
+        return results
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-endpoint metrics, keyed by URL."""
+        with self._lock:
+            return {replica.url: replica.stats() for replica in self.replicas}
+
+_pools_lock = threading.Lock()
+_pools: Dict[Tuple[str, ...], EndpointPool] = {}
+
+def get_pool(urls: Sequence[str], factory: Callable[[], EndpointPool]) -> EndpointPool:
+    """
+    Returns the process-wide pool of a list of endpoints, creating it with `factory` once.
+    Capability levels served by the same endpoints share one pool, so routing sees all their calls.
+    """
+    key = tuple(urls)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = factory()
+    return pool
+
+def reset_pools() -> None:
+    with _pools_lock:
+        _pools.clear()
+
+def get_endpoint_stats() -> Dict[str, Dict[str, Any]]:
+    """Returns the metrics of every endpoint in use, keyed by URL."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    stats: Dict[str, Dict[str, Any]] = {}
+    for pool in pools:
+        stats.update(pool.stats())
+    return stats
+
+def split_urls(value: str) -> List[str]:
+    """Parses a comma-separated list of endpoint URLs."""
+    return [url.strip() for url in value.split(",") if url.strip()]
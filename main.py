@@ -1,10 +1,20 @@
 # main.py
 
-from network import Network
-from debate import run_debates
+import argparse
 import config
-from dataset_loader import load_gsm8k_dataset
-from agent import assess_correctness
+from dataset_loader import load_problems
+from runner import run_graph
+from llm import check_endpoint_health, get_client_stats, get_llm_backend
+from loadbalancer import get_endpoint_stats
+from answers import get_equivalence_stats
+from cache import configure_response_cache
+from ratelimit import get_rate_limit_stats
+from history import get_prompt_token_stats
+from scoring import score_record
+from sweep import InitialSolvePlan
+from topology import build_graph_configs
+from results_store import ResultsStore, open_results_store
+from tracing import configure_tracing, export_jsonl, export_prometheus, report
 import logging
 import urllib3
 
@@ -17,64 +27,123 @@ urllib3.disable_warnings()
 logging.getLogger("urllib3").setLevel(logging.WARNING)
 logging.getLogger("requests").setLevel(logging.WARNING)
 
+def log_summaries(summaries):
+    for graph_name, summary in summaries.items():
+        logging.info(f"Graph '{graph_name}' overall correctness: {summary['correct']}/{summary['answers']} "
+                     f"({summary['percentage']:.2f}%) over {summary['problems']} problem(s), "
+                     f"{summary['llm_calls']} LLM calls")
 
-def main():
-    max_rounds_per_pair = config.MAX_DEBATE_ROUNDS_PER_PAIR
-
-    # Load the GSM8K dataset
-    dataset_path = 'dataset/gsm8k/train.jsonl'  # Update with your dataset path
-    PROBLEM_SET = load_gsm8k_dataset(dataset_path, num_problems=1)  # Load 10 problems for testing
-
-    # Initialize a dictionary to hold correctness data for each graph
-    graph_correctness = {}
+    logging.info("\nSummary of correctness percentages for each graph:")
+    for graph_name, summary in summaries.items():
+        logging.info(f"- {graph_name}: {summary['percentage']:.2f}%")
+
+def score_results(results_path):
+    """
+    Re-grades the final answers stored in a results file against the dataset with the local scorer
+    and logs the per-graph summaries. Runs no simulation, so LangChain, the OpenAI client and
+    networkx are never imported.
+    """
+    problems = {problem_data['id']: problem_data
+                for problem_data in load_problems(config.DATASET_PATH, config.DATASET_KIND,
+                                                  num_problems=config.NUM_PROBLEMS, seed=config.DATASET_SEED)}
+
+    def grade(record):
+        problem_data = problems.get(record["problem_id"])
+        return score_record(record, problem_data['final_answer']) if problem_data else record["correct"]
+
+    results_store = ResultsStore(results_path)
+    summaries = results_store.summarize(grade)
+    results_store.close()
+    log_summaries(summaries)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the debate simulation on every configured graph.")
+    parser.add_argument("--results", default=config.RESULTS_PATH, help="JSONL file the outcome of every (graph, problem) is appended to")
+    parser.add_argument("--resume", action="store_true", help="Skip (graph, problem) pairs already in the results file")
+    parser.add_argument("--shard", default="0/1", help="Run only shard I of K of the problems, as I/K (I counted from 0)")
+    parser.add_argument("--score-only", action="store_true",
+                        help="Re-grade and summarize the answers in the results file without running the simulation")
+    args = parser.parse_args(argv)
+    shard_index, num_shards = (int(part) for part in args.shard.split("/"))
+
+    if args.score_only:
+        score_results(args.results)
+        return
+
+    results_store = open_results_store(args.results, resume=args.resume)
+    completed = results_store.completed_units() if args.resume else set()
+    if completed:
+        logging.info(f"Resuming: {len(completed)} (graph, problem) pair(s) already in {args.results}")
+
+    configure_tracing(config.TRACING, config.TRACE_MAX_SPANS)
+    response_cache = configure_response_cache(config.RESPONSE_CACHE_MODE, config.RESPONSE_CACHE_PATH,
+                                              config.RESPONSE_CACHE_MAX_BYTES)
+
+    # Eject unreachable replicas before the first call; they are probed again in the background
+    if get_llm_backend() == "openai" and config.RESPONSE_CACHE_MODE != "replay-only":
+        unhealthy = [url for url, healthy in check_endpoint_health().items() if not healthy]
+        if unhealthy:
+            logging.warning(f"Endpoints failing their health check: {', '.join(unhealthy)}")
+
+    # Load the problems of this shard
+    PROBLEM_SET = load_problems(config.DATASET_PATH, config.DATASET_KIND, num_problems=config.NUM_PROBLEMS,
+                                seed=config.DATASET_SEED, shard_index=shard_index, num_shards=num_shards)
+
+    # Plan the initial solves once for all graphs, so identical solves are shared between them
+    graph_configs = {**config.GRAPH_CONFIGS, **build_graph_configs(config.GENERATED_GRAPHS)}
+    solve_plan = InitialSolvePlan(graph_configs, independent_samples=config.INDEPENDENT_SAMPLES_PER_TOPOLOGY,
+                                  batched=config.BATCHED_SOLVES, vote_samples=config.SOLVE_VOTE_SAMPLES)
 
     # Iterate over each graph configuration
-    for graph_name, graph_config in config.GRAPH_CONFIGS.items():
+    for graph_name, graph_config in graph_configs.items():
         logging.info(f"\n########## Running simulation on graph: {graph_name} ##########")
-
-        # Initialize the network for the current graph
-        network = Network(graph_config)
-
-        # Initialize correctness tracking
-        agent_correctness = {agent_id: [] for agent_id in network.agents}
-
-        # Iterate over each problem in the problem set
-        for problem_data in PROBLEM_SET:
-            network.reset()
-            logging.info(f"\n========== Problem {problem_data['id']} on graph \"{graph_name}\" ==========\n{problem_data['problem']}\n========================================")
-            problem = problem_data['problem']
-            correct_answer = problem_data['answer']
-
-            # Each agent solves the problem initially
-            for agent in network.agents.values():
-                agent.solve(problem)
-                agent.active = True  # Reset active status for each problem
-                agent.total_debate_rounds = 0  # Reset debate rounds for each problem
-                agent.memory.clear()  # Clear the agent's memory for each problem
-
-            # Run the debates among agents
-            run_debates(network, problem, max_rounds_per_pair)
-
-            # Check correctness of each agent's final answer
-            for agent_id, agent in network.agents.items():
-                is_correct = assess_correctness(agent, correct_answer)
-                agent_correctness[agent_id].append(is_correct)
-
-        # Calculate and display the percentage correctness for each agent in the current graph
-        total_agents = len(agent_correctness)
-        total_problems = len(PROBLEM_SET)
-        total_correct = sum([sum(results) for results in agent_correctness.values()])
-        percentage_correct = (total_correct / (total_agents * total_problems)) * 100
-
-        logging.info(f"Graph '{graph_name}' overall correctness: {total_correct}/{total_agents * total_problems} ({percentage_correct:.2f}%)")
-
-        # Store the correctness percentage for the graph
-        graph_correctness[graph_name] = percentage_correct
-
-    # After all graphs are processed, display a summary
-    logging.info("\nSummary of correctness percentages for each graph:")
-    for graph_name, percentage in graph_correctness.items():
-        logging.info(f"- {graph_name}: {percentage:.2f}%")
+        pending = [problem_data for problem_data in PROBLEM_SET if (graph_name, problem_data['id']) not in completed]
+        if len(pending) < len(PROBLEM_SET):
+            logging.info(f"Skipping {len(PROBLEM_SET) - len(pending)} completed problem(s) on graph '{graph_name}'")
+
+        # Run the remaining problems on the graph, spread over the configured worker pool;
+        # each outcome is appended to the results store as soon as it finishes
+        run_graph(graph_name, graph_config, pending, solve_plan,
+                  workers=config.PROBLEM_WORKERS, pool=config.WORKER_POOL, on_result=results_store.append)
+
+    # After all graphs are processed, display a summary computed from the results store
+    summaries = results_store.summarize()
+    results_store.close()
+    log_summaries(summaries)
+
+    client_stats = get_client_stats()
+    logging.info(f"LLM clients created: {client_stats['llm_clients']}, "
+                 f"HTTP clients: {client_stats['http_clients']}, "
+                 f"connections opened: {client_stats['connections']}")
+
+    for endpoint, endpoint_stats in get_endpoint_stats().items():
+        logging.info(f"Endpoint {endpoint}: {endpoint_stats}")
+
+    for limiter_name, limiter_stats in get_rate_limit_stats().items():
+        logging.info(f"Rate limiter {limiter_name}: {limiter_stats}")
+
+    prompt_stats = get_prompt_token_stats()["total"]
+    logging.info(f"Prompt tokens: {prompt_stats['prompt_tokens']} in {prompt_stats['calls']} calls "
+                 f"({prompt_stats['mean_prompt_tokens']} per call), "
+                 f"{prompt_stats['saved_tokens']} history tokens saved by the history policy")
+
+    from evaluation import get_evaluation_stats  # Imports pydantic, which a run only needs once agents debate
+    logging.info(f"Evaluation responses: {get_evaluation_stats()}")
+
+    equivalence_stats = get_equivalence_stats()
+    logging.info(f"Local answer comparisons: {equivalence_stats['hits']} decided, "
+                 f"{equivalence_stats['misses']} sent to the LLM "
+                 f"(hit ratio {equivalence_stats['hit_ratio']:.2%})")
+
+    if response_cache is not None:
+        logging.info(f"Response cache: {response_cache.stats()}")
+
+    if config.TRACING:
+        logging.info(f"Latency per phase:\n{report()}")
+        if config.TRACE_JSONL_PATH:
+            export_jsonl(config.TRACE_JSONL_PATH)
+        if config.TRACE_PROMETHEUS_PATH:
+            export_prometheus(config.TRACE_PROMETHEUS_PATH)
 
 if __name__ == "__main__":
         main()
@@ -0,0 +1,211 @@
+# mock_llm.py
+
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import Field, PrivateAttr
+from answers import answer_key, extract_final_answer
+from cache import current_sample_index
+
+# Probability that a solve at each capability level is correct
+DEFAULT_ACCURACY = {0: 0.3, 1: 0.4, 2: 0.5, 3: 0.6, 4: 0.75, 5: 0.9}
+# Probability that an agent adopts an answer proposed in a debate
+DEFAULT_CHANGE_PROBABILITY = {0: 0.7, 1: 0.6, 2: 0.5, 3: 0.4, 4: 0.3, 5: 0.2}
+
+# Phrases that identify which prompt a request comes from
+PROMPT_MARKERS = {
+    "solve": "solve the given problem",
+    "message": "analyzing another solution",
+    "reply": "reviewing another agent's solution",
+    "evaluation": "reviewing solution updates",
+    "compare": "comparing two mathematical solutions",
+    "assess": "verifying mathematical equivalence",
+    "repair": "repairing a malformed JSON evaluation",
+}
+
+# Prompts are a static system message followed by the variables, so fields that end the prompt run to its end
+_SOLVE_PROBLEM = re.compile(r"Current problem:\s*(.*?)\s*\n\s*\nProficiency level:", re.DOTALL)
+_PROBLEM = re.compile(r"Problem:\s*(.*?)\s*\nProficiency level:", re.DOTALL)
+_OWN_SOLUTION = re.compile(r"Your solution:\s*(.*?)\s*\nTheir solution:", re.DOTALL)
+_THEIR_SOLUTION = re.compile(r"Their solution:\s*(.*?)\s*\n(?:Their message|Discussion history):", re.DOTALL)
+_CURRENT_ANSWER = re.compile(r"Current answer:\s*(.*?)\s*\nDiscussion history:", re.DOTALL)
+_HISTORY = re.compile(r"Discussion history:\s*(.*?)\s*\Z", re.DOTALL)
+_COMPARED = re.compile(r"Solutions to compare:\s*1:\s*(.*?)\s*\n2:\s*(.*?)\s*\Z", re.DOTALL)
+_ASSESSED = re.compile(r"Agent's answer:\s*(.*?)\s*\nCorrect answer:\s*(.*?)\s*\Z", re.DOTALL)
+_PROPOSED = re.compile(r"Answer:\s*([^\n]+)")
+_MALFORMED = re.compile(r"Malformed response:\s*(.*?)\s*\Z", re.DOTALL)
+_NEW_SOLUTION = re.compile(r'"new_solution":\s*"([^"]*)"')
+
+_registry_lock = threading.Lock()
+_true_answers: Dict[str, str] = {}
+_stats: Dict[str, int] = {}
+
+def register_answer(problem: str, answer: str) -> None:
+    """Sets the correct answer the mock model uses for a problem."""
+    with _registry_lock:
+        _true_answers[problem.strip()] = str(answer)
+
+def get_mock_stats() -> Dict[str, int]:
+    """Returns the number of simulated calls per prompt kind, plus their 'total'."""
+    with _registry_lock:
+        stats = dict(_stats)
+    stats["total"] = sum(stats.values())
+    return stats
+
+def reset_mock_stats() -> None:
+    with _registry_lock:
+        _stats.clear()
+
+def _true_answer(problem: str) -> str:
+    problem = problem.strip()
+    with _registry_lock:
+        answer = _true_answers.get(problem)
+    if answer is None:
+        answer = str(int(hashlib.sha256(problem.encode("utf-8")).hexdigest(), 16) % 1000)
+    return answer
+
+def _search(pattern: re.Pattern, text: str) -> str:
+    match = pattern.search(text)
+    return match.group(1) if match else ""
+
+def _same_answer(solution1: str, solution2: str) -> bool:
+    key = answer_key(solution1)
+    return key is not None and key == answer_key(solution2)
+
+class MockChatModel(BaseChatModel):
+    """
+    Fake chat model for running experiments without an API endpoint.
+
+    It recognizes which prompt it is answering and replies in the format the agents expect:
+    solves end with an 'Answer:' line, evaluations are the JSON object `update_solution` parses.
+    Solves are correct with the capability's accuracy; in evaluations the agent adopts an answer
+    proposed in the discussion with the capability's change probability. In deterministic mode
+    every response is a function of (seed, prompt), so reruns and cache replays agree.
+    """
+
+    capability: int = 3
+    accuracy: Dict[int, float] = Field(default_factory=lambda: dict(DEFAULT_ACCURACY))
+    change_probability: Dict[int, float] = Field(default_factory=lambda: dict(DEFAULT_CHANGE_PROBABILITY))
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    stochastic: bool = False
+    seed: int = 0
+    malformed_rate: float = 0.0  # Share of evaluations returned wrapped in prose or truncated
+
+
+    _rng: Optional[random.Random] = PrivateAttr(default=None)
+    _rng_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "mock"
+
+    def _random(self, prompt: str, sample_index: int) -> random.Random:
+        if not self.stochastic:
+            digest = hashlib.sha256(f"{self.seed}|{self.capability}|{sample_index}|{prompt}".encode("utf-8")).digest()
+            return random.Random(int.from_bytes(digest[:8], "big"))
+        with self._rng_lock:
+            if self._rng is None:
+                self._rng = random.Random(self.seed)
+            return random.Random(self._rng.getrandbits(64))
+
+    def _delay(self, rng: random.Random) -> float:
+        return max(0.0, self.latency + rng.uniform(-self.latency_jitter, self.latency_jitter))
+
+    def respond(self, prompt: str, rng: random.Random) -> str:
+        """Returns the mock response to a rendered prompt."""
+        kind = next((kind for kind, marker in PROMPT_MARKERS.items() if marker in prompt), "unknown")
+        with _registry_lock:
+            _stats[kind] = _stats.get(kind, 0) + 1
+
+        if kind == "solve":
+            return self._solve(_search(_SOLVE_PROBLEM, prompt), rng)
+        if kind == "message":
+            own, theirs = _search(_OWN_SOLUTION, prompt), _search(_THEIR_SOLUTION, prompt)
+            own_answer = extract_final_answer(own) or own
+            if _same_answer(own, theirs):
+                return f"Solutions mathematically equivalent\nAnswer: {own_answer}"
+            return f"Results differ: {own_answer} vs {extract_final_answer(theirs) or theirs}\nAnswer: {own_answer}"
+        if kind == "reply":
+            own, theirs = _search(_OWN_SOLUTION, prompt), _search(_THEIR_SOLUTION, prompt)
+            own_answer = extract_final_answer(own) or own
+            if _same_answer(own, theirs):
+                return f"Agree\nAnswer: {own_answer}"
+            return f"Error in their result\nAnswer: {own_answer}"
+        if kind == "evaluation":
+            return self._evaluate(prompt, rng)
+        if kind == "compare":
+            match = _COMPARED.search(prompt)
+            return "Yes" if match and _same_answer(match.group(1), match.group(2)) else "No"
+        if kind == "assess":
+            match = _ASSESSED.search(prompt)
+            return "Yes" if match and _same_answer(match.group(1), match.group(2)) else "No"
+        if kind == "repair":
+            malformed = _search(_MALFORMED, prompt)
+            new_solution = _search(_NEW_SOLUTION, malformed)
+            return json.dumps({"solution_changed": False, "new_solution": new_solution,
+                               "confidence": 50, "reasoning": "Repaired response"})
+        return "Answer: 0"
+
+    def _solve(self, problem: str, rng: random.Random) -> str:
+        truth = _true_answer(problem)
+        if rng.random() < self.accuracy.get(self.capability, 0.5):
+            answer = truth
+        else:
+            try:
+                answer = str(int(float(truth)) + rng.choice([-1, 1]) * rng.randint(1, 20))
+            except ValueError:
+                answer = f"{truth}+{rng.randint(1, 20)}"
+        return f"1. Compute the quantities\n2. Combine them\n\nAnswer: {answer}"
+
+    def _evaluate(self, prompt: str, rng: random.Random) -> str:
+        current = _search(_CURRENT_ANSWER, prompt)
+        current_answer = extract_final_answer(current) or current.strip()
+        truth = _true_answer(_search(_PROBLEM, prompt))
+        proposals = [answer.strip() for answer in _PROPOSED.findall(_search(_HISTORY, prompt))]
+        alternatives = [answer for answer in proposals if not _same_answer(answer, current_answer)]
+
+        change_probability = self.change_probability.get(self.capability, 0.5)
+        if _same_answer(current_answer, truth):
+            # Capable agents hold on to correct answers
+            change_probability *= 1.0 - self.accuracy.get(self.capability, 0.5)
+        changed = bool(alternatives) and rng.random() < change_probability
+        new_solution = alternatives[-1] if changed else current_answer
+        response = json.dumps({
+            "solution_changed": changed,
+            "new_solution": new_solution,
+            "confidence": rng.randint(60, 100),
+            "reasoning": "Adopted proposed result" if changed else "Current result holds"
+        }, indent=4)
+        if self.malformed_rate and rng.random() < self.malformed_rate:
+            if rng.random() < 0.5:
+                return f"Here is my evaluation:\n```json\n{response}\n```"
+            return response[:len(response) // 2]
+        return response
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, n: int = 1, **kwargs: Any) -> ChatResult:
+        """With `n`, returns n samples, the i-th as if it were requested on its own at sample index current + i."""
+        prompt = "\n".join(str(message.content) for message in messages)
+        rngs = [self._random(prompt, current_sample_index() + offset) for offset in range(n)]
+        delay = max(self._delay(rng) for rng in rngs)  # One request, as slow as its slowest sample
+        if delay:
+            time.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.respond(prompt, rng))) for rng in rngs])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, n: int = 1, **kwargs: Any) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        rngs = [self._random(prompt, current_sample_index() + offset) for offset in range(n)]
+        delay = max(self._delay(rng) for rng in rngs)  # One request, as slow as its slowest sample
+        if delay:
+            await asyncio.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.respond(prompt, rng))) for rng in rngs])
@@ -1,71 +1,318 @@
-import networkx as nx
-from agent import Agent
-from typing import Dict, Tuple
+import bisect
+from collections.abc import Mapping, MutableMapping, Sequence
+from agent import Agent, AgentStates
+from answers import answer_key
+from topology import CompactAdjacency
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple
+
+class _PairSequence(Sequence):
+    """The (agent, neighbor) pairs of a CompactAdjacency, in debate order, without materializing them."""
+
+    def __init__(self, adjacency: CompactAdjacency):
+        self._adjacency = adjacency
+
+    def __len__(self) -> int:
+        return len(self._adjacency.indices)
+
+    def __getitem__(self, position: int) -> Tuple[Hashable, Hashable]:
+        return self._adjacency.pair_at(position)
+
+    def __iter__(self) -> Iterator[Tuple[Hashable, Hashable]]:
+        adjacency = self._adjacency
+        ids, indices, indptr = adjacency.ids, adjacency.indices, adjacency.indptr
+        for row, agent_id in enumerate(ids):
+            for position in range(indptr[row], indptr[row + 1]):
+                yield agent_id, ids[indices[position]]
+
+class _PairPositions(Mapping):
+    """(agent, neighbor) pair -> position in the debate order, looked up in a CompactAdjacency."""
+
+    def __init__(self, adjacency: CompactAdjacency):
+        self._adjacency = adjacency
+
+    def __getitem__(self, pair: Tuple[Hashable, Hashable]) -> int:
+        return self._adjacency.pair_position(*pair)
+
+    def __iter__(self) -> Iterator[Tuple[Hashable, Hashable]]:
+        return iter(_PairSequence(self._adjacency))
+
+    def __len__(self) -> int:
+        return len(self._adjacency.indices)
+
+class EdgeAgreements(MutableMapping):
+    """
+    Agreement of every edge of a CompactAdjacency, one byte per edge, behind the dict interface of
+    `Network.agreement_status`. Its keys are always exactly the edges; clear() marks them all as
+    disagreeing.
+    """
+
+    def __init__(self, adjacency: CompactAdjacency):
+        self._adjacency = adjacency
+        self._agree = bytearray(adjacency.edge_count)
+
+    def __getitem__(self, key: Tuple[Hashable, Hashable]) -> bool:
+        return bool(self._agree[self._adjacency.edge_id(*key)])
+
+    def __setitem__(self, key: Tuple[Hashable, Hashable], agree: bool) -> None:
+        self._agree[self._adjacency.edge_id(*key)] = agree
+
+    def __delitem__(self, key: Tuple[Hashable, Hashable]) -> None:
+        raise TypeError("The edges of a compact network are fixed")
+
+    def __iter__(self) -> Iterator[Tuple[Hashable, Hashable]]:
+        return (self._adjacency.edge_key(edge_id) for edge_id in range(len(self._agree)))
+
+    def __len__(self) -> int:
+        return len(self._agree)
+
+    def clear(self) -> None:
+        self._agree[:] = bytes(len(self._agree))
 
 class Network:
-    def __init__(self, config):
-        self.graph = nx.Graph()
+    def __init__(self, config, compact: bool = False):
+        """
+        Args:
+            config (Dict): Graph configuration with 'nodes' and 'edges' (see config.GRAPH_CONFIGS)
+            compact (bool): Store the graph as a CompactAdjacency (CSR arrays) and agreements as one
+                byte per edge instead of a networkx graph and a dict, for large agent populations
+        """
+        self.compact = compact
+        if compact:
+            self.graph = None
+        else:
+            import networkx as nx  # Only the networkx-backed layout needs it
+            self.graph = nx.Graph()
+        self.adjacency: Optional[CompactAdjacency] = None
         self.agents: Dict[str, Agent] = {}
-        self.agreement_status: Dict[Tuple[str, str], bool] = {}
+        self.states: Optional[AgentStates] = None
+        self.agreement_status: MutableMapping = {}
+
+        # Incremental bookkeeping, kept up to date by update_agreement and the agents' observers:
+        # - debate_pairs: (agent, neighbor) pairs in the order run_debates visits them
+        # - _candidates: sorted positions in debate_pairs of active, disagreeing pairs
+        # - _agreeing_active_edges: edges whose agents are both active and agree
+        # - answer_clusters: number of active agents per canonical answer
+        self.debate_pairs: Sequence = []
+        self._pair_positions: Mapping = {}
+        self._candidates: List[int] = []
+        self._active_count = 0
+        self._agreeing_active_edges = 0
+        self._answer_keys: Dict[str, Optional[Hashable]] = {}
+        self.answer_clusters: Dict[Hashable, int] = {}
+        self._tracking = False
+
         self.init_agents(config['nodes'])
         self.init_edges(config['edges'])
         self.init_agreements()
 
     def init_agents(self, nodes):
         self.agents.clear()
-        self.graph.clear()
-        for node in nodes:
-            agent = Agent(agent_id=node['id'], capability=node['capability'])
+        if self.graph is not None:
+            self.graph.clear()
+        self.states = AgentStates([node['capability'] for node in nodes])
+        for slot, node in enumerate(nodes):
+            agent = Agent(agent_id=node['id'], capability=node['capability'], states=self.states, slot=slot)
+            agent._observer = self
             self.agents[node['id']] = agent
-            self.graph.add_node(node['id'])
+            if self.graph is not None:
+                self.graph.add_node(node['id'])
 
     def init_edges(self, edges):
+        if self.compact:
+            self.adjacency = CompactAdjacency(list(self.agents), edges)
+            self.debate_pairs = _PairSequence(self.adjacency)
+            self._pair_positions = _PairPositions(self.adjacency)
+            self.agreement_status = EdgeAgreements(self.adjacency)
+            return
         self.graph.add_edges_from(edges)
+        self.debate_pairs = [(agent_id, neighbor_id)
+                             for agent_id in self.agents
+                             for neighbor_id in self.get_neighbors(agent_id)]
+        self._pair_positions = {pair: position for position, pair in enumerate(self.debate_pairs)}
 
     def init_agreements(self):
         # Initialize agreement status between connected agents
+        if self.compact:
+            self.agreement_status.clear()
+            self._rebuild_tracking()
+            return
         for agent_id in self.agents:
             for neighbor_id in self.get_neighbors(agent_id):
                 key = tuple(sorted([agent_id, neighbor_id]))
                 self.agreement_status[key] = False  # Initially, agents do not agree
+        self._rebuild_tracking()
 
     def reset(self):
         """
         Resets the network state while preserving the graph structure.
-        1. Calls reset() on each agent
+        1. Resets every agent's state in bulk
         2. Resets agreement status
         """
-        # Reset all agents
-        for agent in self.agents.values():
-            agent.reset()
-        
+        self._tracking = False
+
+        # Reset all agents; no observer runs, the bookkeeping is reset below
+        self.states.reset()
+
         # Reset agreement status while keeping the same connections
-        self.agreement_status.clear()
-        self.init_agreements()
+        if self.compact:
+            self.agreement_status.clear()
+        else:
+            self.agreement_status = dict.fromkeys(self.agreement_status, False)
+
+        # Every agent is now active without an answer and every edge disagrees, so the bookkeeping is
+        # known without scanning the pairs
+        self._active_count = len(self.agents)
+        self._agreeing_active_edges = 0
+        self._candidates = list(range(len(self.debate_pairs)))
+        self._answer_keys = {}
+        self.answer_clusters = {}
+        self._tracking = True
 
     def get_agent(self, agent_id):
         return self.agents[agent_id]
 
     def get_neighbors(self, agent_id):
+        if self.adjacency is not None:
+            ids = self.adjacency.ids
+            return [ids[row] for row in self.adjacency.neighbor_rows(self.adjacency.rows[agent_id])]
         return list(self.graph.neighbors(agent_id))
 
+    @staticmethod
+    def _edge_key(agent_id1, agent_id2):
+        return (agent_id1, agent_id2) if agent_id1 <= agent_id2 else (agent_id2, agent_id1)
+
     def update_agreement(self, agent_id1, agent_id2, agree: bool):
-        key = tuple(sorted([agent_id1, agent_id2]))
+        key = self._edge_key(agent_id1, agent_id2)
+        previous = self.agreement_status.get(key, False)
         self.agreement_status[key] = agree
+        if (self._tracking and previous != agree and (agent_id1, agent_id2) in self._pair_positions
+                and self._both_active(agent_id1, agent_id2)):
+            if agree:
+                self._agreeing_active_edges += 1
+                self._set_candidate(agent_id1, agent_id2, False)
+            else:
+                self._agreeing_active_edges -= 1
+                self._set_candidate(agent_id1, agent_id2, True)
 
     def agents_disagree(self, agent_id1, agent_id2):
-        key = tuple(sorted([agent_id1, agent_id2]))
+        key = self._edge_key(agent_id1, agent_id2)
         return not self.agreement_status.get(key, False)
 
     def is_network_settled(self):
-        # The network is settled when all active agents agree with each other (excluding inactive agents)
-        active_agents = [agent_id for agent_id, agent in self.agents.items() if agent.active]
-        if len(active_agents) <= 1:
+        # The network is settled when all active agents agree with each other (excluding inactive agents).
+        # Only neighbors can agree, so this holds iff every pair of active agents is an agreeing edge.
+        active_count = self._active_count
+        if active_count <= 1:
             return True
-        for i in range(len(active_agents)):
-            for j in range(i+1, len(active_agents)):
-                agent_id1 = active_agents[i]
-                agent_id2 = active_agents[j]
-                if self.agents_disagree(agent_id1, agent_id2):
-                    return False
-        return True
\ No newline at end of file
+        return self._agreeing_active_edges == active_count * (active_count - 1) // 2
+
+    def disagreeing_edge_count(self) -> int:
+        """Number of edges between active agents that disagree."""
+        return len(self._candidates) // 2
+
+    def next_debate_pair(self, after: int = -1) -> Optional[int]:
+        """
+        Returns the position in `debate_pairs` of the first active, disagreeing pair after the given
+        position, or None if there is none.
+        """
+        index = bisect.bisect_right(self._candidates, after)
+        return self._candidates[index] if index < len(self._candidates) else None
+
+    def has_disagreeing_neighbor_after(self, agent_id, position: int) -> bool:
+        """Checks whether a pair of the agent after `position` has an active neighbor that disagrees with it."""
+        for neighbor_id in self.get_neighbors(agent_id):
+            if (self._pair_positions[(agent_id, neighbor_id)] > position
+                    and self.agents[neighbor_id].active
+                    and self.agents_disagree(agent_id, neighbor_id)):
+                return True
+        return False
+
+    def candidate_edges(self) -> Iterator[Tuple[Hashable, Hashable]]:
+        """Yields every edge between active, disagreeing agents once, as its first pair in `debate_pairs`."""
+        for position in list(self._candidates):
+            agent_id, neighbor_id = self.debate_pairs[position]
+            if self._pair_positions[(neighbor_id, agent_id)] > position:
+                yield agent_id, neighbor_id
+
+    def disagreeing_neighbors(self, agent_id) -> List[Hashable]:
+        """Active neighbors of an active agent that disagree with it."""
+        if not self.agents[agent_id].active:
+            return []
+        return [neighbor_id for neighbor_id in self.get_neighbors(agent_id)
+                if self.agents[neighbor_id].active and self.agents_disagree(agent_id, neighbor_id)]
+
+    def get_answer_key(self, agent_id) -> Optional[Hashable]:
+        """Canonical final answer of an active agent (see answers.answer_key), or None."""
+        return self._answer_keys.get(agent_id)
+
+    def on_answer_change(self, agent: Agent, old_answer: Optional[str], new_answer: Optional[str]) -> None:
+        if not self._tracking or not agent.active:
+            return
+        self._remove_from_cluster(agent.agent_id)
+        self._add_to_cluster(agent.agent_id, new_answer)
+
+    def on_active_change(self, agent: Agent) -> None:
+        if not self._tracking:
+            return
+        agent_id = agent.agent_id
+        if agent.active:
+            self._active_count += 1
+            self._add_to_cluster(agent_id, agent.answer)
+        else:
+            self._active_count -= 1
+            self._remove_from_cluster(agent_id)
+
+        for neighbor_id in self.get_neighbors(agent_id):
+            if not self.agents[neighbor_id].active:
+                continue
+            if self.agents_disagree(agent_id, neighbor_id):
+                self._set_candidate(agent_id, neighbor_id, agent.active)
+            else:
+                self._agreeing_active_edges += 1 if agent.active else -1
+
+    def _both_active(self, agent_id1, agent_id2) -> bool:
+        return self.agents[agent_id1].active and self.agents[agent_id2].active
+
+    def _set_candidate(self, agent_id1, agent_id2, candidate: bool) -> None:
+        for pair in ((agent_id1, agent_id2), (agent_id2, agent_id1)):
+            position = self._pair_positions.get(pair)
+            if position is None:
+                continue
+            index = bisect.bisect_left(self._candidates, position)
+            present = index < len(self._candidates) and self._candidates[index] == position
+            if candidate and not present:
+                self._candidates.insert(index, position)
+            elif not candidate and present:
+                del self._candidates[index]
+
+    def _add_to_cluster(self, agent_id, answer: Optional[str]) -> None:
+        key = answer_key(answer) if answer else None
+        self._answer_keys[agent_id] = key
+        if key is not None:
+            self.answer_clusters[key] = self.answer_clusters.get(key, 0) + 1
+
+    def _remove_from_cluster(self, agent_id) -> None:
+        key = self._answer_keys.pop(agent_id, None)
+        if key is not None:
+            self.answer_clusters[key] -= 1
+            if self.answer_clusters[key] == 0:
+                del self.answer_clusters[key]
+
+    def _rebuild_tracking(self) -> None:
+        """Recomputes all incremental bookkeeping from scratch."""
+        self._active_count = 0
+        self._agreeing_active_edges = 0
+        self._candidates = []
+        self._answer_keys = {}
+        self.answer_clusters = {}
+        for agent_id, agent in self.agents.items():
+            if agent.active:
+                self._active_count += 1
+                self._add_to_cluster(agent_id, agent.answer)
+        for position, (agent_id, neighbor_id) in enumerate(self.debate_pairs):
+            if self._both_active(agent_id, neighbor_id):
+                if self.agents_disagree(agent_id, neighbor_id):
+                    self._candidates.append(position)
+                elif agent_id <= neighbor_id:
+                    self._agreeing_active_edges += 1
+        self._tracking = True
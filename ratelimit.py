@@ -0,0 +1,403 @@
+# ratelimit.py
+
+import asyncio
+import collections
+import logging
+import random
+import sys
+import threading
+import time
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+import config
+import tracing
+
+class TokenBucket:
+    """
+    Per-minute budget (requests or tokens) refilled continuously.
+
+    Callers reserve what they need and wait the returned delay, so the bucket may go into debt
+    and later callers queue up behind earlier ones instead of racing for the refill.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self._level = float(per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Takes `amount` from the bucket and returns how many seconds to wait before using it."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+            self._updated = now
+            self._level -= amount
+            return -self._level / self.rate if self._level < 0 else 0.0
+
+    def adjust(self, amount: float) -> None:
+        """Gives back (positive) or takes (negative) the difference between a reservation and actual use."""
+        with self._lock:
+            self._level = min(self.capacity, self._level + amount)
+
+class _Waiter:
+    """A caller queued for an in-flight slot, woken from whichever thread releases one."""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def wake(self) -> None:
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if not self.future.done():
+            self.future.set_result(None)
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def classify_error(error: Exception) -> Optional[str]:
+    """
+    Classifies an exception raised by an LLM call.
+
+    Returns:
+        Optional[str]: 'throttled' (HTTP 429), 'timeout', 'transient' (connection errors, 5xx),
+        or None if the call should not be retried
+    """
+    # An httpx or openai error implies its module is loaded; never import one just to classify
+    httpx, openai = sys.modules.get("httpx"), sys.modules.get("openai")
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return "timeout"
+    if openai is not None:
+        if isinstance(error, openai.RateLimitError):
+            return "throttled"
+        if isinstance(error, openai.APITimeoutError):
+            return "timeout"
+        if isinstance(error, (openai.APIConnectionError, openai.InternalServerError)):
+            return "transient"
+    if httpx is None:
+        return None
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        if status == 429:
+            return "throttled"
+        return "transient" if status >= 500 else None
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.TransportError):
+        return "transient"
+    return None
+
+class EndpointLimiter:
+    """
+    Rate limiter and adaptive concurrency controller shared by all calls to one (endpoint, model).
+
+    Every call first reserves one request and its estimated tokens from the requests/min and
+    tokens/min buckets, then waits for a slot in the in-flight window. The window follows AIMD:
+    it grows by about one slot per window of fast successes, and shrinks multiplicatively on 429s,
+    timeouts and responses slower than the latency target, at most once per cooldown. Retryable
+    errors are retried with full-jitter exponential backoff, honoring Retry-After when present.
+    """
+
+    def __init__(self, endpoint: str, model: str,
+                 requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None,
+                 initial_window: int = 4,
+                 min_window: int = 1,
+                 max_window: int = 64,
+                 latency_target: Optional[float] = None,
+                 max_retries: int = 5,
+                 backoff_base: float = 1.0,
+                 backoff_max: float = 60.0):
+        self.endpoint = endpoint
+        self.model = model
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.min_window = max(1, min_window)
+        self.max_window = max(self.min_window, max_window)
+        self.window = float(min(max(initial_window, self.min_window), self.max_window))
+        self.latency_target = latency_target
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiters: Deque[_Waiter] = collections.deque()
+        self._last_decrease = 0.0
+        self._latency = None  # Exponentially weighted moving average, in seconds
+        self._rng = random.Random()
+        self._stats = {
+            "requests": 0,
+            "failures": 0,
+            "retries": 0,
+            "throttled": 0,
+            "timeouts": 0,
+            "window_decreases": 0,
+            "max_queue_depth": 0,
+            "budget_wait_s": 0.0,
+            "queue_wait_s": 0.0,
+        }
+
+    # ---- In-flight window ----
+
+    def _limit(self) -> int:
+        return max(self.min_window, int(self.window))
+
+    def _try_acquire(self, waiter_factory: Callable[[], _Waiter]) -> Optional[_Waiter]:
+        with self._lock:
+            if not self._waiters and self._in_flight < self._limit():
+                self._in_flight += 1
+                return None
+            waiter = waiter_factory()
+            self._waiters.append(waiter)
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._waiters))
+            return waiter
+
+    def _acquire(self) -> None:
+        waiter = self._try_acquire(_Waiter)
+        if waiter is not None:
+            start = time.monotonic()
+            waiter.event.wait()
+            self._add_stat("queue_wait_s", time.monotonic() - start)
+
+    async def _aacquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        waiter = self._try_acquire(lambda: _Waiter(loop))
+        if waiter is None:
+            return
+        start = time.monotonic()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter not in self._waiters
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:
+                self._release()
+            raise
+        self._add_stat("queue_wait_s", time.monotonic() - start)
+
+    def _release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._grant_locked()
+
+    def _grant_locked(self) -> None:
+        while self._waiters and self._in_flight < self._limit():
+            self._in_flight += 1
+            self._waiters.popleft().wake()
+
+    # ---- AIMD ----
+
+    def _on_success(self, latency: float) -> None:
+        with self._lock:
+            self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+            if self.latency_target is not None and latency > self.latency_target:
+                self._decrease_locked(0.9)
+            else:
+                self.window = min(self.max_window, self.window + 1.0 / self.window)
+                self._grant_locked()
+
+    def _on_congestion(self, kind: str) -> None:
+        with self._lock:
+            self._stats["throttled" if kind == "throttled" else "timeouts"] += 1
+            self._decrease_locked(0.5)
+
+    def _decrease_locked(self, factor: float) -> None:
+        # One decrease per cooldown, so a burst of errors from the same window only counts once
+        now = time.monotonic()
+        cooldown = self._latency if self._latency is not None else 1.0
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        self.window = max(float(self.min_window), self.window * factor)
+        self._stats["window_decreases"] += 1
+
+    # ---- Calls ----
+
+    def _reserve(self, estimated_tokens: int) -> float:
+        delay = self.requests.reserve(1) if self.requests is not None else 0.0
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.reserve(estimated_tokens))
+        if delay:
+            self._add_stat("budget_wait_s", delay)
+        return delay
+
+    def _settle(self, estimated_tokens: int, used_tokens: Optional[int]) -> None:
+        if self.tokens is not None and used_tokens is not None:
+            self.tokens.adjust(estimated_tokens - used_tokens)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = self._rng.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = _retry_after(error)
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    def retry_delay(self, attempt: int, error: Exception) -> float:
+        """
+        Records a failed attempt and returns the backoff before the next one. Re-raises the error
+        if it is not retryable or `attempt` was the last one.
+        """
+        kind = classify_error(error)
+        if kind in ("throttled", "timeout"):
+            self._on_congestion(kind)
+        if kind is None or attempt >= self.max_retries:
+            self._add_stat("failures", 1)
+            raise error
+        self._add_stat("retries", 1)
+        tracing.add("retries")
+        delay = self._backoff(attempt, error)
+        logging.warning(f"LLM call to {self.model} at {self.endpoint or 'default endpoint'} failed ({kind}: "
+                        f"{type(error).__name__}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+        return delay
+
+    def attempt(self, fn: Callable[[], Any], estimated_tokens: int = 0,
+                used_tokens: Callable[[Any], Optional[int]] = lambda result: None) -> Any:
+        """
+        Runs `fn` once within the budgets and the in-flight window. Errors propagate; pass them to
+        `retry_delay` to adapt the window and decide on a retry.
+
+        Args:
+            fn (Callable[[], Any]): The LLM call
+            estimated_tokens (int): Tokens reserved from the tokens/min budget before the call
+            used_tokens (Callable[[Any], Optional[int]]): Actual tokens of a result, if known
+
+        Returns:
+            Any: The result of `fn`
+        """
+        delay = self._reserve(estimated_tokens)
+        if delay:
+            time.sleep(delay)
+        self._acquire()
+        self._add_stat("requests", 1)
+        start = time.monotonic()
+        try:
+            result = fn()
+        except BaseException:
+            self._release()
+            raise
+        self._on_success(time.monotonic() - start)
+        self._release()
+        self._settle(estimated_tokens, used_tokens(result))
+        return result
+
+    async def aattempt(self, fn: Callable[[], Awaitable[Any]], estimated_tokens: int = 0,
+                       used_tokens: Callable[[Any], Optional[int]] = lambda result: None) -> Any:
+        """Async version of `attempt`."""
+        delay = self._reserve(estimated_tokens)
+        if delay:
+            await asyncio.sleep(delay)
+        await self._aacquire()
+        self._add_stat("requests", 1)
+        start = time.monotonic()
+        try:
+            result = await fn()
+        except BaseException:
+            self._release()
+            raise
+        self._on_success(time.monotonic() - start)
+        self._release()
+        self._settle(estimated_tokens, used_tokens(result))
+        return result
+
+    def call(self, fn: Callable[[], Any], estimated_tokens: int = 0,
+             used_tokens: Callable[[Any], Optional[int]] = lambda result: None) -> Any:
+        """
+        Runs `fn` within the budgets and the in-flight window, retrying retryable errors.
+
+        Args:
+            fn (Callable[[], Any]): The LLM call
+            estimated_tokens (int): Tokens reserved from the tokens/min budget before the call
+            used_tokens (Callable[[Any], Optional[int]]): Actual tokens of a result, if known
+
+        Returns:
+            Any: The result of `fn`
+        """
+        attempt = 0
+        while True:
+            try:
+                return self.attempt(fn, estimated_tokens, used_tokens)
+            except Exception as error:
+                delay = self.retry_delay(attempt, error)
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], estimated_tokens: int = 0,
+                    used_tokens: Callable[[Any], Optional[int]] = lambda result: None) -> Any:
+        """Async version of `call`."""
+        attempt = 0
+        while True:
+            try:
+                return await self.aattempt(fn, estimated_tokens, used_tokens)
+            except Exception as error:
+                delay = self.retry_delay(attempt, error)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _add_stat(self, name: str, amount: float) -> None:
+        with self._lock:
+            self._stats[name] += amount
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the current queue depth, in-flight count and window, and the throttle counters."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                "queue_depth": len(self._waiters),
+                "in_flight": self._in_flight,
+                "window": round(self.window, 2),
+                "latency_s": round(self._latency, 3) if self._latency is not None else None,
+            })
+        stats["budget_wait_s"] = round(stats["budget_wait_s"], 3)
+        stats["queue_wait_s"] = round(stats["queue_wait_s"], 3)
+        return stats
+
+# Per-process limiters, keyed by (endpoint, model)
+_limiters_lock = threading.Lock()
+_limiters: Dict[Tuple[str, str], EndpointLimiter] = {}
+
+def get_limiter(endpoint: str, model: str) -> EndpointLimiter:
+    """Returns the limiter shared by all calls to a model on an endpoint, creating it from config.py once."""
+    key = (endpoint, model)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(key)
+            if limiter is None:
+                limiter = EndpointLimiter(
+                    endpoint, model,
+                    requests_per_minute=config.RATE_LIMIT_REQUESTS_PER_MINUTE,
+                    tokens_per_minute=config.RATE_LIMIT_TOKENS_PER_MINUTE,
+                    initial_window=config.INITIAL_IN_FLIGHT_REQUESTS,
+                    max_window=config.MAX_IN_FLIGHT_REQUESTS,
+                    latency_target=config.LLM_LATENCY_TARGET,
+                    max_retries=config.LLM_MAX_RETRIES,
+                    backoff_base=config.LLM_BACKOFF_BASE,
+                    backoff_max=config.LLM_BACKOFF_MAX,
+                )
+                _limiters[key] = limiter
+    return limiter
+
+def reset_limiters() -> None:
+    with _limiters_lock:
+        _limiters.clear()
+
+def get_rate_limit_stats() -> Dict[str, Dict[str, Any]]:
+    """Returns each limiter's stats, keyed by 'model@endpoint'."""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {f"{limiter.model}@{limiter.endpoint or 'default'}": limiter.stats() for limiter in limiters}
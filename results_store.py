@@ -0,0 +1,112 @@
+# results_store.py
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Hashable, Iterator, Optional, Set, Tuple
+
+class ResultsStore:
+    """
+    Append-only JSONL log of experiment outcomes, one record per (graph, problem).
+
+    Every record is flushed and fsynced as soon as it is appended, so a crash loses at most the
+    problems still in flight. A record cut short by a crash is dropped when the store is reopened.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._drop_partial_record()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _drop_partial_record(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            # Truncate after the last complete line
+            position = size
+            while position > 0:
+                step = min(4096, position)
+                f.seek(position - step)
+                newline = f.read(step).rfind(b"\n")
+                if newline != -1:
+                    position = position - step + newline + 1
+                    break
+                position -= step
+            f.truncate(position)
+            logging.warning(f"Dropped a partial record at the end of {self.path}")
+
+    def append(self, record: Dict) -> None:
+        """Writes one outcome record and makes it durable."""
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def records(self) -> Iterator[Dict]:
+        """Iterates over the stored records without loading the whole file."""
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def completed_units(self) -> Set[Tuple[str, Hashable]]:
+        """The (graph, problem id) pairs that already have a record."""
+        return {(record["graph"], record["problem_id"]) for record in self.records()}
+
+    def summarize(self, grade: Optional[Callable[[Dict], Dict[str, bool]]] = None) -> Dict[str, Dict]:
+        """
+        Aggregates the stored records per graph in one streaming pass.
+
+        Args:
+            grade (Optional[Callable[[Dict], Dict[str, bool]]]): Re-grades a record, returning each
+                agent's correctness; the stored grades are used if None
+
+        Returns:
+            Dict[str, Dict]: Graph name -> problems, correct and total agent answers, percentage
+            correct, per-agent correct counts, LLM calls and elapsed seconds
+        """
+        summaries: Dict[str, Dict] = {}
+        for record in self.records():
+            summary = summaries.setdefault(record["graph"], {
+                "problems": 0, "correct": 0, "answers": 0, "agent_correct": {},
+                "llm_calls": 0, "elapsed_s": 0.0,
+            })
+            summary["problems"] += 1
+            correct = grade(record) if grade is not None else record["correct"]
+            for agent_id, is_correct in correct.items():
+                summary["answers"] += 1
+                summary["correct"] += int(is_correct)
+                summary["agent_correct"][agent_id] = summary["agent_correct"].get(agent_id, 0) + int(is_correct)
+            summary["llm_calls"] += record.get("llm_calls", 0)
+            summary["elapsed_s"] += record.get("elapsed_s", 0.0)
+        for summary in summaries.values():
+            summary["percentage"] = 100 * summary["correct"] / summary["answers"] if summary["answers"] else 0.0
+        return summaries
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+def open_results_store(path: str, resume: bool) -> ResultsStore:
+    """
+    Opens the results store of a run. Without `resume`, existing results are moved aside to a
+    timestamped file instead of being appended to.
+    """
+    if not resume and os.path.exists(path) and os.path.getsize(path) > 0:
+        previous = f"{path}.{time.strftime('%Y%m%d-%H%M%S')}"
+        os.replace(path, previous)
+        logging.warning(f"Existing results moved to {previous}; pass --resume to continue them instead.")
+    return ResultsStore(path)
@@ -0,0 +1,209 @@
+# runner.py
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+from network import Network
+from debate import agree_on_matching_answers, run_debates, run_debates_async, run_debates_prioritized
+from scoring import score_network
+from sweep import InitialSolvePlan
+from cache import configure_response_cache, get_response_cache, sampling
+from llm import get_llm_backend, get_llm_backend_options, set_llm_backend, tracking_calls
+from tracing import Span, configure_tracing, get_tracer, tagged
+import config
+
+WORKER_POOLS = ("thread", "process")
+
+class ProblemRunner:
+    """Runs the problems of one graph, one at a time, on its own Network instance."""
+
+    def __init__(self, graph_name: str, graph_config: Dict, solve_plan: InitialSolvePlan, async_debates: bool):
+        self.graph_name = graph_name
+        self.solve_plan = solve_plan
+        self.network = Network(graph_config, compact=config.COMPACT_NETWORK)
+        # One event loop per runner, so pooled async HTTP connections stay usable across problems
+        self.loop = asyncio.new_event_loop() if async_debates else None
+
+    def run(self, problem_data: Dict, seed: int = 0) -> Dict:
+        """
+        Solves, debates and grades one problem. A nonzero seed runs an independent replicate: other
+        initial solves (see InitialSolvePlan) and debate calls under sample index `seed`.
+
+        Returns:
+            Dict: The outcome record: each agent's correctness, final answer and debate rounds, the
+            agreement snapshot, debate passes, LLM calls and timings
+        """
+        with tracking_calls() as call_stats, tagged(graph=self.graph_name, problem=problem_data['id']):
+            start = time.perf_counter()
+            with sampling(seed):
+                record = self._run(problem_data, seed)
+            record["elapsed_s"] = round(time.perf_counter() - start, 3)
+            record.update(call_stats.as_dict())
+        return record
+
+    def _run(self, problem_data: Dict, seed: int) -> Dict:
+        network = self.network
+        max_rounds_per_pair = config.MAX_DEBATE_ROUNDS_PER_PAIR
+        network.reset()
+        logging.info(f"\n========== Problem {problem_data['id']} on graph \"{self.graph_name}\" ==========\n{problem_data['problem']}\n========================================")
+        problem = problem_data['problem']
+
+        # Each agent solves the problem initially
+        start = time.perf_counter()
+        self.solve_plan.assign(network, self.graph_name, problem_data, seed)
+        # network.reset() already reactivated the agents and cleared their rounds; drop the solve memories
+        network.states.clear_memories()
+
+        solve_time = time.perf_counter() - start
+
+        if config.PRE_DEBATE_CLUSTERING:
+            agree_on_matching_answers(network)
+
+        # Run the debates among agents
+        start = time.perf_counter()
+        if config.DEBATE_SCHEDULER == 'priority':
+            passes = run_debates_prioritized(network, problem, max_rounds_per_pair,
+                                             parallel_evaluation=config.PARALLEL_EVALUATIONS,
+                                             max_passes=config.MAX_DEBATE_PASSES,
+                                             cluster_answers=config.PRE_DEBATE_CLUSTERING)
+        elif self.loop is not None:
+            passes = self.loop.run_until_complete(run_debates_async(network, problem, max_rounds_per_pair,
+                                                                    max_concurrency=config.MAX_CONCURRENT_DEBATES,
+                                                                    parallel_evaluation=config.PARALLEL_EVALUATIONS,
+                                                                    max_passes=config.MAX_DEBATE_PASSES))
+        else:
+            passes = run_debates(network, problem, max_rounds_per_pair,
+                                 parallel_evaluation=config.PARALLEL_EVALUATIONS,
+                                 max_passes=config.MAX_DEBATE_PASSES)
+        debate_time = time.perf_counter() - start
+
+        # Check correctness of each agent's final answer
+        correctness = score_network(network, problem_data, llm_fallback=config.LLM_GRADING_FALLBACK)
+        return {
+            "graph": self.graph_name,
+            "problem_id": problem_data['id'],
+            "correct": correctness,
+            "final_answers": {agent_id: agent.answer for agent_id, agent in network.agents.items()},
+            "debate_rounds": {agent_id: agent.total_debate_rounds for agent_id, agent in network.agents.items()},
+            "agreement": {f"{agent_id1}-{agent_id2}": agree
+                          for (agent_id1, agent_id2), agree in network.agreement_status.items()},
+            "passes": passes,
+            "settled": network.is_network_settled(),
+            "solve_s": round(solve_time, 3),
+            "debate_s": round(debate_time, 3),
+        }
+
+    def close(self) -> None:
+        if self.loop is not None:
+            self.loop.close()
+            self.loop = None
+
+# State of a process-pool worker, set up once per process by _init_process_worker
+_process_runner: Optional[ProblemRunner] = None
+
+def _init_process_worker(graph_name: str, graph_config: Dict, solve_plan: InitialSolvePlan, async_debates: bool,
+                         backend: Tuple[str, Dict], cache_settings: Optional[Tuple[str, str, int]],
+                         tracing_enabled: bool) -> None:
+    global _process_runner
+    set_llm_backend(backend[0], **backend[1])
+    configure_tracing(tracing_enabled)
+    if cache_settings is not None:
+        configure_response_cache(*cache_settings)
+    _process_runner = ProblemRunner(graph_name, graph_config, solve_plan, async_debates)
+
+def _run_in_process(problem_data: Dict) -> Tuple[Dict, List[Span]]:
+    # The spans of the problem are handed back with its record, so the parent's tracer sees them
+    record = _process_runner.run(problem_data)
+    tracer = get_tracer()
+    spans = tracer.spans
+    tracer.clear()
+    return record, spans
+
+def run_graph(graph_name: str, graph_config: Dict, problems: List[Dict], solve_plan: InitialSolvePlan,
+              workers: int = 1, pool: str = "thread",
+              on_result: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    """
+    Runs every problem on one graph and collects their outcome records (see ProblemRunner.run).
+
+    With more than one worker, problems are spread over a pool and every worker runs its own
+    Network instance. Threads suit API-bound runs. Processes suit the mock backend or CPU-heavy
+    analysis; each process keeps its own copy of the solve plan, so initial solves are shared
+    between graphs only through the response cache. `on_result` is called in the calling thread
+    as soon as each problem finishes; the returned records are in problem order, so they do not
+    depend on scheduling.
+
+    Args:
+        graph_name (str): Name of the graph configuration
+        graph_config (Dict): The graph configuration
+        problems (List[Dict]): Problems from dataset_loader
+        solve_plan (InitialSolvePlan): Plan of the sweep's initial solves
+        workers (int): Number of problems run in parallel
+        pool (str): 'thread' or 'process'
+        on_result (Optional[Callable[[Dict], None]]): Called with each record as it completes
+
+    Returns:
+        List[Dict]: Outcome records, in problem order
+    """
+    if pool not in WORKER_POOLS:
+        raise ValueError(f"Worker pool must be one of {WORKER_POOLS}, got '{pool}'")
+
+    on_result = on_result or (lambda record: None)
+    if workers <= 1:
+        runner = ProblemRunner(graph_name, graph_config, solve_plan, config.ASYNC_DEBATES)
+        results = []
+        try:
+            for problem_data in problems:
+                results.append(runner.run(problem_data))
+                on_result(results[-1])
+        finally:
+            runner.close()
+    elif pool == "thread":
+        if config.ASYNC_DEBATES:
+            # Async HTTP clients are bound to one event loop, so worker threads debate sequentially
+            logging.info("Problem workers are threads; debates run sequentially within each worker.")
+        local = threading.local()
+        runners: List[ProblemRunner] = []
+        runners_lock = threading.Lock()
+
+        def run_in_thread(problem_data: Dict) -> Dict:
+            runner = getattr(local, "runner", None)
+            if runner is None:
+                runner = local.runner = ProblemRunner(graph_name, graph_config, solve_plan, async_debates=False)
+                with runners_lock:
+                    runners.append(runner)
+            return runner.run(problem_data)
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"problems-{graph_name}") as executor:
+            results = _collect(executor, run_in_thread, problems, on_result)
+        for runner in runners:
+            runner.close()
+    else:
+        cache = get_response_cache()
+        cache_settings = (cache.mode, cache.path, cache.max_bytes) if cache is not None else None
+        backend = (get_llm_backend(), get_llm_backend_options())
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_process_worker,
+                                 initargs=(graph_name, graph_config, solve_plan, config.ASYNC_DEBATES,
+                                           backend, cache_settings, get_tracer().enabled)) as executor:
+            results = _collect(executor, _run_in_process, problems, on_result, with_spans=True)
+    return results
+
+def _collect(executor, fn: Callable, problems: List[Dict], on_result: Callable[[Dict], None],
+             with_spans: bool = False) -> List[Dict]:
+    """
+    Runs `fn` over the problems on an executor, reporting records as they complete and returning them in order.
+    With `with_spans`, `fn` returns (record, spans) and the spans are added to this process's tracer.
+    """
+    futures = {executor.submit(fn, problem_data): index for index, problem_data in enumerate(problems)}
+    results: List[Optional[Dict]] = [None] * len(problems)
+    tracer = get_tracer()
+    for future in as_completed(futures):
+        result = future.result()
+        if with_spans:
+            result, spans = result
+            tracer.extend(spans)
+        results[futures[future]] = result
+        on_result(result)
+    return results
@@ -0,0 +1,103 @@
+# scoring.py
+
+import logging
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+from answers import extract_final_answer, numeric_values, normalize_answer, symbolic_equal
+
+class ReferenceAnswer:
+    """A ground-truth answer, canonicalized once so that many agent answers can be graded against it."""
+
+    def __init__(self, final_answer: str):
+        self.final_answer = final_answer
+        self.values = numeric_values(final_answer)
+        self.text = normalize_answer(final_answer)
+
+    def grade(self, solution: Optional[str]) -> Optional[bool]:
+        """
+        Grades one solution against the reference.
+
+        Returns:
+            Optional[bool]: True or False when decided locally, None when the result is ambiguous
+        """
+        answer = extract_final_answer(solution)
+        if answer is None:
+            return None if solution else False
+        if self.values is not None:
+            values = numeric_values(answer)
+            if values is not None:
+                return bool(values & self.values)
+        if normalize_answer(answer) == self.text:
+            return True
+        return symbolic_equal(answer, self.final_answer)
+
+def score_answers(answers: Dict[Hashable, Optional[str]], final_answer: str) -> Dict[Hashable, Optional[bool]]:
+    """
+    Grades all agents' answers to one problem in a single local pass.
+    Identical answers, which are common once agents agree, are graded once.
+
+    Args:
+        answers (Dict): Agent id -> final solution text
+        final_answer (str): The problem's canonical final answer
+
+    Returns:
+        Dict: Agent id -> True/False, or None where the local grading is ambiguous
+    """
+    reference = ReferenceAnswer(final_answer)
+    grades: Dict[Optional[str], Optional[bool]] = {}
+    results = {}
+    for agent_id, answer in answers.items():
+        if answer not in grades:
+            grades[answer] = reference.grade(answer)
+        results[agent_id] = grades[answer]
+    return results
+
+def score_record(record: Dict, final_answer: str) -> Dict[Hashable, bool]:
+    """
+    Re-grades the final answers of a stored outcome record (see runner.ProblemRunner.run) locally,
+    counting ambiguous answers as incorrect. Needs neither the agents nor an LLM.
+    """
+    grades = score_answers(record['final_answers'], final_answer)
+    ambiguous = sum(grade is None for grade in grades.values())
+    if ambiguous:
+        logging.warning(f"{ambiguous} answer(s) to problem {record['problem_id']} could not be graded locally "
+                        f"and are counted as incorrect.")
+    return {agent_id: bool(grade) for agent_id, grade in grades.items()}
+
+def score_network(network, problem_data: Dict, llm_fallback: bool = False) -> Dict[Hashable, bool]:
+    """
+    Grades every agent in the network against the problem's final answer.
+
+    Args:
+        network (Network): The network after debates
+        problem_data (Dict): A problem from dataset_loader, with a 'final_answer' key
+        llm_fallback (bool): Grade ambiguous answers with the LLM instead of counting them as incorrect
+
+    Returns:
+        Dict[Hashable, bool]: Agent id -> correctness
+    """
+    grades = score_answers({agent_id: agent.answer for agent_id, agent in network.agents.items()},
+                           problem_data['final_answer'])
+    ambiguous = [agent_id for agent_id, grade in grades.items() if grade is None]
+    if ambiguous:
+        if llm_fallback:
+            from agent import assess_correctness
+            for agent_id in ambiguous:
+                grades[agent_id] = assess_correctness(network.get_agent(agent_id), problem_data['final_answer'])
+        else:
+            logging.warning(f"{len(ambiguous)} answer(s) to problem {problem_data['id']} could not be graded locally "
+                            f"and are counted as incorrect.")
+            for agent_id in ambiguous:
+                grades[agent_id] = False
+    return grades
+
+def score_run(results: Iterable[Tuple[str, Dict[Hashable, Optional[str]]]]) -> List[Dict[Hashable, Optional[bool]]]:
+    """
+    Grades a whole run locally.
+
+    Args:
+        results (Iterable[Tuple]): (final_answer, agent id -> final solution text) per problem
+
+    Returns:
+        List[Dict]: The grades of each problem, in order
+    """
+    return [score_answers(answers, final_answer) for final_answer, answers in results]
@@ -0,0 +1,96 @@
+# startup_benchmark.py
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+HEAVY_MODULES = ("langchain", "langchain_core", "langchain_openai", "openai", "networkx", "pydantic", "httpx", "sympy")
+
+# Runs in a fresh interpreter: imports main, then runs the first problem of a graph on the mock backend
+FIRST_PROBLEM_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import main
+import_time = time.perf_counter() - start
+heavy = sorted(name for name in sys.modules if name.split('.')[0] in {heavy!r})
+
+import config
+from llm import set_llm_backend
+from mock_llm import register_answer
+from runner import ProblemRunner
+from sweep import InitialSolvePlan
+set_llm_backend("mock", latency=0.0)
+graph_config = config.GRAPH_CONFIGS[{graph!r}]
+problem_data = {{'id': 0, 'problem': 'Startup problem: how many clips were sold?', 'final_answer': '72'}}
+register_answer(problem_data['problem'], problem_data['final_answer'])
+runner = ProblemRunner({graph!r}, graph_config, InitialSolvePlan({{{graph!r}: graph_config}}), async_debates=False)
+runner.run(problem_data)
+first_problem_time = time.perf_counter() - start
+print(json.dumps({{'import_s': import_time, 'first_problem_s': first_problem_time, 'heavy_modules_after_import': heavy}}))
+"""
+
+def import_profile(module: str = "main", top: int = 10) -> Tuple[float, List[Tuple[str, float]]]:
+    """
+    Imports a module in a fresh interpreter under `-X importtime`.
+
+    Args:
+        module (str): Module to import
+        top (int): Number of imports to list
+
+    Returns:
+        Tuple[float, List[Tuple[str, float]]]: Total import seconds of the module, and the slowest imports
+        as (name, cumulative seconds), slowest first
+    """
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               capture_output=True, text=True, check=True)
+    cumulative: Dict[str, float] = {}
+    for line in completed.stderr.splitlines():
+        # "import time:   self [us] | cumulative | imported package"
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+        if match:
+            cumulative[match.group(3)] = int(match.group(1)) / 1e6
+    slowest = sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[:top]
+    return cumulative.get(module, 0.0), slowest
+
+def first_problem(graph_name: str) -> Dict:
+    """Time to `import main` and to the end of the first problem on a graph, in a fresh interpreter."""
+    script = FIRST_PROBLEM_SCRIPT.format(heavy=HEAVY_MODULES, graph=graph_name)
+    env = dict(os.environ, MAFEA_LLM_BACKEND="mock")
+    completed = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True, env=env)
+    return json.loads(completed.stdout.splitlines()[-1])
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Interpreter startup cost of the simulation: import time and time to the first problem on the mock backend.")
+    parser.add_argument("--graph", default="Chain", help="Graph of config.GRAPH_CONFIGS to run the first problem on")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to list")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per measurement; the fastest is reported")
+    parser.add_argument("--json", action="store_true", help="Print the result as one JSON object")
+    args = parser.parse_args(argv)
+
+    profiles = [import_profile("main", args.top) for _ in range(args.repeat)]
+    import_total, slowest = min(profiles, key=lambda profile: profile[0])
+    runs = [first_problem(args.graph) for _ in range(args.repeat)]
+    fastest = min(runs, key=lambda run: run["first_problem_s"])
+    result = {
+        "import_main_s": round(import_total, 4),
+        "import_s": round(fastest["import_s"], 4),
+        "first_problem_s": round(fastest["first_problem_s"], 4),
+        "heavy_modules_after_import": fastest["heavy_modules_after_import"],
+        "slowest_imports": [(name, round(seconds, 4)) for name, seconds in slowest],
+    }
+    if args.json:
+        print(json.dumps(result))
+        return
+    print(f"import main: {result['import_main_s']}s (importtime), {result['import_s']}s (wall)")
+    print(f"first problem on {args.graph}: {result['first_problem_s']}s after interpreter start")
+    print(f"heavy modules after import: {', '.join(result['heavy_modules_after_import']) or 'none'}")
+    print("slowest imports (cumulative):")
+    for name, seconds in result["slowest_imports"]:
+        print(f"  {seconds:8.4f}s  {name}")
+
+if __name__ == "__main__":
+    main()
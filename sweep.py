@@ -0,0 +1,93 @@
+# sweep.py
+
+import logging
+from itertools import groupby
+from typing import Dict, Hashable, List, Tuple
+from agent import Agent
+from answers import majority_answer
+from cache import sampling
+
+SolveKey = Tuple[int, int]  # (capability, sample id)
+
+class InitialSolvePlan:
+    """
+    Plans the initial solves of a sweep over several graph configurations.
+
+    Every node is assigned a (capability, sample id) pair. The k-th node of a given capability in a
+    graph gets sample id k, so graphs that use the same capability levels share their initial solves
+    and each (problem, capability, sample id) is solved once for the whole sweep. With
+    independent_samples, every node of every graph gets its own sample id instead.
+
+    With batched, the solves of a capability level are requested together in one call that asks
+    for several samples. With vote_samples k > 1, each unit's solution is the majority answer of k
+    samples (at sample indices sample_id * k .. sample_id * k + k - 1), which makes initial answers
+    agree more often and leaves fewer edges to debate.
+
+    A seed selects an independent replicate of the sweep: its solves use sample indices past those
+    of every lower seed, so seed 0 is the plain sweep.
+    """
+
+    def __init__(self, graph_configs: Dict[str, Dict], independent_samples: bool = False,
+                 batched: bool = False, vote_samples: int = 1):
+        if vote_samples < 1:
+            raise ValueError(f"vote_samples must be at least 1, got {vote_samples}")
+        self.independent_samples = independent_samples
+        self.batched = batched
+        self.vote_samples = vote_samples
+        self.assignments: Dict[str, Dict[Hashable, SolveKey]] = {}
+        next_sample_id: Dict[int, int] = {}
+        for graph_name, graph_config in graph_configs.items():
+            if not independent_samples:
+                next_sample_id = {}
+            assignment = {}
+            for node in graph_config['nodes']:
+                capability = node['capability']
+                sample_id = next_sample_id.get(capability, 0)
+                next_sample_id[capability] = sample_id + 1
+                assignment[node['id']] = (capability, sample_id)
+            self.assignments[graph_name] = assignment
+
+        self.units: List[SolveKey] = sorted({key for assignment in self.assignments.values()
+                                             for key in assignment.values()})
+        self._solutions: Dict[Tuple[Hashable, int], Dict[SolveKey, str]] = {}
+        # Sample indices used by one replicate
+        self._seed_stride = (max((sample_id for _, sample_id in self.units), default=-1) + 1) * vote_samples
+
+        total_nodes = sum(len(assignment) for assignment in self.assignments.values())
+        logging.info(f"Initial solve plan: {len(self.units)} solve(s) per problem for {total_nodes} agents "
+                     f"across {len(self.assignments)} graph(s).")
+
+    def solutions(self, problem_data: Dict, seed: int = 0) -> Dict[SolveKey, str]:
+        """
+        Returns the initial solutions of a problem, solving each planned unit the first time it is needed.
+        Each call solves with its own solver agents, so different problems can be solved concurrently.
+        """
+        solutions = self._solutions.get((problem_data['id'], seed))
+        if solutions is None:
+            solutions = {}
+            problem = problem_data['problem']
+            k = self.vote_samples
+            for capability, units in groupby(self.units, key=lambda unit: unit[0]):
+                sample_ids = [sample_id for _, sample_id in units]
+                sample_indices = [seed * self._seed_stride + sample_id * k + offset
+                                  for sample_id in sample_ids for offset in range(k)]
+                solver = Agent(agent_id=f"solver-{capability}", capability=capability)
+                if self.batched:
+                    samples = solver.solve_samples(problem, sample_indices)
+                else:
+                    samples = []
+                    for sample_index in sample_indices:
+                        solver.clear_memory()
+                        with sampling(sample_index):
+                            samples.append(solver.solve(problem))
+                for position, sample_id in enumerate(sample_ids):
+                    solutions[(capability, sample_id)] = majority_answer(samples[position * k:(position + 1) * k])
+            self._solutions[(problem_data['id'], seed)] = solutions
+        return solutions
+
+    def assign(self, network, graph_name: str, problem_data: Dict, seed: int = 0) -> None:
+        """Hands each agent of the network its planned initial solution of the problem in a replicate."""
+        solutions = self.solutions(problem_data, seed)
+        assignment = self.assignments[graph_name]
+        for agent_id, agent in network.agents.items():
+            agent.adopt_solution(problem_data['problem'], solutions[assignment[agent_id]])
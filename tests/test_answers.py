@@ -0,0 +1,76 @@
+# test_answers.py
+
+from fractions import Fraction
+import pytest
+from answers import answer_key, answers_equivalent, extract_final_answer, numeric_values
+
+@pytest.mark.parametrize("text, expected", [
+    ("The total is 18.\nAnswer: 18", "18"),
+    ("so \\boxed{\\frac{1}{2}} is the result", "\\frac{1}{2}"),
+    ("Janet sells 9 eggs.\n#### 18", "18"),
+    ('{"decision": "keep", "new_solution": "42"}', "42"),
+    ("72", "72"),
+    ("", None),
+])
+def test_extract_final_answer(text, expected):
+    assert extract_final_answer(text) == expected
+
+@pytest.mark.parametrize("answer, value", [
+    ("12 eggs", 12),
+    ("12 inches", 12),
+    ("5 pieces", 5),
+    ("3 pizzas", 3),
+    ("10 items", 10),
+    ("7 each", 7),
+    ("$1,250 dollars", 1250),
+    ("\\frac{3}{4}", Fraction(3, 4)),
+])
+def test_numeric_values_with_units(answer, value):
+    assert numeric_values(answer) == frozenset((Fraction(value),))
+
+@pytest.mark.parametrize("answer", ["2 pi", "3 i", "5 e", "4 sqrt", "2 sqrt(3)", "3 log(2)"])
+def test_math_words_are_not_units(answer):
+    assert numeric_values(answer) is None
+
+def test_percentages_denote_both_readings():
+    assert numeric_values("50%") == frozenset((Fraction(50), Fraction(1, 2)))
+    assert answers_equivalent("Answer: 50%", "Answer: 50") is True
+    # The fractional reading is possible but not canonical, so the LLM decides
+    assert answers_equivalent("Answer: 50%", "Answer: 0.5") is None
+    assert answers_equivalent("Answer: 50%", "Answer: 7") is False
+
+ANSWERS = ["50%", "50", "0.5", "1/2", "\\frac{1}{2}", "12 eggs", "12", "3 pizzas", "x + 1", "x+1", "2 pi"]
+
+@pytest.mark.parametrize("answer1", ANSWERS)
+@pytest.mark.parametrize("answer2", ANSWERS)
+def test_answer_key_agrees_with_equivalence(answer1, answer2):
+    same_key = answer_key(f"Answer: {answer1}") == answer_key(f"Answer: {answer2}")
+    equivalent = answers_equivalent(f"Answer: {answer1}", f"Answer: {answer2}")
+    assert same_key == (equivalent is True)
+
+@pytest.mark.parametrize("solution1, solution2", [
+    ("Answer: 12 eggs", "#### 12"),
+    ("Answer: 12 inches", "Answer: 12"),
+    ("Answer: 5 pieces", "Answer: 5.0"),
+    ("Answer: 7 each", "\\boxed{7}"),
+])
+def test_units_are_equivalent_to_bare_numbers(solution1, solution2):
+    assert answers_equivalent(solution1, solution2) is True
+
+def test_different_numbers_are_not_equivalent():
+    assert answers_equivalent("Answer: 3 pizzas", "Answer: 4") is False
+
+NESTED_POWER = "(((10**64)**64)**64)**64"
+
+def test_nested_powers_are_not_evaluated():
+    assert numeric_values(NESTED_POWER) is None
+    assert numeric_values("(10^64)^64") is None
+    assert numeric_values("2^10") == frozenset((Fraction(1024),))
+    assert answer_key(f"Answer: {NESTED_POWER}") == NESTED_POWER
+    assert answers_equivalent(f"Answer: {NESTED_POWER}", "Answer: 1") is None
+
+def test_nested_powers_are_not_evaluated_symbolically():
+    pytest.importorskip("sympy")
+    from answers import symbolic_equal
+    assert symbolic_equal(NESTED_POWER, "5") is None
+    assert symbolic_equal("2^{10}", "1024") is True
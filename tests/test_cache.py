@@ -0,0 +1,48 @@
+# test_cache.py
+
+import asyncio
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.prompt_values import StringPromptValue
+from cache import CacheMissError, configure_response_cache
+from llm import get_chat_model, set_llm_backend
+import mock_llm
+
+@pytest.fixture
+def counted_backend(monkeypatch):
+    """The mock backend, counting the generations it is asked for."""
+    set_llm_backend("mock", latency=0.0)
+    calls = []
+    generate, agenerate = mock_llm.MockChatModel._generate, mock_llm.MockChatModel._agenerate
+
+    def counted(self, *args, **kwargs):
+        calls.append(args)
+        return generate(self, *args, **kwargs)
+
+    async def acounted(self, *args, **kwargs):
+        calls.append(args)
+        return await agenerate(self, *args, **kwargs)
+
+    monkeypatch.setattr(mock_llm.MockChatModel, "_generate", counted)
+    monkeypatch.setattr(mock_llm.MockChatModel, "_agenerate", acounted)
+    yield calls
+    configure_response_cache("off", "", 0)
+
+def test_replay_only_serves_hits_and_raises_on_misses(tmp_path, counted_backend):
+    path = str(tmp_path / "responses.sqlite")
+    chat_model = get_chat_model(3)
+    recorded_prompt = StringPromptValue(text="Problem: how many apples?")
+
+    configure_response_cache("record", path, 1024 * 1024)
+    recorded = chat_model.invoke(recorded_prompt).content
+    assert len(counted_backend) == 1
+
+    configure_response_cache("replay-only", path, 1024 * 1024)
+    assert chat_model.invoke(recorded_prompt).content == recorded
+    with pytest.raises(CacheMissError):
+        chat_model.invoke(StringPromptValue(text="Problem: how many pears?"))
+    with pytest.raises(CacheMissError):
+        asyncio.run(chat_model.ainvoke(StringPromptValue(text="Problem: how many plums?")))
+    assert len(counted_backend) == 1
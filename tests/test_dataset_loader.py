@@ -0,0 +1,55 @@
+# test_dataset_loader.py
+
+import json
+import os
+from dataset_loader import iter_math_dataset, load_problems
+
+def write_math(root, categories, count):
+    for category in categories:
+        directory = os.path.join(root, "train", category)
+        os.makedirs(directory)
+        for number in range(1, count + 1):
+            with open(os.path.join(directory, f"{number}.json"), "w") as f:
+                json.dump({"problem": f"{category} problem {number}", "solution": f"\\boxed{{{number}}}"}, f)
+
+def write_gsm8k(path, count):
+    with open(path, "w") as f:
+        for number in range(count):
+            f.write(json.dumps({"question": f"Question {number}?", "answer": f"Work.\n#### {number}"}) + "\n")
+
+def test_math_ids_are_unique_across_categories(tmp_path):
+    write_math(tmp_path, ["algebra", "geometry"], 3)
+    ids = [problem['id'] for problem in iter_math_dataset(str(tmp_path))]
+    assert ids == ["algebra/1", "algebra/2", "algebra/3", "geometry/1", "geometry/2", "geometry/3"]
+
+def test_seeded_sample_does_not_depend_on_packing(tmp_path):
+    path = str(tmp_path / "train.jsonl")
+    write_gsm8k(path, 50)
+    for seed in range(5):
+        packed = load_problems(path, num_problems=7, seed=seed, packed=True)
+        streamed = load_problems(path, num_problems=7, seed=seed, packed=False)
+        assert [problem['id'] for problem in packed] == [problem['id'] for problem in streamed]
+        assert len(packed) == 7
+
+def test_seeded_math_sample_does_not_depend_on_packing(tmp_path):
+    root = str(tmp_path / "MATH")
+    write_math(root, ["algebra", "geometry"], 6)
+    for shard_index in range(2):
+        packed = load_problems(root, "math", num_problems=5, seed=3, shard_index=shard_index, num_shards=2)
+        streamed = load_problems(root, "math", num_problems=5, seed=3, shard_index=shard_index, num_shards=2,
+                                 packed=False)
+        assert packed == streamed
+
+def test_concurrent_packing_publishes_a_complete_dataset(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    from dataset_loader import PackedDataset, iter_gsm8k_dataset, pack_dataset
+    source = str(tmp_path / "train.jsonl")
+    write_gsm8k(source, 200)
+    packed_path = str(tmp_path / "packed" / "train.packed.jsonl")
+    with ThreadPoolExecutor(4) as executor:
+        counts = list(executor.map(lambda _: pack_dataset(iter_gsm8k_dataset(source), packed_path), range(4)))
+    assert counts == [200] * 4
+    dataset = PackedDataset(packed_path)
+    assert list(dataset) == list(iter_gsm8k_dataset(source))
+    dataset.close()
+    assert sorted(os.listdir(tmp_path / "packed")) == ["train.packed.jsonl", "train.packed.jsonl.idx"]
@@ -0,0 +1,49 @@
+# test_debate.py
+
+import asyncio
+import pytest
+
+pytest.importorskip("langchain_core")
+pytest.importorskip("networkx")
+
+from benchmark import run_benchmark
+from cache import sampling
+from debate import agree_on_matching_answers, run_debates, run_debates_async
+from llm import set_llm_backend
+from mock_llm import register_answer
+from network import Network
+from topology import generate_graph
+
+def run_problems(graph_config, debate):
+    """Solves and debates two problems on a fresh network; returns each problem's final state."""
+    network = Network(graph_config)
+    states = []
+    for number in range(2):
+        problem = f"Debate problem {number}: how many?"
+        register_answer(problem, str(10 + number))
+        network.reset()
+        for slot, agent in enumerate(network.agents.values()):
+            with sampling(slot):
+                agent.solve(problem)
+            agent.memory.clear()
+        agree_on_matching_answers(network)
+        passes = debate(network, problem)
+        states.append((passes, {agent_id: agent.answer for agent_id, agent in network.agents.items()},
+                       dict(network.agreement_status.items())))
+    return states
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_async_debates_reach_the_sequential_state(seed):
+    set_llm_backend("mock", latency=0.0)
+    graph_config = generate_graph("watts_strogatz", 12, seed=seed, degree=4)
+    sequential = run_problems(graph_config, lambda network, problem: run_debates(network, problem, 3))
+    concurrent = run_problems(graph_config, lambda network, problem: asyncio.run(
+        run_debates_async(network, problem, 3, max_concurrency=4)))
+    assert concurrent == sequential
+
+def test_prioritized_debates_settle_before_the_pass_cap():
+    # Agents pulled back and forth between two answer clusters used to reopen each other's edges every pass
+    set_llm_backend("mock", latency=0.0)
+    result = run_benchmark(100, 4, 3, 0, scheduler="priority", max_passes=20)
+    assert result["unsettled"] == 0
+    assert result["passes"] < 3 * 20
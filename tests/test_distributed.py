@@ -0,0 +1,66 @@
+# test_distributed.py
+
+import time
+import pytest
+import config
+from distributed import WorkQueue, run_worker
+
+PROBLEMS = [{'id': number, 'problem': f"Queue problem {number}: how many?", 'answer': '', 'final_answer': str(10 + number)}
+            for number in range(3)]
+GRAPHS = {'Chain': config.GRAPH_CONFIGS['Chain']}
+
+def test_expired_lease_is_leased_to_the_next_worker(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    hung = WorkQueue(path, lease_seconds=0.05, max_attempts=3)
+    healthy = WorkQueue(path, lease_seconds=60)
+    hung.enqueue(GRAPHS, PROBLEMS[:1])
+
+    unit = hung.lease("hung")
+    assert unit.attempts == 1 and healthy.lease("healthy") is None
+    time.sleep(0.1)
+    released = healthy.lease("healthy")
+    assert released.unit_id == unit.unit_id and released.attempts == 2
+    assert not hung.heartbeat(unit.unit_id, "hung")
+    assert healthy.heartbeat(unit.unit_id, "healthy")
+
+    assert healthy.complete(unit.unit_id, "healthy", {"problem_id": 0})
+    assert not hung.complete(unit.unit_id, "hung", {"problem_id": 0})
+    assert healthy.counts()["done"] == 1 and list(healthy.results()) == [{"problem_id": 0}]
+    hung.close()
+    healthy.close()
+
+def test_unit_fails_after_max_attempts(tmp_path):
+    path = str(tmp_path / "queue.sqlite")
+    queue = WorkQueue(path, lease_seconds=0.01, max_attempts=2)
+    queue.enqueue(GRAPHS, PROBLEMS[:1])
+    assert queue.lease("first").attempts == 1
+    time.sleep(0.02)
+    assert queue.lease("second").attempts == 2
+    time.sleep(0.02)
+    assert queue.lease("third") is None
+    assert queue.finished() and queue.counts()["failed"] == 1
+    assert queue.failures()[0]["error"] == "Lease expired"
+    queue.close()
+
+def test_worker_finishes_the_unit_of_a_worker_whose_lease_expired(tmp_path):
+    pytest.importorskip("langchain_core")
+    pytest.importorskip("networkx")
+    from llm import set_llm_backend
+    from mock_llm import register_answer
+    set_llm_backend("mock", latency=0.0)
+    for problem_data in PROBLEMS:
+        register_answer(problem_data['problem'], problem_data['final_answer'])
+
+    path = str(tmp_path / "queue.sqlite")
+    hung = WorkQueue(path, lease_seconds=0.05)
+    assert hung.enqueue(GRAPHS, PROBLEMS, seeds=(0, 1)) == 6
+    abandoned = hung.lease("hung")  # Leased, then never renewed nor completed
+    time.sleep(0.1)
+
+    assert run_worker(path, "healthy", poll_seconds=0.01, heartbeat_seconds=0.01) == 6
+    assert not hung.complete(abandoned.unit_id, "hung", {})
+    assert hung.counts() == {"pending": 0, "leased": 0, "done": 6, "failed": 0}
+    records = list(hung.results())
+    assert sorted((record['problem_id'], record['seed']) for record in records) == [(n, s) for n in range(3) for s in (0, 1)]
+    assert all(len(record['final_answers']) == len(GRAPHS['Chain']['nodes']) for record in records)
+    hung.close()
@@ -0,0 +1,67 @@
+# test_evaluation.py
+
+import pytest
+
+pytest.importorskip("pydantic")
+
+from evaluation import get_evaluation_stats, parse_evaluation, repair_json, reset_evaluation_stats
+
+MALFORMED = """Here is my evaluation:
+```json
+{
+    "solution_changed": True,  // adopting the other answer
+    "new_solution": 18,
+    "confidence": 85,
+    "reasoning": "The other agent counted the eggs correctly",
+}
+```
+Hope this helps."""
+
+@pytest.fixture(autouse=True)
+def fresh_stats():
+    reset_evaluation_stats()
+    yield
+    reset_evaluation_stats()
+
+def test_repair_json_fixes_fences_comments_commas_and_literals():
+    result = parse_evaluation(MALFORMED)
+    assert result is not None
+    assert result.solution_changed is True and result.new_solution == "18" and result.confidence == 85
+    assert get_evaluation_stats()["repaired"] == 1
+    assert repair_json('{"a": None, "b": [1, 2,],}') == '{"a": null, "b": [1, 2]}'
+
+def test_valid_evaluation_is_parsed_as_is():
+    assert parse_evaluation('{"solution_changed": false, "confidence": 120}').confidence == 100.0
+    assert get_evaluation_stats()["parsed"] == 1
+
+def test_truncated_evaluation_cannot_be_repaired_locally():
+    assert parse_evaluation('{"solution_changed": true, "new_solution": "1') is None
+    assert get_evaluation_stats()["repaired"] == 0
+
+def test_unrepairable_evaluation_is_retried_once(monkeypatch):
+    pytest.importorskip("langchain_core")
+    from langchain_core.runnables import RunnableLambda
+    import agent as agent_module
+
+    responses = {
+        "evaluation": '{"solution_changed": true, "new_solution": "1',
+        "evaluation_repair": '{"solution_changed": true, "new_solution": "12", "confidence": 70, "reasoning": "r"}',
+    }
+    requests = []
+
+    def get_chain(kind, capability):
+        def respond(inputs, **kwargs):
+            requests.append(kind)
+            return responses[kind]
+        return RunnableLambda(respond)
+
+    monkeypatch.setattr(agent_module, "get_chain", get_chain)
+    evaluator = agent_module.Agent(agent_id="1", capability=3)
+    result = evaluator.evaluate("How many?", "")
+    assert result is not None and result.new_solution == "12"
+    assert requests == ["evaluation", "evaluation_repair"]
+    assert get_evaluation_stats()["retried"] == 1 and get_evaluation_stats()["recovered"] == 1
+
+    responses["evaluation_repair"] = "still not JSON"
+    assert evaluator.evaluate("How many?", "") is None
+    assert get_evaluation_stats()["failed"] == 1
@@ -0,0 +1,166 @@
+# test_loadbalancer.py
+
+import contextlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import loadbalancer
+from loadbalancer import EndpointPool
+from ratelimit import EndpointLimiter
+
+class StubServer:
+    """
+    Stands in for a set of endpoints: URLs in `down` time out, URLs in `throttled` answer with HTTP
+    429, the others echo their URL.
+    """
+
+    def __init__(self, down=(), throttled=()):
+        self.down = set(down)
+        self.throttled = set(throttled)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, url):
+        with self.lock:
+            self.calls.append(url)
+        if url in self.down:
+            raise TimeoutError(url)
+        if url in self.throttled:
+            import httpx
+            request = httpx.Request("POST", f"{url}/chat/completions")
+            raise httpx.HTTPStatusError("Too Many Requests", request=request,
+                                        response=httpx.Response(429, request=request))
+        return url
+
+    def probe(self, url):
+        return url not in self.down
+
+def call_quietly(pool, server):
+    try:
+        return pool.call(server)
+    except TimeoutError:
+        return None
+
+def test_replica_is_ejected_after_consecutive_failures():
+    server = StubServer(down={"b"})
+    pool = EndpointPool(["a", "b"], probe=server.probe, eject_after=3, eject_seconds=60)
+    for _ in range(12):
+        call_quietly(pool, server)
+    stats = pool.stats()
+    assert not stats["b"]["healthy"] and stats["b"]["ejections"] == 1
+    assert stats["b"]["failures"] == 3
+    calls = len(server.calls)
+    for _ in range(5):
+        assert pool.call(server) == "a"
+    assert server.calls[calls:] == ["a"] * 5
+
+def test_throttled_replica_does_not_narrow_the_others():
+    pytest.importorskip("httpx")
+    server = StubServer(throttled={"b"})
+    limiters = {url: EndpointLimiter(url, "m", initial_window=8, max_retries=3, backoff_base=0.0) for url in "ab"}
+    pool = EndpointPool(["a", "b"])
+    for _ in range(4):
+        assert pool.call(server, limiters.__getitem__) == "a"
+    assert "b" in server.calls
+    throttled, healthy = limiters["b"].stats(), limiters["a"].stats()
+    assert throttled["throttled"] >= 1 and throttled["window"] < 8
+    assert healthy["throttled"] == 0 and healthy["window"] > 8
+    # 429s mean busy, not broken, so the throttled replica stays in routing
+    assert pool.stats()["b"]["healthy"] and pool.stats()["b"]["failures"] == 0
+
+def test_failed_probes_double_the_wait(monkeypatch):
+    server = StubServer(down={"b"})
+    waits = []
+    readmitted = threading.Event()
+    real_sleep = time.sleep
+
+    def sleep(seconds):
+        if threading.current_thread().name.startswith("probe-"):
+            waits.append(seconds)
+            if len(waits) == 4:
+                server.down.clear()
+        else:
+            real_sleep(seconds)
+
+    def probe(url):
+        healthy = server.probe(url)
+        if healthy:
+            readmitted.set()
+        return healthy
+
+    monkeypatch.setattr(loadbalancer.time, "sleep", sleep)
+    pool = EndpointPool(["a", "b"], probe=probe, eject_after=2, eject_seconds=1.0, max_eject_seconds=5.0)
+    for _ in range(4):
+        call_quietly(pool, server)
+    assert readmitted.wait(5)
+    deadline = time.monotonic() + 5
+    while not pool.stats()["b"]["healthy"] and time.monotonic() < deadline:
+        real_sleep(0.01)
+    assert waits == [1.0, 2.0, 4.0, 5.0]
+    assert pool.stats()["b"]["healthy"]
+
+def test_single_endpoint_is_never_ejected():
+    server = StubServer(down={"a"})
+    pool = EndpointPool(["a"], probe=server.probe, eject_after=2)
+    for _ in range(6):
+        with pytest.raises(TimeoutError):
+            pool.call(server)
+    assert pool.check_health() == {"a": False}
+    stats = pool.stats()["a"]
+    assert stats["healthy"] and stats["ejections"] == 0 and stats["failures"] == 6
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """An OpenAI-style endpoint that answers every request with the server's current `status`."""
+
+    def _respond(self):
+        self.send_response(self.server.status)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b'{"object": "list", "data": []}')
+
+    do_GET = do_POST = _respond
+
+    def log_message(self, *args):
+        pass
+
+@contextlib.contextmanager
+def stub_http_server(status=200):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.status = status
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_failing_http_replica_is_ejected_and_readmitted_by_the_real_probe():
+    httpx = pytest.importorskip("httpx")
+    from llm import _probe
+
+    def complete(url):
+        response = httpx.post(f"{url}/chat/completions", json={}, timeout=5)
+        response.raise_for_status()
+        return url
+
+    with stub_http_server() as (healthy, healthy_url), stub_http_server(503) as (failing, failing_url):
+        pool = EndpointPool([healthy_url, failing_url], probe=_probe, eject_after=2, eject_seconds=0.05)
+        for _ in range(6):
+            try:
+                pool.call(complete)
+            except httpx.HTTPStatusError:
+                pass
+        stats = pool.stats()
+        assert not stats[failing_url]["healthy"] and stats[failing_url]["failures"] == 2
+        assert pool.call(complete) == healthy_url
+
+        time.sleep(0.2)  # Failed probes back off: 0.05s, 0.1s, ...
+        assert not pool.stats()[failing_url]["healthy"]
+        failing.status = 200
+        deadline = time.monotonic() + 5
+        while not pool.stats()[failing_url]["healthy"] and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert pool.stats()[failing_url]["healthy"]
+        assert pool.check_health() == {healthy_url: True, failing_url: True}
@@ -0,0 +1,57 @@
+# test_results_store.py
+
+import json
+import pytest
+import config
+from results_store import ResultsStore
+
+def test_partial_last_record_is_dropped(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"graph": "Chain", "problem_id": 1}) + "\n")
+        f.write('{"graph": "Chain", "problem_id": 2, "final_ans')
+    store = ResultsStore(path)
+    assert store.completed_units() == {("Chain", 1)}
+    store.append({"graph": "Chain", "problem_id": 2})
+    store.close()
+    with open(path, encoding="utf-8") as f:
+        assert [json.loads(line)["problem_id"] for line in f] == [1, 2]
+
+def test_resume_runs_only_unfinished_problems(tmp_path, monkeypatch):
+    pytest.importorskip("langchain_core")
+    pytest.importorskip("networkx")
+    import main
+    from llm import set_llm_backend
+
+    dataset_path = tmp_path / "train.jsonl"
+    with open(dataset_path, "w", encoding="utf-8") as f:
+        for number in range(3):
+            f.write(json.dumps({"question": f"Resume problem {number}: how many?", "answer": f"#### {number}"}) + "\n")
+    for name, value in {"DATASET_PATH": str(dataset_path), "DATASET_KIND": "gsm8k", "NUM_PROBLEMS": 3,
+                        "DATASET_SEED": None, "GRAPH_CONFIGS": {"Chain": config.GRAPH_CONFIGS["Chain"]},
+                        "GENERATED_GRAPHS": {}, "TRACING": False, "RESPONSE_CACHE_MODE": "off"}.items():
+        monkeypatch.setattr(config, name, value)
+    set_llm_backend("mock", latency=0.0)
+
+    runs = []
+    run_graph = main.run_graph
+
+    def recording_run_graph(graph_name, graph_config, problems, *args, **kwargs):
+        runs.append([problem_data['id'] for problem_data in problems])
+        return run_graph(graph_name, graph_config, problems, *args, **kwargs)
+
+    monkeypatch.setattr(main, "run_graph", recording_run_graph)
+    results_path = str(tmp_path / "results.jsonl")
+    main.main(["--results", results_path])
+
+    # Crash halfway through writing the second record
+    with open(results_path, encoding="utf-8") as f:
+        lines = f.readlines()
+    with open(results_path, "w", encoding="utf-8") as f:
+        f.write(lines[0] + lines[1][:len(lines[1]) // 2])
+
+    main.main(["--results", results_path, "--resume"])
+    assert runs == [[1, 2, 3], [2, 3]]
+    with open(results_path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert sorted(record["problem_id"] for record in records) == [1, 2, 3]
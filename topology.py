@@ -0,0 +1,255 @@
+# topology.py
+
+import bisect
+import math
+import random
+from array import array
+from typing import Dict, Hashable, List, Optional, Sequence, Set, Tuple
+
+Edge = Tuple[int, int]
+
+def assign_capabilities(num_agents: int, seed: int, weights: Optional[Dict[int, float]] = None) -> List[int]:
+    """
+    Draws a capability level per agent from a seeded stream, independent of the topology's stream.
+
+    Args:
+        num_agents (int): Number of agents
+        seed (int): Seed of the draw
+        weights (Optional[Dict[int, float]]): Relative weight per capability level; uniform over 1-5 if None
+
+    Returns:
+        List[int]: Capability of agents 1..num_agents
+    """
+    weights = weights or {level: 1.0 for level in range(1, 6)}
+    levels = sorted(weights)
+    rng = random.Random(f"capabilities-{seed}")
+    return rng.choices(levels, weights=[weights[level] for level in levels], k=num_agents)
+
+def _add_edge(edges: Set[Edge], u: int, v: int) -> bool:
+    """Adds the undirected edge u-v between 0-based agents; False for self-loops and duplicates."""
+    if u == v:
+        return False
+    edge = (u, v) if u < v else (v, u)
+    if edge in edges:
+        return False
+    edges.add(edge)
+    return True
+
+def erdos_renyi(num_agents: int, probability: float, seed: int) -> List[Edge]:
+    """
+    G(n, p) random graph. Skips over absent edges geometrically (Batagelj and Brandes), so sparse
+    graphs take O(n + m) time instead of O(n^2).
+    """
+    rng = random.Random(seed)
+    edges: List[Edge] = []
+    if probability <= 0:
+        return edges
+    if probability >= 1:
+        return [(u, v) for v in range(num_agents) for u in range(v)]
+    log_q = math.log(1.0 - probability)
+    v, w = 1, -1
+    while v < num_agents:
+        w += 1 + int(math.log(1.0 - rng.random()) / log_q)
+        while w >= v and v < num_agents:
+            w -= v
+            v += 1
+        if v < num_agents:
+            edges.append((w, v))
+    return edges
+
+def watts_strogatz(num_agents: int, degree: int, rewire: float, seed: int) -> List[Edge]:
+    """Small-world graph: a ring where every agent links to its `degree` nearest agents, each link rewired with probability `rewire`."""
+    rng = random.Random(seed)
+    half = max(1, min(degree, num_agents - 1) // 2)
+    edges: Set[Edge] = set()
+    ring = [(u, (u + step) % num_agents) for step in range(1, half + 1) for u in range(num_agents)]
+    for u, v in ring:
+        _add_edge(edges, u, v)
+    for u, v in ring:
+        if rng.random() >= rewire:
+            continue
+        edge = (u, v) if u < v else (v, u)
+        # Rewire to a random agent, unless u is already linked to every other agent
+        for _ in range(num_agents):
+            w = rng.randrange(num_agents)
+            if w != u and ((u, w) if u < w else (w, u)) not in edges:
+                edges.discard(edge)
+                _add_edge(edges, u, w)
+                break
+    return sorted(edges)
+
+def barabasi_albert(num_agents: int, links: int, seed: int) -> List[Edge]:
+    """Scale-free graph by preferential attachment: each new agent links to `links` existing agents, chosen in proportion to their degree."""
+    rng = random.Random(seed)
+    links = max(1, min(links, num_agents - 1))
+    edges: List[Edge] = []
+    # Every agent appears here once per edge it has, so a uniform pick is proportional to degree
+    endpoints: List[int] = []
+    targets = list(range(links))
+    for u in range(links, num_agents):
+        for v in targets:
+            edges.append((v, u))
+        endpoints.extend(targets)
+        endpoints.extend([u] * links)
+        chosen: Set[int] = set()
+        while len(chosen) < links:
+            chosen.add(rng.choice(endpoints))
+        targets = sorted(chosen)
+    return edges
+
+def lattice(num_agents: int, columns: Optional[int] = None, periodic: bool = False) -> List[Edge]:
+    """2D grid, row by row, `columns` wide (near-square by default); `periodic` wraps it into a torus."""
+    columns = columns or max(1, math.isqrt(num_agents))
+    edges: Set[Edge] = set()
+    rows = math.ceil(num_agents / columns)
+    for u in range(num_agents):
+        row, column = divmod(u, columns)
+        right = u + 1 if column + 1 < columns else (u - column if periodic else None)
+        down = u + columns if row + 1 < rows else (column if periodic else None)
+        for v in (right, down):
+            if v is not None and v < num_agents:
+                _add_edge(edges, u, v)
+    return sorted(edges)
+
+def k_regular(num_agents: int, degree: int, seed: int, max_attempts: int = 100) -> List[Edge]:
+    """
+    Random graph where every agent has exactly `degree` neighbors, by pairing edge stubs at random
+    and restarting when the pairing gets stuck on self-loops or duplicate edges.
+    """
+    if degree >= num_agents or (num_agents * degree) % 2:
+        raise ValueError(f"No {degree}-regular graph on {num_agents} agents: need degree < agents and an even agents * degree")
+    rng = random.Random(seed)
+    for _ in range(max_attempts):
+        edges: Set[Edge] = set()
+        stubs = [u for u in range(num_agents) for _ in range(degree)]
+        while stubs:
+            rng.shuffle(stubs)
+            leftover: List[int] = []
+            for index in range(0, len(stubs), 2):
+                u, v = stubs[index], stubs[index + 1]
+                if not _add_edge(edges, u, v):
+                    leftover.extend((u, v))
+            if len(leftover) == len(stubs):
+                break  # No pair could be placed; restart
+            stubs = leftover
+        if not stubs:
+            return sorted(edges)
+    raise RuntimeError(f"Failed to generate a {degree}-regular graph on {num_agents} agents in {max_attempts} attempts")
+
+GRAPH_GENERATORS = ("erdos_renyi", "watts_strogatz", "barabasi_albert", "lattice", "k_regular")
+
+def generate_graph(kind: str, num_agents: int, seed: int = 0, degree: int = 4, rewire: float = 0.1,
+                   periodic: bool = False, capability_weights: Optional[Dict[int, float]] = None) -> Dict:
+    """
+    Generates a graph configuration in the format of config.GRAPH_CONFIGS, with agents 1..num_agents.
+
+    Args:
+        kind (str): One of GRAPH_GENERATORS
+        num_agents (int): Number of agents
+        seed (int): Seed of both the topology and the capability draw
+        degree (int): Average number of neighbors (Erdős–Rényi, Watts–Strogatz, k-regular), or twice
+            the links of each new agent (Barabási–Albert); lattices have degree 4
+        rewire (float): Rewiring probability of Watts–Strogatz
+        periodic (bool): Whether a lattice wraps around into a torus
+        capability_weights (Optional[Dict[int, float]]): See assign_capabilities
+
+    Returns:
+        Dict: {'nodes': [{'id', 'capability'}, ...], 'edges': [(id1, id2), ...]}
+    """
+    if kind == "erdos_renyi":
+        edges = erdos_renyi(num_agents, degree / max(1, num_agents - 1), seed)
+    elif kind == "watts_strogatz":
+        edges = watts_strogatz(num_agents, degree, rewire, seed)
+    elif kind == "barabasi_albert":
+        edges = barabasi_albert(num_agents, max(1, degree // 2), seed)
+    elif kind == "lattice":
+        edges = lattice(num_agents, periodic=periodic)
+    elif kind == "k_regular":
+        edges = k_regular(num_agents, degree, seed)
+    else:
+        raise ValueError(f"Graph generator must be one of {GRAPH_GENERATORS}, got '{kind}'")
+    capabilities = assign_capabilities(num_agents, seed, capability_weights)
+    return {
+        'nodes': [{'id': u + 1, 'capability': capability} for u, capability in enumerate(capabilities)],
+        'edges': [(u + 1, v + 1) for u, v in edges],
+    }
+
+def build_graph_configs(specs: Dict[str, Dict]) -> Dict[str, Dict]:
+    """Generates the graph configurations of config.GENERATED_GRAPHS (name -> generate_graph arguments)."""
+    return {name: generate_graph(**spec) for name, spec in specs.items()}
+
+class CompactAdjacency:
+    """
+    Undirected graph in compressed sparse row form: the neighbors of agent row r are
+    `indices[indptr[r]:indptr[r + 1]]`, and each such position also holds the id of its undirected
+    edge in `edge_ids`. Neighbors keep the order of the edge list, as in networkx, and edges are
+    numbered in the order `Network.init_agreements` first meets them, so iteration orders match the
+    networkx-backed network.
+    """
+
+    def __init__(self, node_ids: Sequence[Hashable], edges: Sequence[Tuple[Hashable, Hashable]]):
+        self.ids: List[Hashable] = list(node_ids)
+        self.rows: Dict[Hashable, int] = {node_id: row for row, node_id in enumerate(self.ids)}
+        neighbor_lists: List[List[int]] = [[] for _ in self.ids]
+        seen: Set[Tuple[int, int]] = set()
+        for id1, id2 in edges:
+            u, v = self.rows[id1], self.rows[id2]
+            key = (u, v) if u <= v else (v, u)
+            if key in seen:
+                continue
+            seen.add(key)
+            neighbor_lists[u].append(v)
+            if u != v:
+                neighbor_lists[v].append(u)
+        del seen
+
+        self.indptr = array("q", [0])
+        self.indices = array("l")
+        for neighbors in neighbor_lists:
+            self.indices.extend(neighbors)
+            self.indptr.append(len(self.indices))
+        del neighbor_lists
+
+        # Edge ids in order of first appearance, walking rows and their neighbors
+        self.edge_ids = array("l", [-1]) * len(self.indices)
+        self.edge_rows = (array("l"), array("l"))
+        for u in range(len(self.ids)):
+            for position in range(self.indptr[u], self.indptr[u + 1]):
+                if self.edge_ids[position] != -1:
+                    continue
+                v = self.indices[position]
+                edge_id = len(self.edge_rows[0])
+                self.edge_rows[0].append(u)
+                self.edge_rows[1].append(v)
+                self.edge_ids[position] = edge_id
+                self.edge_ids[self.position(v, u)] = edge_id
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.edge_rows[0])
+
+    def neighbor_rows(self, row: int) -> array:
+        return self.indices[self.indptr[row]:self.indptr[row + 1]]
+
+    def position(self, row: int, neighbor_row: int) -> int:
+        """Position of the (row, neighbor_row) pair in `indices`; raises KeyError for non-neighbors."""
+        start, end = self.indptr[row], self.indptr[row + 1]
+        try:
+            return self.indices.index(neighbor_row, start, end)
+        except ValueError:
+            raise KeyError((self.ids[row], self.ids[neighbor_row])) from None
+
+    def pair_position(self, agent_id1: Hashable, agent_id2: Hashable) -> int:
+        return self.position(self.rows[agent_id1], self.rows[agent_id2])
+
+    def pair_at(self, position: int) -> Tuple[Hashable, Hashable]:
+        """(agent, neighbor) ids of a position in `indices`."""
+        row = bisect.bisect_right(self.indptr, position) - 1
+        return self.ids[row], self.ids[self.indices[position]]
+
+    def edge_id(self, agent_id1: Hashable, agent_id2: Hashable) -> int:
+        return self.edge_ids[self.pair_position(agent_id1, agent_id2)]
+
+    def edge_key(self, edge_id: int) -> Tuple[Hashable, Hashable]:
+        id1, id2 = self.ids[self.edge_rows[0][edge_id]], self.ids[self.edge_rows[1][edge_id]]
+        return (id1, id2) if id1 <= id2 else (id2, id1)
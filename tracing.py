@@ -0,0 +1,238 @@
+# tracing.py
+
+import contextlib
+import contextvars
+import json
+import math
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# Tags of the current unit of work (graph, problem, pair, round, ...), inherited by every span opened in it
+_tags: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("trace_tags", default={})
+# Innermost open span, which counters such as retries are added to
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("trace_span", default=None)
+
+class Span:
+    """One timed phase or LLM call, with its tags and counters. Used as a context manager by `span`."""
+
+    __slots__ = ("phase", "tags", "counters", "start", "duration", "_tracer", "_token")
+
+    def __init__(self, phase: str, tags: Dict[str, Any], tracer: Optional["Tracer"] = None):
+        self.phase = phase
+        self.tags = tags
+        self.counters: Dict[str, float] = {}
+        self.start = 0.0
+        self.duration = 0.0
+        self._tracer = tracer
+        self._token = None
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        end = time.perf_counter()
+        _current.reset(self._token)
+        tracer = self._tracer
+        self.duration = end - self.start
+        self.start -= tracer._origin
+        self._tracer = self._token = None
+        tracer._finish(self)
+
+    def __getstate__(self):
+        # Spans are pickled back from process-pool workers once finished
+        return (self.phase, self.tags, self.counters, self.start, self.duration)
+
+    def __setstate__(self, state) -> None:
+        self.phase, self.tags, self.counters, self.start, self.duration = state
+        self._tracer = self._token = None
+
+    def add(self, name: str, value: float = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def as_dict(self) -> Dict[str, Any]:
+        record = {"phase": self.phase, "start_s": round(self.start, 6), "duration_s": round(self.duration, 6)}
+        record.update(self.tags)
+        record.update(self.counters)
+        return record
+
+class _NullSpan:
+    """Returned while tracing is off, so callers never need to check."""
+
+    def add(self, name: str, value: float = 1) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+class Tracer:
+    """
+    Collects spans in memory. Timings use the monotonic perf_counter clock, relative to the tracer's
+    creation; at most `max_spans` spans are kept and the rest are only counted as dropped.
+    """
+
+    def __init__(self, enabled: bool = True, max_spans: int = 10_000):
+        self.enabled = enabled
+        self.max_spans = max_spans
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _finish(self, span: Span) -> None:
+        # list.append is atomic, so the lock is only needed once the buffer is full
+        if len(self.spans) < self.max_spans:
+            self.spans.append(span)
+        else:
+            with self._lock:
+                self.dropped += 1
+
+    def extend(self, spans: Iterable[Span]) -> None:
+        """Adds spans finished by another tracer, such as a worker process's, within the same `max_spans`."""
+        spans = list(spans)
+        with self._lock:
+            room = max(0, self.max_spans - len(self.spans))
+            self.spans.extend(spans[:room])
+            self.dropped += max(0, len(spans) - room)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.spans = []
+            self.dropped = 0
+
+_tracer = Tracer()
+
+def configure_tracing(enabled: bool, max_spans: int = 10_000) -> Tracer:
+    """Replaces the process-wide tracer."""
+    global _tracer
+    _tracer = Tracer(enabled=enabled, max_spans=max_spans)
+    return _tracer
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+@contextlib.contextmanager
+def tagged(**tags) -> Iterator[None]:
+    """Adds tags to every span opened inside the block."""
+    token = _tags.set({**_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+def span(phase: str, **tags) -> Union[Span, _NullSpan]:
+    """
+    Times a `with` block as a span of the given phase, tagged with the current tags plus `tags`.
+    A plain class rather than a generator-based context manager, since it wraps every LLM call.
+    """
+    tracer = _tracer
+    if not tracer.enabled:
+        return _NULL_SPAN
+    return Span(phase, {**_tags.get(), **tags} if tags else _tags.get(), tracer)
+
+def add(name: str, value: float = 1) -> None:
+    """Adds to a counter of the innermost open span, e.g. retries of an LLM call."""
+    current = _current.get()
+    if current is not None:
+        current.add(name, value)
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def _group(spans: List[Span], by: Tuple[str, ...]) -> Dict[Tuple, List[Span]]:
+    groups: Dict[Tuple, List[Span]] = {}
+    for item in spans:
+        key = tuple(item.phase if name == "phase" else item.tags.get(name) for name in by)
+        groups.setdefault(key, []).append(item)
+    return groups
+
+def summarize(by: Tuple[str, ...] = ("phase",), tracer: Optional[Tracer] = None) -> Dict[Tuple, Dict[str, float]]:
+    """
+    Latency percentiles and counter totals of the collected spans, grouped by phase and/or tags.
+
+    Args:
+        by (Tuple[str, ...]): Grouping keys: 'phase' and any tag name, e.g. ('phase', 'capability')
+        tracer (Optional[Tracer]): Tracer to summarize; defaults to the process-wide one
+
+    Returns:
+        Dict[Tuple, Dict[str, float]]: Group key -> count, total, p50 and p95 seconds, and counter totals
+    """
+    tracer = tracer or _tracer
+    summary = {}
+    for key, items in sorted(_group(list(tracer.spans), by).items(), key=lambda item: str(item[0])):
+        durations = sorted(item.duration for item in items)
+        row = {
+            "count": len(items),
+            "total_s": round(sum(durations), 6),
+            "p50_s": round(_percentile(durations, 0.5), 6),
+            "p95_s": round(_percentile(durations, 0.95), 6),
+        }
+        for item in items:
+            for name, value in item.counters.items():
+                row[name] = row.get(name, 0) + value
+        summary[key] = row
+    return summary
+
+def report(tracer: Optional[Tracer] = None) -> str:
+    """Text report of p50/p95 latency per phase and per (LLM call, capability level)."""
+    tracer = tracer or _tracer
+    lines = [f"{'phase':<16}{'capability':>11}{'count':>9}{'total s':>11}{'p50 ms':>10}{'p95 ms':>10}"]
+    for by in (("phase",), ("phase", "capability")):
+        for key, row in summarize(by, tracer).items():
+            phase, capability = key[0], key[1] if len(key) > 1 else "all"
+            if len(key) > 1 and capability is None:
+                continue
+            lines.append(f"{phase:<16}{str(capability):>11}{row['count']:>9}{row['total_s']:>11.3f}"
+                         f"{row['p50_s'] * 1000:>10.2f}{row['p95_s'] * 1000:>10.2f}")
+    llm = summarize(("phase",), tracer).get(("llm",), {})
+    if llm:
+        lines.append(f"LLM calls: {llm['count']}, cache hits: {int(llm.get('cache_hits', 0))}, "
+                     f"retries: {int(llm.get('retries', 0))}, prompt tokens: {int(llm.get('prompt_tokens', 0))}, "
+                     f"completion tokens: {int(llm.get('completion_tokens', 0))}, "
+                     f"cached prompt tokens: {int(llm.get('cached_prompt_tokens', 0))}")
+    if tracer.dropped:
+        lines.append(f"Spans dropped beyond the buffer: {tracer.dropped}")
+    return "\n".join(lines)
+
+def export_jsonl(path: str, tracer: Optional[Tracer] = None) -> None:
+    """Writes every collected span as one JSON object per line."""
+    tracer = tracer or _tracer
+    with open(path, "w", encoding="utf-8") as f:
+        for item in list(tracer.spans):
+            f.write(json.dumps(item.as_dict(), ensure_ascii=False, default=str) + "\n")
+
+def _labels(**labels) -> str:
+    body = ",".join(f'{name}="{str(value)}"' for name, value in labels.items() if value is not None)
+    return "{" + body + "}"
+
+def export_prometheus(path: str, tracer: Optional[Tracer] = None) -> None:
+    """Writes the span summaries in the Prometheus text exposition format."""
+    tracer = tracer or _tracer
+    lines = ["# HELP mafea_phase_seconds Duration of simulation phases and LLM calls",
+             "# TYPE mafea_phase_seconds summary"]
+    counters: Dict[str, List[str]] = {}
+    for (phase, capability), row in summarize(("phase", "capability"), tracer).items():
+        for quantile, name in (("0.5", "p50_s"), ("0.95", "p95_s")):
+            lines.append(f"mafea_phase_seconds{_labels(phase=phase, capability=capability, quantile=quantile)} {row[name]}")
+        lines.append(f"mafea_phase_seconds_sum{_labels(phase=phase, capability=capability)} {row['total_s']}")
+        lines.append(f"mafea_phase_seconds_count{_labels(phase=phase, capability=capability)} {row['count']}")
+        for counter in ("cache_hits", "retries", "prompt_tokens", "completion_tokens", "cached_prompt_tokens"):
+            if counter in row:
+                counters.setdefault(counter, []).append(
+                    f"mafea_{counter}_total{_labels(phase=phase, capability=capability)} {row[counter]}")
+    for counter, samples in counters.items():
+        lines.append(f"# TYPE mafea_{counter}_total counter")
+        lines.extend(samples)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")